@@ -0,0 +1,346 @@
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import test2
+from check_index import LatestCheckIndex
+from eta import ETA_SCHEDULING, DurationHistory
+from graphql_status import DEFAULT_BATCH_SIZE, fetch_pr_statuses
+from policy import MERGE, WAIT, Decision
+from polling import DEFAULT_MAX_INTERVAL, DEFAULT_MIN_INTERVAL, PollScheduler
+from preflight import MISSING
+from state_store import DEFAULT_STATE_DB, StateStore
+from test2 import (
+    HEADERS,
+    POLICY,
+    REPO_NAME,
+    REPO_OWNER,
+    apply_check_history,
+    get_ci_snapshot,
+    merge_if_checks_passed,
+    preflight_targets,
+    recorded_decision,
+    resume_or_create_pull_request,
+)
+
+# How many GitHub API requests may be in flight at once
+DEFAULT_MAX_IN_FLIGHT = 8
+
+# How long (seconds) to wait for the required checks of one PR
+DEFAULT_WAIT_TIMEOUT = 1800
+
+# In GraphQL mode, PRs due for a poll within this many seconds share one request
+COALESCE_WINDOW = 2.0
+
+
+# Function to read `branch originalBranch` pairs from a file (one pair per line,
+# separated by whitespace or a comma; blank lines and # comments are ignored)
+def read_branch_pairs(path):
+    pairs = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            parts = line.replace(",", " ").split()
+            if len(parts) != 2:
+                raise ValueError(f"Expected 'branch originalBranch' in {path}, got: {line!r}")
+            pairs.append((parts[0], parts[1]))
+    return pairs
+
+
+# Function to parse a `branch:originalBranch` command line argument
+def parse_branch_pair(value):
+    head_branch, sep, base_branch = value.partition(":")
+    if not sep or not head_branch or not base_branch:
+        raise argparse.ArgumentTypeError(f"Expected 'branch:originalBranch', got: {value!r}")
+    return head_branch, base_branch
+
+
+# Runs the blocking create/check/merge functions from test2 in worker threads,
+# while a semaphore caps how many HTTP requests are in flight at once. The
+# pipeline's own state store (sqlite) reads and writes go to one separate
+# thread, so a commit or a lock wait never blocks the event loop and never
+# takes an HTTP request slot. resume_or_create_pull_request and
+# merge_if_checks_passed interleave HTTP calls with store updates, so they
+# still use the store from their HTTP worker threads (the store's lock
+# serialises them with the store thread).
+class AsyncPipeline:
+    def __init__(self, max_in_flight=DEFAULT_MAX_IN_FLIGHT, wait_timeout=DEFAULT_WAIT_TIMEOUT,
+                 min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL,
+                 expected_duration=None, graphql_batch_size=None, store=None):
+        self.max_in_flight = max_in_flight
+        self.wait_timeout = wait_timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.expected_duration = expected_duration
+        self.graphql_batch_size = graphql_batch_size
+        self.store = store
+        self.history = DurationHistory(store) if store and ETA_SCHEDULING else None
+        self._semaphore = None
+        self._batcher = None
+        self._store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-store")
+
+    async def _call(self, func, *args, **kwargs):
+        async with self._semaphore:
+            return await asyncio.to_thread(func, *args, **kwargs)
+
+    # Run a state store read or write (or anything built on one) on the store thread
+    async def _store(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._store_executor, func, *args)
+
+    # Scheduler for one commit; with check history it knows each check's expected duration and the ETA
+    def new_scheduler(self, commit_sha=None, base_branch=None, owner=REPO_OWNER, repo=REPO_NAME):
+        scheduler = PollScheduler(self.expected_duration, self.min_interval, self.max_interval,
+                                  deadline=self.wait_timeout)
+        if self.history and commit_sha:
+            apply_check_history(scheduler, self.history, commit_sha, base_branch, self.store, owner, repo)
+        return scheduler
+
+    # Seconds a new PR for `base_branch` is expected to wait for its checks (None without history)
+    def eta(self, owner, repo, base_branch):
+        if not self.history:
+            return None
+        return self.history.eta(owner, repo, base_branch, POLICY.for_branch(base_branch))
+
+    # Function to order (owner, repo, head, base) targets by ETA, shortest first and
+    # unknown ETAs last, so quick PRs merge first
+    def order_by_eta(self, targets):
+        if not self.history:
+            return list(targets)
+        etas = {}
+        for owner, repo, _, base_branch in targets:
+            if (owner, repo, base_branch) not in etas:
+                etas[(owner, repo, base_branch)] = self.eta(owner, repo, base_branch)
+
+        def key(target):
+            eta = etas[(target[0], target[1], target[3])]
+            return (eta is None, eta or 0)
+        return sorted(targets, key=key)
+
+    # Poll the check runs until the merge policy can decide (or we time out)
+    async def wait_for_checks(self, commit_sha, base_branch=None, owner=REPO_OWNER, repo=REPO_NAME):
+        if self.store:
+            recorded = await self._store(recorded_decision, commit_sha, base_branch, self.store, owner, repo)
+            if recorded:
+                return recorded
+
+        policy = POLICY.for_branch(base_branch)
+        scheduler = await self._store(self.new_scheduler, commit_sha, base_branch, owner, repo)
+        index = LatestCheckIndex()
+        # Sleeping here does not hold a request slot, so other PRs keep moving
+        await asyncio.sleep(scheduler.first_delay())
+        while True:
+            snapshot = await self._call(get_ci_snapshot, commit_sha, policy.fetch_names, owner, repo)
+            index.update(snapshot.checks)
+            if self.store:
+                await self._store(self.store.record_check_runs, owner, repo, commit_sha, snapshot.checks)
+            decision = policy.evaluate(index.latest(), snapshot.unstarted_suites())
+            if decision.state != WAIT:
+                break
+            delay = scheduler.next_delay(decision.runs)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+        if self.history:
+            await self._store(self.history.record, owner, repo, base_branch, commit_sha, list(decision.runs.values()))
+        return decision
+
+    # Drive a single head/base pair through create -> wait-for-checks -> merge
+    async def process(self, head_branch, base_branch, owner=REPO_OWNER, repo=REPO_NAME):
+        started = time.monotonic()
+        eta = await self._store(self.eta, owner, repo, base_branch)
+        result = {"repo": f"{owner}/{repo}", "branch": head_branch, "originalBranch": base_branch,
+                  "pr_number": None, "merged": False, "eta": round(eta, 1) if eta is not None else None}
+
+        # One span per PR; the create / poll / merge spans inside it point back to it
+        with metrics.span("pull_request", repo=result["repo"], branch=head_branch, base=base_branch) as pr_span:
+            pr_number, commit_sha = await self._call(resume_or_create_pull_request, head_branch, base_branch,
+                                                     self.store, owner, repo)
+            result["pr_number"] = pr_span.attrs["pr_number"] = pr_number
+
+            if pr_number and not commit_sha:
+                result["merged"] = True  # merged by an earlier run (see the state store)
+            elif pr_number and commit_sha:
+                with metrics.span("wait_for_checks", repo=result["repo"], sha=commit_sha):
+                    if self._batcher:
+                        decision = await self._batcher.wait(pr_number, commit_sha, base_branch, owner, repo)
+                    else:
+                        decision = await self.wait_for_checks(commit_sha, base_branch, owner, repo)
+                result["checks"] = decision.statuses
+                result["merged"] = await self._call(merge_if_checks_passed, pr_number, decision, self.store,
+                                                    owner, repo)
+                if result["merged"]:
+                    metrics.observe("gauto_time_to_merge_seconds", time.monotonic() - started)
+
+        result["elapsed"] = round(time.monotonic() - started, 2)
+        return result
+
+    # Create the request semaphore (and GraphQL batcher) on the running event loop
+    def start(self):
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        if self.graphql_batch_size:
+            self._batcher = BatchedCheckWaiter(self, self.graphql_batch_size)
+
+    # Run every pair concurrently, shortest ETA first; total time is roughly that of the slowest PR
+    async def run(self, pairs):
+        self.start()
+        targets = await self._store(self.order_by_eta,
+                                    [(REPO_OWNER, REPO_NAME, head_branch, base_branch) for head_branch, base_branch in pairs])
+        pairs = [(head, base) for _, _, head, base in targets]
+        tasks = [self.process(head_branch, base_branch) for head_branch, base_branch in pairs]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        for (head_branch, base_branch), result in zip(pairs, results):
+            if isinstance(result, Exception):
+                print(f"Error processing '{head_branch}' -> '{base_branch}': {result}")
+        return [r for r in results if not isinstance(r, Exception)]
+
+
+# GraphQL mode: PRs waiting for checks are polled together, one GraphQL request
+# per batch of PRs instead of one REST call per PR
+class BatchedCheckWaiter:
+    def __init__(self, pipeline, batch_size=DEFAULT_BATCH_SIZE):
+        self.pipeline = pipeline
+        self.batch_size = batch_size
+        # (owner, repo, pr_number) -> [future, scheduler, next poll time, compiled policy, check index, base, sha]
+        self._waiting = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    # Wait until the merge policy can decide for `pr_number`; returns the decision
+    async def wait(self, pr_number, commit_sha=None, base_branch=None, owner=REPO_OWNER, repo=REPO_NAME):
+        store = self.pipeline.store
+        if store and commit_sha:
+            recorded = await self.pipeline._store(recorded_decision, commit_sha, base_branch, store, owner, repo)
+            if recorded:
+                return recorded
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        scheduler = await self.pipeline._store(self.pipeline.new_scheduler, commit_sha, base_branch, owner, repo)
+        self._waiting[(owner, repo, pr_number)] = [future, scheduler, loop.time() + scheduler.first_delay(),
+                                                   POLICY.for_branch(base_branch), LatestCheckIndex(), base_branch,
+                                                   commit_sha]
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._waiting:
+            now = loop.time()
+            next_poll = min(entry[2] for entry in self._waiting.values())
+            if next_poll > now:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), next_poll - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # GraphQL batches are per repository
+            due = {}
+            for key, entry in self._waiting.items():
+                if entry[2] <= now + COALESCE_WINDOW:
+                    due.setdefault(key[:2], []).append(key[2])
+
+            for (owner, repo), numbers in due.items():
+                try:
+                    results = await self.pipeline._call(
+                        fetch_pr_statuses, owner, repo, numbers, HEADERS, self.batch_size)
+                except Exception as e:
+                    print(f"Error fetching PR statuses for {owner}/{repo}: {e}")
+                    results = {}
+
+                for number in numbers:
+                    await self._update((owner, repo, number), results.get(number), loop.time())
+
+    async def _update(self, key, status, now):
+        owner, repo, _ = key
+        future, scheduler, _, policy, index, base_branch, commit_sha = self._waiting[key]
+        if status:
+            index.update(status["check_runs"])
+        decision = policy.evaluate(index.latest())
+        if status and status["contexts_truncated"] and decision.state == MERGE:
+            # Some contexts could not be read: a failing check may be among them
+            decision = Decision(WAIT, "not every check context could be read", decision.runs)
+        store = self.pipeline.store
+        if status and store:
+            await self.pipeline._store(store.record_check_runs, owner, repo, status["head_sha"], status["check_runs"])
+
+        if decision.state == WAIT:
+            delay = scheduler.next_delay(decision.runs)
+            if delay is not None:
+                self._waiting[key][2] = now + delay
+                return
+
+        del self._waiting[key]
+        history = self.pipeline.history
+        if history and (status or commit_sha):
+            await self.pipeline._store(history.record, owner, repo, base_branch,
+                                       status["head_sha"] if status else commit_sha, list(decision.runs.values()))
+        if not future.done():
+            future.set_result(decision)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create, wait for checks and merge many PRs concurrently.")
+    parser.add_argument("pairs", nargs="*", type=parse_branch_pair, help="branch:originalBranch pairs")
+    parser.add_argument("--file", help="file with one 'branch originalBranch' pair per line")
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT)
+    parser.add_argument("--wait-timeout", type=float, default=DEFAULT_WAIT_TIMEOUT)
+    parser.add_argument("--min-interval", type=float, default=DEFAULT_MIN_INTERVAL)
+    parser.add_argument("--max-interval", type=float, default=DEFAULT_MAX_INTERVAL)
+    parser.add_argument("--expected-duration", type=float, help="typical check duration in seconds")
+    parser.add_argument("--graphql", action="store_true", help="poll check status for many PRs per GraphQL request")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="PRs per GraphQL request")
+    parser.add_argument("--state-db", default=DEFAULT_STATE_DB, help="SQLite file used to resume PRs across runs")
+    parser.add_argument("--no-preflight", action="store_true", help="skip the compare-API check for no-op branches")
+    args = parser.parse_args(argv)
+    metrics.setup_from_env()
+
+    pairs = list(args.pairs)
+    if args.file:
+        pairs.extend(read_branch_pairs(args.file))
+
+    # Fall back to the same environment variables test2.py uses
+    if not pairs and os.getenv('branch') and os.getenv('originalBranch'):
+        pairs.append((os.getenv('branch'), os.getenv('originalBranch')))
+
+    if not pairs:
+        parser.error("no branch pairs given (use arguments, --file, or the 'branch'/'originalBranch' env vars)")
+
+    store = StateStore(args.state_db)
+    started = time.monotonic()
+    preflight = []
+    if not args.no_preflight:
+        targets, preflight = preflight_targets([(REPO_OWNER, REPO_NAME, head, base) for head, base in pairs], store)
+        pairs = [(target[2], target[3]) for target in targets]
+    missing = sum(result["status"] == MISSING for result in preflight)
+
+    pipeline = AsyncPipeline(args.max_in_flight, args.wait_timeout, args.min_interval,
+                             args.max_interval, args.expected_duration,
+                             args.batch_size if args.graphql else None, store)
+    results = asyncio.run(pipeline.run(pairs)) if pairs else []
+
+    print("\nSummary:")
+    for result in results:
+        state = "merged" if result["merged"] else "not merged"
+        eta = f", ETA {result['eta']:.0f}s" if result.get("eta") is not None else ""
+        print(f"- {result['branch']} -> {result['originalBranch']}: PR #{result['pr_number']} {state} "
+              f"({result['elapsed']}s{eta})")
+    if preflight:
+        print(f"Pre-flight skipped {len(preflight) - len(pairs)} of {len(preflight)} branch pair(s)")
+    print(f"Processed {len(pairs)} branch pair(s) in {time.monotonic() - started:.1f}s")
+    print(f"HTTP client stats: {test2.client.stats()}")
+
+    return 0 if not missing and all(r["merged"] for r in results) and len(results) == len(pairs) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,347 @@
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import polling
+import test2
+from async_runner import DEFAULT_MAX_IN_FLIGHT, AsyncPipeline
+from cassette import RecordingAdapter, ReplayAdapter
+from eta import percentile
+import json_stream
+from check_records import CheckRun, parse_check_runs, stream_check_runs
+from fake_github import FakeGitHubConfig, start_fake_github
+from merge_queue import MergeQueue
+from state_store import StateStore
+
+
+# Function to push `prs` branches through the merge pipeline against a fake
+# GitHub server and report throughput, time-to-merge and API calls per merge.
+# With `record` the HTTP traffic and the outcome are saved to a cassette; with
+# `replay` a saved cassette answers instead of the fake server (see cassette.py)
+# and the outcome is checked against the recorded one, an offline regression
+# test of parsing, gating and scheduling changes.
+def run_benchmark(prs=20, config=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT, min_interval=0.5,
+                  max_interval=5.0, expected_duration=None, wait_timeout=120, verbose=False, merge_queue_batch=None,
+                  record=None, replay=None, replay_speed=0):
+    server = None
+    adapter = None
+    run_id = int(time.time())  # names the merge queue's batch branches
+    if replay:
+        adapter = ReplayAdapter(replay, replay_speed)
+        base_url = adapter.meta["base_url"]
+        prs = adapter.meta.get("prs", prs)
+        merge_queue_batch = adapter.meta.get("merge_queue_batch", merge_queue_batch)
+        run_id = adapter.meta.get("run_id", run_id)
+    else:
+        server = start_fake_github(config or FakeGitHubConfig())
+        base_url = server.base_url
+        if record:
+            adapter = RecordingAdapter(record, meta={"base_url": base_url, "prs": prs,
+                                                     "merge_queue_batch": merge_queue_batch,
+                                                     "run_id": run_id})
+    previous_adapter = test2.client.mount(adapter) if adapter else None
+
+    original_url = test2.GITHUB_API_URL
+    test2.GITHUB_API_URL = base_url
+    original_speed = polling.POLL_SPEED
+    if replay:
+        polling.POLL_SPEED = replay_speed
+    client_before = test2.client.stats()
+
+    store = StateStore(":memory:")
+    pipeline = AsyncPipeline(max_in_flight, wait_timeout, min_interval, max_interval, expected_duration, store=store)
+    pairs = [(f"bench-{i}", "main") for i in range(prs)]
+
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    started = time.monotonic()
+    try:
+        with output:
+            if merge_queue_batch:
+                queue = MergeQueue(merge_queue_batch, wait_timeout, store, min_interval, max_interval)
+                queue.run_id = run_id
+                for head_branch, base_branch in pairs:
+                    pr_number, commit_sha = test2.resume_or_create_pull_request(head_branch, base_branch, store)
+                    if pr_number:
+                        queue.enqueue(pr_number, head_branch, base_branch, commit_sha)
+                results = queue.run()
+            else:
+                results = asyncio.run(pipeline.run(pairs))
+        if record and not replay:
+            adapter.write_meta(expected={"merged": sum(r["merged"] for r in results), "api_calls": adapter.recorded})
+    finally:
+        elapsed = time.monotonic() - started
+        test2.GITHUB_API_URL = original_url
+        polling.POLL_SPEED = original_speed
+        client_after = test2.client.stats()
+        if adapter:
+            test2.client.mount(previous_adapter)
+            adapter.close()
+        if server:
+            server.shutdown()
+            server.server_close()
+
+    merged = [r for r in results if r["merged"]]
+    times = [r["elapsed"] for r in merged]
+    server_stats = server.state.stats() if server else dict(adapter.stats(), ci_runs=None)
+
+    # Differences from the recorded run: a PR that no longer merges, more API
+    # calls than the recording needed, or requests the recording never saw
+    regressions = None
+    if replay and "expected" in adapter.meta:
+        expected = adapter.meta["expected"]
+        regressions = []
+        if len(merged) != expected["merged"]:
+            regressions.append(f"{len(merged)} PR(s) merged, {expected['merged']} in the recording")
+        if server_stats["total_calls"] > expected["api_calls"]:
+            regressions.append(f"{server_stats['total_calls']} API calls, {expected['api_calls']} in the recording")
+        if server_stats["misses"]:
+            regressions.append(f"{server_stats['misses']} request(s) not in the recording")
+
+    return {
+        "prs": prs,
+        "merged": len(merged),
+        "wall_time": round(elapsed, 2),
+        "prs_per_min": round(len(merged) / elapsed * 60, 1) if elapsed else None,
+        "time_to_merge_p50": round(percentile(times, 50), 2) if times else None,
+        "time_to_merge_p99": round(percentile(times, 99), 2) if times else None,
+        "api_calls": server_stats["total_calls"],
+        "api_calls_per_merged_pr": round(server_stats["total_calls"] / len(merged), 1) if merged else None,
+        "ci_runs": server_stats["ci_runs"],
+        "calls_by_endpoint": server_stats["calls"],
+        "cache_hits": client_after["cache_hits"] - client_before["cache_hits"],
+        "connections_opened": client_after["connections_opened"] - client_before["connections_opened"],
+        "regressions": regressions,
+    }
+
+
+def print_report(report):
+    print(f"PRs merged:              {report['merged']}/{report['prs']}")
+    print(f"Wall time:               {report['wall_time']}s")
+    print(f"Throughput:              {report['prs_per_min']} PRs/min")
+    print(f"Time to merge p50/p99:   {report['time_to_merge_p50']}s / {report['time_to_merge_p99']}s")
+    print(f"API calls:               {report['api_calls']} ({report['api_calls_per_merged_pr']} per merged PR)")
+    print(f"CI runs:                 {report['ci_runs']}")
+    print(f"Conditional cache hits:  {report['cache_hits']}")
+    print(f"Connections opened:      {report['connections_opened']}")
+    print("Calls by endpoint:")
+    for endpoint, count in sorted(report["calls_by_endpoint"].items()):
+        print(f"  {endpoint}: {count}")
+    if report["regressions"] is not None:
+        print(f"Replay check:            {'; '.join(report['regressions']) or 'matches the recording'}")
+
+
+# Function to build a `/check-runs` response body shaped like GitHub's (app,
+# output and pull_requests included), for the memory benchmark
+def sample_check_runs_page(count, sha="0" * 40, names=8, output_size=0):
+    runs = []
+    for i in range(count):
+        runs.append({
+            "id": 1000000 + i,
+            "head_sha": sha,
+            "node_id": f"CR_kwDOABCD{i:08d}",
+            "external_id": f"ext-{i}",
+            "url": f"https://api.github.com/repos/krkredde/gauto/check-runs/{1000000 + i}",
+            "html_url": f"https://github.com/krkredde/gauto/runs/{1000000 + i}",
+            "details_url": f"https://github.com/krkredde/gauto/actions/runs/{i}/job/{1000000 + i}",
+            "status": "completed",
+            "conclusion": "success" if i % 5 else "failure",
+            "started_at": "2024-01-01T00:00:00Z",
+            "completed_at": "2024-01-01T00:05:00Z",
+            "output": {"title": f"check-{i % names}", "summary": "Lint report" if output_size else None,
+                       "text": "x" * output_size or None, "annotations_count": 0,
+                       "annotations_url": f"https://api.github.com/repos/krkredde/gauto/check-runs/{1000000 + i}/annotations"},
+            "name": f"check-{i % names}",
+            "check_suite": {"id": 5000 + i // names},
+            "app": {"id": 15368, "slug": "github-actions", "node_id": "MDM6QXBwMTUzNjg", "name": "GitHub Actions",
+                    "description": "Automate your workflow from idea to production",
+                    "external_url": "https://help.github.com/en/actions", "html_url": "https://github.com/apps/github-actions",
+                    "owner": {"login": "github", "id": 9919, "type": "Organization", "site_admin": False},
+                    "created_at": "2018-07-30T09:30:17Z", "updated_at": "2019-12-10T19:04:12Z",
+                    "permissions": {"actions": "write", "checks": "write", "contents": "write", "metadata": "read"},
+                    "events": ["check_run", "check_suite", "pull_request", "push"]},
+            "pull_requests": [{"url": "https://api.github.com/repos/krkredde/gauto/pulls/1", "id": 1, "number": 1,
+                               "head": {"ref": "auto_branch", "sha": sha}, "base": {"ref": "main", "sha": "1" * 40}}],
+        })
+    return json.dumps({"total_count": count, "check_runs": runs})
+
+
+# Function to measure the memory held by `runs` check runs kept as raw JSON
+# dicts versus compact CheckRun records (both decoded from the same bodies)
+def memory_benchmark(runs=10000, per_page=100):
+    pages = [sample_check_runs_page(min(per_page, runs - start)) for start in range(0, runs, per_page)]
+    report = {"check_runs": runs}
+    for label, parse in (("raw_dicts", lambda body: json.loads(body)["check_runs"]),
+                         ("records", lambda body: parse_check_runs(json.loads(body))[1])):
+        gc.collect()
+        tracemalloc.start()
+        started = time.perf_counter()
+        held = [parse(body) for body in pages]
+        elapsed = time.perf_counter() - started
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report[label] = {"bytes": size, "bytes_per_run": round(size / runs), "parse_seconds": round(elapsed, 3)}
+        del held
+    report["reduction"] = round(report["raw_dicts"]["bytes"] / max(report["records"]["bytes"], 1), 1)
+    return report
+
+
+# Function to serve one fixed body over HTTP on a local port (for the parse benchmark)
+def _serve_body(body):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _max_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+# Function run in a child process: fetch `pages` check-run pages from `url` on
+# `threads` threads, parsing them with response.json() ("json") or incrementally
+# ("stream"), and report how much the peak RSS grew and how long it took
+def _parse_worker(mode, url, pages, threads):
+    from github_client import GitHubClient
+    client = GitHubClient(pool_size=threads, cache_size=0)
+
+    def fetch(_):
+        if mode == "stream":
+            return len(client.get(url, parse=stream_check_runs).parsed[1])
+        return len(parse_check_runs(client.get(url).json())[1])
+
+    baseline = _max_rss_mb()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        runs = sum(pool.map(fetch, range(pages)))
+    return {"runs": runs, "seconds": round(time.perf_counter() - started, 3),
+            "peak_rss_growth_mb": round(_max_rss_mb() - baseline, 1)}
+
+
+# Function to compare response.json() with the streaming parser on GitHub-shaped
+# `/check-runs` pages: parse time on an in-memory body, and peak RSS / wall time
+# of fetching `pages` pages over HTTP on `threads` threads (one process per mode)
+def parse_benchmark(pages=50, per_page=100, output_size=20000, threads=8):
+    body = sample_check_runs_page(per_page, output_size=output_size).encode()
+    chunks = [body[i:i + 65536] for i in range(0, len(body), 65536)]
+    report = {"body_bytes": len(body), "pages": pages, "threads": threads}
+
+    parsers = {"json": lambda: parse_check_runs(json.loads(body)),
+               "stream": lambda: json_stream.parse_object(chunks, "check_runs", CheckRun.from_api)}
+    server = _serve_body(body)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/check-runs"
+        for mode, parse in parsers.items():
+            started = time.perf_counter()
+            for _ in range(10):
+                parse()
+            entry = {"parse_ms": round((time.perf_counter() - started) * 100, 2)}
+            worker = subprocess.run([sys.executable, __file__, "--parse-worker", mode, url, str(pages), str(threads)],
+                                    capture_output=True, text=True, check=True)
+            entry.update(json.loads(worker.stdout.strip().splitlines()[-1]))
+            report[mode] = entry
+    finally:
+        server.shutdown()
+        server.server_close()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark create -> wait-for-checks -> merge against a fake GitHub API.")
+    parser.add_argument("--prs", type=int, default=20)
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated API latency (s)")
+    parser.add_argument("--check-duration", type=float, nargs=2, default=(2.0, 5.0), metavar=("MIN", "MAX"))
+    parser.add_argument("--extra-checks", type=int, default=0, help="extra non-required checks (exercises pagination)")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, help="simulated requests per hour")
+    parser.add_argument("--min-interval", type=float, default=0.5)
+    parser.add_argument("--max-interval", type=float, default=5.0)
+    parser.add_argument("--expected-duration", type=float)
+    parser.add_argument("--merge-queue", type=int, metavar="BATCH", help="land PRs through the merge queue in batches")
+    parser.add_argument("--record", metavar="CASSETTE", help="save the HTTP traffic to a cassette file")
+    parser.add_argument("--replay", metavar="CASSETTE", help="replay a cassette instead of running the fake server "
+                                                             "and check the outcome against the recording")
+    parser.add_argument("--replay-speed", type=float, default=0, help="1 = recorded latency and poll intervals, 0 = no delay")
+    parser.add_argument("--memory", type=int, metavar="RUNS", help="only compare the memory of RUNS check runs "
+                                                                   "held as raw dicts vs CheckRun records")
+    parser.add_argument("--parse", type=int, metavar="PAGES", help="only compare response.json() with streaming "
+                                                                   "parsing of PAGES check-run pages")
+    parser.add_argument("--output-size", type=int, default=20000, help="output text per check run (with --parse)")
+    parser.add_argument("--parse-threads", type=int, default=8, help="concurrent fetches (with --parse)")
+    parser.add_argument("--parse-worker", nargs=4, help=argparse.SUPPRESS)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own output")
+    args = parser.parse_args(argv)
+
+    if args.parse_worker:
+        mode, url, pages, threads = args.parse_worker
+        print(json.dumps(_parse_worker(mode, url, int(pages), int(threads))))
+        return 0
+
+    if args.parse:
+        report = parse_benchmark(args.parse, output_size=args.output_size, threads=args.parse_threads)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print(f"{report['pages']} page(s) of {report['body_bytes'] / 1e6:.2f} MB on {report['threads']} thread(s)")
+            for mode in ("json", "stream"):
+                entry = report[mode]
+                print(f"{mode + ':':<8} parse {entry['parse_ms']:8.2f} ms/page, fetch+parse {entry['seconds']}s, "
+                      f"peak RSS +{entry['peak_rss_growth_mb']} MB")
+        return 0
+
+    if args.memory:
+        report = memory_benchmark(args.memory)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            for label in ("raw_dicts", "records"):
+                entry = report[label]
+                print(f"{label + ':':<11} {entry['bytes'] / 1e6:8.2f} MB  ({entry['bytes_per_run']} bytes/run, "
+                      f"parsed in {entry['parse_seconds']}s)")
+            print(f"Records use {report['reduction']}x less memory for {report['check_runs']} check runs")
+        return 0
+
+    config = FakeGitHubConfig(latency=args.latency, check_duration=tuple(args.check_duration),
+                              extra_checks=args.extra_checks, failure_rate=args.failure_rate,
+                              error_rate=args.error_rate, rate_limit=args.rate_limit)
+    report = run_benchmark(args.prs, config, args.max_in_flight, args.min_interval, args.max_interval,
+                           args.expected_duration, verbose=args.verbose, merge_queue_batch=args.merge_queue,
+                           record=args.record, replay=args.replay, replay_speed=args.replay_speed)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 1 if report["regressions"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
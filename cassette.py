@@ -0,0 +1,246 @@
+import argparse
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Record every request/response of the shared client to this file (JSONL, .gz to compress)
+CASSETTE_RECORD = os.getenv("GAUTO_CASSETTE_RECORD")
+
+# Serve responses from this cassette instead of the network
+CASSETTE_REPLAY = os.getenv("GAUTO_CASSETTE_REPLAY")
+
+# Replay speed: 1 = recorded latency, 10 = ten times faster, 0 = no delay at all
+# (poll sleeps are scaled the same way, see polling.POLL_SPEED)
+REPLAY_SPEED = float(os.getenv("GAUTO_REPLAY_SPEED", "1"))
+
+# Request headers that are never written to a cassette
+REDACTED_HEADERS = {"authorization", "cookie", "proxy-authorization"}
+
+# A cassette is a JSONL file: an optional {"type": "meta", ...} line followed by
+# one {"type": "http", ...} line per exchange, in the order they completed
+# (further meta lines, such as the outcome of the recorded run, may follow):
+#
+# {"type": "http", "t": 0.42, "elapsed": 0.081, "method": "GET", "url": "...",
+#  "request_headers": {...}, "request_body": null, "status": 200,
+#  "headers": {...}, "body": "..."}
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+# Function to normalise a URL for matching (query parameters sorted)
+def _normalize_url(url):
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, query, ""))
+
+
+def _body_text(body):
+    if body is None:
+        return None
+    if isinstance(body, bytes):
+        return body.decode("utf-8", errors="replace")
+    return str(body)
+
+
+# Function to build the replay lookup key: method + URL, plus a body hash for
+# requests with a body (so two different POSTs to /pulls are told apart)
+def interaction_key(method, url, body=None):
+    digest = hashlib.sha1(body.encode()).hexdigest()[:16] if body else None
+    return (method.upper(), _normalize_url(url), digest)
+
+
+# Function to read the interactions (and the meta line, if any) of a cassette
+def load_cassette(path):
+    meta = {}
+    interactions = []
+    with _open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("type") == "meta":
+                meta.update(record)
+            else:
+                interactions.append(record)
+    return meta, interactions
+
+
+# Transport adapter that sends requests normally and appends each exchange
+# (headers, body, status and latency) to a cassette file
+class RecordingAdapter(HTTPAdapter):
+    def __init__(self, path, meta=None, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._file = _open(path, "w")
+        self.recorded = 0
+        self._write(dict(meta or {}, type="meta", recorded_at=round(time.time(), 3)))
+
+    def _write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._file.flush()
+
+    # Function to append a meta line (merged into the cassette's meta when it is loaded)
+    def write_meta(self, **fields):
+        self._write(dict(fields, type="meta"))
+
+    def send(self, request, **kwargs):
+        started = time.monotonic()
+        response = super().send(request, **kwargs)
+        response.content  # read the body so it can be recorded (requests keeps it for the caller)
+        self._write({
+            "type": "http",
+            "t": round(started - self._started, 4),
+            "elapsed": round(time.monotonic() - started, 4),
+            "method": request.method,
+            "url": request.url,
+            "request_headers": {k: v for k, v in request.headers.items() if k.lower() not in REDACTED_HEADERS},
+            "request_body": _body_text(request.body),
+            "status": response.status_code,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() != "set-cookie"},
+            "body": response.text,
+        })
+        with self._lock:
+            self.recorded += 1
+        return response
+
+    def close(self):
+        super().close()
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+# Transport adapter that answers from a cassette without touching the network.
+# Repeated requests for the same key get the recorded responses in order; once
+# those run out the last one is served again (a steady state for polling).
+class ReplayAdapter(HTTPAdapter):
+    def __init__(self, path, speed=REPLAY_SPEED, strict=False, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.speed = speed
+        self.strict = strict
+        self.meta, interactions = load_cassette(path)
+        self._queues = {}
+        self._last = {}
+        self._last_full = {}  # key -> last non-304 interaction, for requests without a cached copy
+        for interaction in interactions:
+            key = interaction_key(interaction["method"], interaction["url"], interaction.get("request_body"))
+            self._queues.setdefault(key, []).append(interaction)
+        self._lock = threading.Lock()
+        self.served = 0
+        self.misses = 0
+        self.calls = {}
+
+    def _next(self, key):
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue:
+                interaction = queue.pop(0)
+                self._last[key] = interaction
+            else:
+                interaction = self._last.get(key)
+            if interaction is not None and interaction["status"] != 304:
+                self._last_full[key] = interaction
+            return interaction
+
+    def send(self, request, **kwargs):
+        key = interaction_key(request.method, request.url, _body_text(request.body))
+        interaction = self._next(key)
+        if interaction is not None and interaction["status"] == 304 and "If-None-Match" not in request.headers:
+            interaction = self._last_full.get(key, interaction)  # the caller has no cached copy to reuse
+
+        with self._lock:
+            endpoint = f"{request.method} {urlsplit(request.url).path}"
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            if interaction is None:
+                self.misses += 1
+            else:
+                self.served += 1
+
+        if interaction is None:
+            if self.strict:
+                raise requests.ConnectionError(f"No recorded response for {request.method} {request.url}")
+            return self._build(request, {"status": 404, "headers": {"Content-Type": "application/json"},
+                                         "body": json.dumps({"message": "Not recorded in cassette"}),
+                                         "elapsed": 0})
+
+        if self.speed > 0 and interaction.get("elapsed"):
+            time.sleep(interaction["elapsed"] / self.speed)
+        return self._build(request, interaction)
+
+    def _build(self, request, interaction):
+        response = requests.Response()
+        response.status_code = interaction["status"]
+        response.headers = CaseInsensitiveDict(interaction.get("headers") or {})
+        response._content = (interaction.get("body") or "").encode("utf-8")
+        response._content_consumed = True
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.reason = "Replayed"
+        response.elapsed = datetime.timedelta(seconds=interaction.get("elapsed") or 0)
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {"served": self.served, "misses": self.misses, "calls": dict(self.calls),
+                    "total_calls": self.served + self.misses}
+
+
+# Function to build the transport selected by GAUTO_CASSETTE_RECORD / GAUTO_CASSETTE_REPLAY (None if neither)
+def adapter_from_env(**adapter_kwargs):
+    if CASSETTE_REPLAY:
+        return ReplayAdapter(CASSETTE_REPLAY, REPLAY_SPEED, **adapter_kwargs)
+    if CASSETTE_RECORD:
+        return RecordingAdapter(CASSETTE_RECORD, **adapter_kwargs)
+    return None
+
+
+# Function to summarise a cassette: exchanges per endpoint, status codes and latency
+def summarize(path):
+    meta, interactions = load_cassette(path)
+    endpoints = {}
+    statuses = {}
+    for interaction in interactions:
+        endpoint = f"{interaction['method']} {urlsplit(interaction['url']).path}"
+        entry = endpoints.setdefault(endpoint, {"count": 0, "elapsed": 0.0})
+        entry["count"] += 1
+        entry["elapsed"] += interaction.get("elapsed") or 0
+        statuses[interaction["status"]] = statuses.get(interaction["status"], 0) + 1
+    duration = max((i["t"] + (i.get("elapsed") or 0) for i in interactions), default=0)
+    return {"meta": meta, "interactions": len(interactions), "duration": round(duration, 2),
+            "statuses": statuses, "endpoints": endpoints}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise a recorded HTTP cassette.")
+    parser.add_argument("cassette")
+    args = parser.parse_args(argv)
+
+    summary = summarize(args.cassette)
+    print(f"{summary['interactions']} exchange(s) over {summary['duration']}s, status codes: {summary['statuses']}")
+    for endpoint, entry in sorted(summary["endpoints"].items(), key=lambda item: -item[1]["count"]):
+        average = entry["elapsed"] / entry["count"] * 1000
+        print(f"  {entry['count']:5d}  {average:7.1f} ms  {endpoint}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
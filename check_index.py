@@ -0,0 +1,61 @@
+# Index of the newest attempt of every check run.
+#
+# A re-run creates a new check run with the same name (and a higher id) in the
+# same check suite, and the old attempt is still returned by the API. Keeping
+# the first run seen per name can therefore keep a stale failure. This index
+# keeps only the newest attempt per (check suite id, name) and, per name, the
+# newest attempt across suites, so the merge gate can look up the current
+# conclusion of a check in O(1).
+
+
+# Function to order two attempts of the same check: higher id wins, then later start
+def _attempt_key(check):
+    return (check.get("id") or 0, check.get("started_at") or "")
+
+
+class LatestCheckIndex:
+    __slots__ = ("_by_suite", "_by_name")
+
+    def __init__(self, check_runs=()):
+        self._by_suite = {}  # (suite id, name) -> newest run in that suite
+        self._by_name = {}   # name -> newest run across suites
+        self.update(check_runs)
+
+    # Add a page / poll of check runs; returns how many entries changed
+    def update(self, check_runs):
+        changed = 0
+        for check in check_runs:
+            name = check["name"]
+            suite_id = (check.get("check_suite") or {}).get("id")
+            key = (suite_id, name)
+
+            current = self._by_suite.get(key)
+            if current is not None and _attempt_key(check) < _attempt_key(current):
+                continue
+            if current != check:
+                changed += 1
+            self._by_suite[key] = check
+
+            newest = self._by_name.get(name)
+            if newest is None or _attempt_key(check) >= _attempt_key(newest):
+                self._by_name[name] = check
+        return changed
+
+    # Newest attempt of check `name`, or None if it has not been seen
+    def current(self, name):
+        return self._by_name.get(name)
+
+    # Current conclusion of check `name` (None while running or unseen)
+    def conclusion(self, name):
+        check = self._by_name.get(name)
+        return check.get("conclusion") if check else None
+
+    # The newest attempt of every check name, ready for the merge policy
+    def latest(self):
+        return list(self._by_name.values())
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def __len__(self):
+        return len(self._by_name)
@@ -0,0 +1,168 @@
+import os
+import sys
+from collections.abc import Mapping
+from enum import Enum
+
+import json_stream
+
+# Compact records for check runs and pull request statuses.
+#
+# A check run from the REST API is a dict of ~20 keys with nested app, output
+# and pull_requests objects, but the merge gate only reads name, status,
+# conclusion, timestamps and the suite id. CheckRun keeps just those in
+# __slots__, with the name interned and the status / conclusion as shared enum
+# members, so a long-running process holding thousands of runs stays small.
+# CheckRun is a read-only Mapping with the same keys as the dicts it replaces,
+# so code written against `check["name"]` / `check.get("conclusion")` keeps working.
+
+# Bytes read per chunk when a check-runs body is parsed incrementally
+STREAM_CHUNK_SIZE = int(os.getenv("GAUTO_STREAM_CHUNK_SIZE", "65536"))
+
+
+class CheckStatus(str, Enum):
+    QUEUED = "queued"
+    IN_PROGRESS = "in_progress"
+    COMPLETED = "completed"
+    WAITING = "waiting"
+    REQUESTED = "requested"
+    PENDING = "pending"
+
+    def __str__(self):
+        return self.value
+
+    __format__ = str.__format__
+
+
+class CheckConclusion(str, Enum):
+    SUCCESS = "success"
+    FAILURE = "failure"
+    NEUTRAL = "neutral"
+    CANCELLED = "cancelled"
+    SKIPPED = "skipped"
+    TIMED_OUT = "timed_out"
+    ACTION_REQUIRED = "action_required"
+    STALE = "stale"
+    STARTUP_FAILURE = "startup_failure"
+
+    def __str__(self):
+        return self.value
+
+    __format__ = str.__format__
+
+
+_STATUSES = {member.value: member for member in CheckStatus}
+_CONCLUSIONS = {member.value: member for member in CheckConclusion}
+
+
+# Function to map a status string to its enum member (unknown values are kept as interned strings)
+def parse_status(value):
+    if value is None:
+        return None
+    return _STATUSES.get(value) or sys.intern(value)
+
+
+def parse_conclusion(value):
+    if value is None:
+        return None
+    return _CONCLUSIONS.get(value) or sys.intern(value)
+
+
+class CheckRun(Mapping):
+    __slots__ = ("id", "name", "status", "conclusion", "started_at", "completed_at", "suite_id", "source")
+
+    # Keys exposed through the Mapping interface (check_suite is rebuilt from suite_id)
+    KEYS = ("id", "name", "status", "conclusion", "started_at", "completed_at", "check_suite", "source")
+
+    def __init__(self, name, status=None, conclusion=None, id=None, started_at=None, completed_at=None,
+                 suite_id=None, source=None):
+        self.id = id
+        self.name = sys.intern(name) if name else name
+        self.status = parse_status(status)
+        self.conclusion = parse_conclusion(conclusion)
+        self.started_at = started_at
+        self.completed_at = completed_at
+        self.suite_id = suite_id
+        self.source = source
+
+    # Function to build a record from a REST check run dict (or any mapping with the same keys)
+    @classmethod
+    def from_api(cls, check):
+        suite = check.get("check_suite")
+        return cls(check["name"], check.get("status"), check.get("conclusion"), check.get("id"),
+                   check.get("started_at"), check.get("completed_at"), suite.get("id") if suite else None,
+                   check.get("source"))
+
+    def __getitem__(self, key):
+        if key == "check_suite":
+            return {"id": self.suite_id} if self.suite_id is not None else None
+        if key in CheckRun.__slots__ and key != "suite_id":
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(CheckRun.KEYS)
+
+    def __len__(self):
+        return len(CheckRun.KEYS)
+
+    def _values(self):
+        return (self.id, self.name, self.status, self.conclusion, self.started_at, self.completed_at,
+                self.suite_id, self.source)
+
+    def __eq__(self, other):
+        if isinstance(other, CheckRun):
+            return self._values() == other._values()
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"CheckRun({self.name!r}, {self.status!r}, {self.conclusion!r}, id={self.id!r})"
+
+
+# Function to pull just the check runs out of a decoded `/check-runs` page
+# (returns (total_count, [CheckRun, ...]); every other field is dropped)
+def parse_check_runs(data):
+    from_api = CheckRun.from_api
+    return data.get("total_count", 0), [from_api(check) for check in data.get("check_runs", [])]
+
+
+# Same as parse_check_runs, but reads a streamed `/check-runs` response chunk by
+# chunk, so each run's output / app / pull_requests fields are dropped as soon
+# as it is decoded and the whole body is never held in memory
+def stream_check_runs(response, chunk_size=STREAM_CHUNK_SIZE):
+    data = json_stream.parse_object(response.iter_content(chunk_size), "check_runs", CheckRun.from_api)
+    return data.get("total_count", 0), data.get("check_runs") or []
+
+
+# Status of one pull request as read by the batched GraphQL query
+class PullRequestStatus(Mapping):
+    __slots__ = ("number", "state", "mergeable", "head_sha", "rollup_state", "check_runs", "contexts_truncated")
+
+    def __init__(self, number, state=None, mergeable=None, head_sha=None, rollup_state=None, check_runs=(),
+                 contexts_truncated=False):
+        self.number = number
+        self.state = sys.intern(state) if state else state
+        self.mergeable = sys.intern(mergeable) if mergeable else mergeable
+        self.head_sha = head_sha
+        self.rollup_state = sys.intern(rollup_state) if rollup_state else rollup_state
+        self.check_runs = list(check_runs)
+        self.contexts_truncated = contexts_truncated
+
+    def __getitem__(self, key):
+        if key in PullRequestStatus.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(PullRequestStatus.__slots__)
+
+    def __len__(self):
+        return len(PullRequestStatus.__slots__)
+
+    def __repr__(self):
+        return (f"PullRequestStatus(#{self.number}, {self.state!r}, {self.rollup_state!r}, "
+                f"{len(self.check_runs)} check runs)")
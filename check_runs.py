@@ -0,0 +1,46 @@
+import os
+
+from check_records import parse_check_runs, stream_check_runs
+from github_client import get_client
+
+# GitHub allows up to 100 items per page (the default is 30)
+MAX_PER_PAGE = 100
+
+# Parse check-run pages incrementally as they arrive (GAUTO_STREAM_CHECK_RUNS=0 reads whole bodies)
+STREAM_CHECK_RUNS = os.getenv("GAUTO_STREAM_CHECK_RUNS", "1") != "0"
+
+
+# Generator that yields every check run behind a `/commits/{sha}/check-runs` URL
+# as a compact CheckRun record, one page at a time, following the `Link: rel="next"` header.
+# If required_names is given, it stops fetching pages as soon as a run has been
+# seen for every required name.
+def iter_check_runs(url, headers, required_names=None, per_page=MAX_PER_PAGE, client=None, stream=STREAM_CHECK_RUNS):
+    client = client or get_client()
+    pending = set(required_names) if required_names else None
+    params = {"per_page": per_page}
+    seen = 0
+
+    while url:
+        if stream:
+            response = client.get(url, headers=headers, params=params, parse=stream_check_runs)
+        else:
+            response = client.get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            print(f"Error fetching check runs: {response.status_code}, {response.text}")
+            return
+
+        total_count, check_runs = response.parsed if stream else parse_check_runs(response.json())
+        for check in check_runs:
+            seen += 1
+            yield check
+            if pending is not None:
+                pending.discard(check["name"])
+
+        if pending is not None and not pending:
+            return
+        if total_count and seen >= total_count:
+            return
+
+        # The next link already carries per_page and the page number
+        url = response.links.get("next", {}).get("url")
+        params = None
@@ -0,0 +1,114 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from check_index import LatestCheckIndex
+from check_records import CheckRun
+from check_runs import MAX_PER_PAGE, iter_check_runs
+from github_client import get_client
+from graphql_status import STATUS_CONTEXT_STATES
+from polling import parse_github_time
+
+# Threads used to fetch the three CI views of a commit in parallel (shared by all callers)
+SNAPSHOT_WORKERS = int(os.getenv("GAUTO_SNAPSHOT_WORKERS", "8"))
+
+# How long (seconds) a queued check suite without check runs holds the merge
+# gate. GitHub creates a suite for every app with checks permission, and apps
+# that never run on the commit leave theirs queued forever.
+SUITE_START_GRACE = float(os.getenv("GAUTO_SUITE_START_GRACE", "300"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SNAPSHOT_WORKERS, thread_name_prefix="ci-snapshot")
+        return _executor
+
+
+# Function to read every check run of a commit (errors are printed by iter_check_runs)
+def fetch_check_runs(commit_url, headers, required_names=None, client=None):
+    return list(iter_check_runs(f"{commit_url}/check-runs", headers, required_names, client=client))
+
+
+# Function to read the check suites of a commit (None if the request failed)
+def fetch_check_suites(commit_url, headers, client=None):
+    client = client or get_client()
+    response = client.get(f"{commit_url}/check-suites", headers=headers, params={"per_page": MAX_PER_PAGE})
+    if response.status_code != 200:
+        print(f"Error fetching check suites: {response.status_code}, {response.text}")
+        return None
+    return response.json().get("check_suites", [])
+
+
+# Function to read the combined (legacy status API) status of a commit (None if the request failed)
+def fetch_combined_status(commit_url, headers, client=None):
+    client = client or get_client()
+    response = client.get(f"{commit_url}/status", headers=headers, params={"per_page": MAX_PER_PAGE})
+    if response.status_code != 200:
+        print(f"Error fetching commit statuses: {response.status_code}, {response.text}")
+        return None
+    return response.json()
+
+
+# Function to turn a legacy status context into a CheckRun record
+def normalize_status(status):
+    state, conclusion = STATUS_CONTEXT_STATES.get((status.get("state") or "").upper(), ("pending", None))
+    return CheckRun(status.get("context"), state, conclusion, started_at=status.get("created_at"),
+                    completed_at=status.get("updated_at") if conclusion else None, source="status")
+
+
+# Every CI signal for one commit: check runs, check suites and legacy status
+# contexts, with `checks` holding the newest attempt of every check run and
+# status context in one list the merge policy can evaluate, and
+# `unstarted_suites` the suites whose runs the policy still has to wait for
+class CISnapshot:
+    __slots__ = ("sha", "check_runs", "check_suites", "statuses", "combined_state", "checks")
+
+    def __init__(self, sha, check_runs=None, check_suites=None, combined_status=None):
+        self.sha = sha
+        self.check_runs = check_runs or []
+        self.check_suites = check_suites or []
+        combined_status = combined_status or {}
+        self.statuses = [normalize_status(status) for status in combined_status.get("statuses", [])]
+        self.combined_state = combined_status.get("state")
+        self.checks = LatestCheckIndex(self.check_runs + self.statuses).latest()
+
+    # Names of the queued / in-progress check suites that have not created any
+    # check run yet (a required check may still appear in them), ignoring suites
+    # older than SUITE_START_GRACE
+    def unstarted_suites(self, now=None, grace=SUITE_START_GRACE):
+        now = now or datetime.now(timezone.utc)
+        suite_ids = {check["check_suite"]["id"] for check in self.check_runs if check.get("check_suite")}
+        names = []
+        for suite in self.check_suites:
+            if suite.get("status") == "completed" or suite.get("id") in suite_ids:
+                continue
+            if suite.get("latest_check_runs_count"):
+                continue
+            created = parse_github_time(suite.get("created_at"))
+            if created is not None and (now - created).total_seconds() > grace:
+                continue
+            names.append((suite.get("app") or {}).get("slug") or f"suite {suite.get('id')}")
+        return names
+
+    def __repr__(self):
+        return (f"CISnapshot({self.sha!r}, {len(self.check_runs)} check runs, "
+                f"{len(self.check_suites)} suites, {len(self.statuses)} statuses)")
+
+
+# Function to fetch check runs, check suites and the combined status of a commit
+# concurrently (over the shared pooled client) and merge them into a CISnapshot.
+# `commit_url` is `{api}/repos/{owner}/{repo}/commits/{sha}`.
+def fetch_ci_snapshot(commit_url, headers, required_names=None, client=None):
+    client = client or get_client()
+    executor = _get_executor()
+    check_runs = executor.submit(fetch_check_runs, commit_url, headers, required_names, client)
+    check_suites = executor.submit(fetch_check_suites, commit_url, headers, client)
+    combined_status = executor.submit(fetch_combined_status, commit_url, headers, client)
+    sha = commit_url.rstrip("/").rsplit("/", 1)[-1]
+    return CISnapshot(sha, check_runs.result(), check_suites.result(), combined_status.result())
@@ -0,0 +1,264 @@
+import argparse
+import asyncio
+import fnmatch
+import json
+import os
+import signal
+import time
+
+import metrics
+import test2
+from async_runner import DEFAULT_MAX_IN_FLIGHT, DEFAULT_WAIT_TIMEOUT, AsyncPipeline
+from multi_repo import parse_repo
+from policy import load_policy
+from preflight import list_branch_heads
+from state_store import DEFAULT_STATE_DB, StateStore
+from test2 import HEADERS, POLICY, REQUIRED_CHECKS, client
+
+# Daemon configuration file (override with GAUTO_DAEMON_CONFIG or --config)
+DEFAULT_DAEMON_CONFIG = os.getenv("GAUTO_DAEMON_CONFIG", "gauto_daemon.json")
+
+DEFAULT_POLL_INTERVAL = 30      # seconds between branch scans
+DEFAULT_RETRY_INTERVAL = 300    # seconds before a branch whose PR did not merge is looked at again
+DEFAULT_MAX_JOBS = 16           # PRs being created / waited on / merged at once
+DEFAULT_SHUTDOWN_GRACE = 30     # seconds running jobs get to finish on shutdown
+
+# The config file is JSON, for example:
+#
+# {
+#   "poll_interval": 30,
+#   "max_jobs": 16,
+#   "process_existing": false,
+#   "watch": [
+#     {"repo": "krkredde/gauto", "branches": ["auto_*", "feature/*"], "exclude": ["feature/wip-*"], "base": "main"}
+#   ]
+# }
+#
+# - every branch matching "branches" (and not "exclude") gets a PR into "base"
+#   whenever a new commit is pushed to it; it is merged once the checks pass
+# - branches that already exist when the daemon starts are only picked up after
+#   their next push, unless "process_existing" is true
+# - this file and the GAUTO_POLICY file are re-read on SIGHUP or when either changes
+
+
+# Function to read the modification time of the GAUTO_POLICY file (None without one)
+def _policy_mtime():
+    policy_path = os.getenv('GAUTO_POLICY')
+    try:
+        return os.path.getmtime(policy_path) if policy_path else None
+    except OSError:
+        return None
+
+
+# Function to read and validate the daemon config
+def load_daemon_config(path):
+    with open(path) as f:
+        config = json.load(f)
+    watch = []
+    for entry in config.get("watch", []):
+        owner, repo = parse_repo(entry["repo"])
+        watch.append({
+            "owner": owner,
+            "repo": repo,
+            "branches": list(entry.get("branches", ["*"])),
+            "exclude": list(entry.get("exclude", [])),
+            "base": entry["base"],
+        })
+    return {
+        "poll_interval": float(config.get("poll_interval", DEFAULT_POLL_INTERVAL)),
+        "retry_interval": float(config.get("retry_interval", DEFAULT_RETRY_INTERVAL)),
+        "max_jobs": int(config.get("max_jobs", DEFAULT_MAX_JOBS)),
+        "process_existing": bool(config.get("process_existing", False)),
+        "watch": watch,
+    }
+
+
+# Function to list the branches of a repository as {name: head sha} (None on error)
+def list_branches(owner, repo):
+    return list_branch_heads(f"{test2.GITHUB_API_URL}/repos/{owner}/{repo}", HEADERS, client)
+
+
+def _matches(name, watch):
+    return (name != watch["base"]
+            and any(fnmatch.fnmatchcase(name, pattern) for pattern in watch["branches"])
+            and not any(fnmatch.fnmatchcase(name, pattern) for pattern in watch["exclude"]))
+
+
+# Long-running watcher: scans the watched repositories for pushes, runs each new
+# head through the AsyncPipeline (create/resume PR -> wait for checks -> merge),
+# and keeps the HTTP connections, conditional-request cache and state store warm
+class MergeDaemon:
+    def __init__(self, config_path, pipeline, store):
+        self.config_path = config_path
+        self.pipeline = pipeline
+        self.store = store
+        self.config = load_daemon_config(config_path)
+        self._config_mtime = os.path.getmtime(config_path)
+        self._policy_mtime = _policy_mtime()
+        self.seen = {}       # (owner, repo, branch, base) -> head sha last handed to a job
+        self.retry_at = {}   # same key -> monotonic time before which it is not retried
+        self.jobs = {}       # same key -> running asyncio.Task
+        self._baselined = set()
+        self._stop = None
+        self._reload = False
+
+    # Function to re-read the config (and the merge policy); a bad file keeps the old config
+    def reload(self):
+        try:
+            self.config = load_daemon_config(self.config_path)
+            self._config_mtime = os.path.getmtime(self.config_path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error reloading {self.config_path}: {e}; keeping the previous config")
+        else:
+            print(f"Reloaded {self.config_path}: watching {len(self.config['watch'])} rule(s)")
+        policy_path = os.getenv('GAUTO_POLICY')
+        if policy_path:
+            self._policy_mtime = _policy_mtime()
+            try:
+                POLICY.update(load_policy(policy_path, REQUIRED_CHECKS).config)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Error reloading {policy_path}: {e}; keeping the previous policy")
+
+    def _config_changed(self):
+        try:
+            if os.path.getmtime(self.config_path) != self._config_mtime:
+                return True
+        except OSError:
+            pass
+        return _policy_mtime() != self._policy_mtime
+
+    def request_reload(self):
+        self._reload = True
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    # Function to point the state store at the new head, so the job resumes the
+    # open PR with the new commit (or opens a new PR after an earlier one merged)
+    def _prepare_store(self, owner, repo, head_branch, base_branch, sha):
+        pr = self.store.find_pull_request(owner, repo, head_branch, base_branch)
+        if pr is None or pr["head_sha"] == sha:
+            return
+        if pr["state"] == "open":
+            self.store.update_pull_request(owner, repo, pr["number"], head_sha=sha)
+        elif pr["state"] == "merged":
+            self.store.update_pull_request(owner, repo, pr["number"], state="superseded")
+
+    async def scan(self):
+        for watch in self.config["watch"]:
+            owner, repo, base_branch = watch["owner"], watch["repo"], watch["base"]
+            branches = await self.pipeline._call(list_branches, owner, repo)
+            if branches is None:
+                continue
+
+            baseline = (owner, repo, base_branch) not in self._baselined and not self.config["process_existing"]
+            self._baselined.add((owner, repo, base_branch))
+            now = time.monotonic()
+            for name, sha in sorted(branches.items()):
+                if not _matches(name, watch):
+                    continue
+                key = (owner, repo, name, base_branch)
+                if baseline:
+                    self.seen[key] = sha
+                    continue
+                if key in self.jobs:
+                    continue
+                if self.seen.get(key) == sha:
+                    retry = self.retry_at.get(key)
+                    if retry is None or retry > now:
+                        continue
+                if len(self.jobs) >= self.config["max_jobs"]:
+                    return
+                self._start_job(key, sha)
+
+    def _start_job(self, key, sha):
+        owner, repo, head_branch, base_branch = key
+        self.seen[key] = sha
+        self.retry_at.pop(key, None)
+        print(f"Processing commit {sha[:7]} on {owner}/{repo} '{head_branch}' -> '{base_branch}'")
+        self.jobs[key] = asyncio.create_task(self._job(key, sha))
+
+    async def _job(self, key, sha):
+        owner, repo, head_branch, base_branch = key
+        try:
+            await self.pipeline._store(self._prepare_store, owner, repo, head_branch, base_branch, sha)
+            result = await self.pipeline.process(head_branch, base_branch, owner, repo)
+            state = "merged" if result["merged"] else "not merged"
+            print(f"{owner}/{repo} '{head_branch}' -> '{base_branch}': PR #{result['pr_number']} {state} "
+                  f"({result['elapsed']}s)")
+            merged = result["merged"]
+        except Exception as e:
+            print(f"Error processing {owner}/{repo} '{head_branch}' -> '{base_branch}': {e}")
+            merged = False
+        finally:
+            self.jobs.pop(key, None)
+        if not merged:
+            # Look again later: a re-run of a failed check can still turn it green
+            self.retry_at[key] = time.monotonic() + self.config["retry_interval"]
+
+    def _install_signal_handlers(self, loop):
+        for sig, handler in ((signal.SIGTERM, self.stop), (signal.SIGINT, self.stop),
+                             (getattr(signal, "SIGHUP", None), self.request_reload)):
+            if sig is None:
+                continue
+            try:
+                loop.add_signal_handler(sig, handler)
+            except (NotImplementedError, RuntimeError):
+                pass  # not supported on this platform / not the main thread
+
+    # Scan until stopped (or once, with once=True), then let running jobs finish
+    async def run(self, once=False, shutdown_grace=DEFAULT_SHUTDOWN_GRACE):
+        self.pipeline.start()
+        self._stop = asyncio.Event()
+        if once:
+            self.config["process_existing"] = True  # a single scan has nothing to compare against
+        self._install_signal_handlers(asyncio.get_running_loop())
+        print(f"Watching {len(self.config['watch'])} rule(s) from {self.config_path}")
+
+        while not self._stop.is_set():
+            if self._reload or self._config_changed():
+                self._reload = False
+                self.reload()
+            await self.scan()
+            if once:
+                break
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.config["poll_interval"])
+            except asyncio.TimeoutError:
+                pass
+
+        jobs = list(self.jobs.values())
+        if jobs:
+            if not once:
+                print(f"Shutting down: waiting up to {shutdown_grace}s for {len(jobs)} running job(s)")
+            done, pending = await asyncio.wait(jobs, timeout=None if once else shutdown_grace)
+            for task in pending:
+                task.cancel()
+            if pending:
+                # Their PRs are in the state store, so the next start resumes them
+                await asyncio.gather(*pending, return_exceptions=True)
+                print(f"Cancelled {len(pending)} job(s); they will be resumed on the next start")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch branches and keep opening, checking and merging PRs.")
+    parser.add_argument("--config", default=DEFAULT_DAEMON_CONFIG, help="daemon config file (JSON)")
+    parser.add_argument("--once", action="store_true", help="scan once, finish the started jobs and exit")
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT, help="HTTP requests in flight")
+    parser.add_argument("--wait-timeout", type=float, default=DEFAULT_WAIT_TIMEOUT)
+    parser.add_argument("--shutdown-grace", type=float, default=DEFAULT_SHUTDOWN_GRACE)
+    parser.add_argument("--state-db", default=DEFAULT_STATE_DB, help="SQLite file used to resume PRs across runs")
+    args = parser.parse_args(argv)
+    metrics.setup_from_env()
+
+    store = StateStore(args.state_db)
+    pipeline = AsyncPipeline(args.max_in_flight, args.wait_timeout, store=store)
+    daemon = MergeDaemon(args.config, pipeline, store)
+    asyncio.run(daemon.run(args.once, args.shutdown_grace))
+    print(f"HTTP client stats: {client.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,120 @@
+import os
+import threading
+from datetime import datetime, timezone
+
+from polling import is_terminal, parse_github_time
+
+# Use recorded check durations to schedule the first poll and order work (GAUTO_ETA_SCHEDULING=0 turns it off)
+ETA_SCHEDULING = os.getenv("GAUTO_ETA_SCHEDULING", "1") != "0"
+
+# Percentile of a check's recorded durations used as its expected duration
+ETA_PERCENTILE = float(os.getenv("GAUTO_ETA_PERCENTILE", "75"))
+
+# Runs of a check on one base branch needed before that branch's own history is
+# used; below this the check's history across every base branch of the repository is used
+ETA_MIN_SAMPLES = int(os.getenv("GAUTO_ETA_MIN_SAMPLES", "3"))
+
+# Most recent durations per (base branch, check name) that the percentiles are computed over
+ETA_HISTORY = int(os.getenv("GAUTO_ETA_HISTORY", "200"))
+
+
+# Function to compute the p-th percentile (0-100) of a list of numbers
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+# Function to read how long a completed check ran, in seconds (None without both timestamps)
+def run_duration(check):
+    started = parse_github_time(check.get("started_at"))
+    completed = parse_github_time(check.get("completed_at"))
+    if started is None or completed is None:
+        return None
+    return max((completed - started).total_seconds(), 0.0)
+
+
+# Per-check duration statistics from the state store, by repository, base
+# branch and check name. Only successful runs are recorded: a run that fails
+# early says nothing about how long a mergeable PR waits. The durations of a
+# repository are loaded once and reloaded after new ones are recorded.
+class DurationHistory:
+    def __init__(self, store, percentile=ETA_PERCENTILE, min_samples=ETA_MIN_SAMPLES, limit=ETA_HISTORY):
+        self.store = store
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.limit = limit
+        self._durations = {}  # (owner, repo) -> {(base branch, check name): [seconds, ...]}
+        self._lock = threading.Lock()
+
+    def _repo_durations(self, owner, repo):
+        with self._lock:
+            durations = self._durations.get((owner, repo))
+            if durations is None:
+                durations = self.store.get_check_durations(owner, repo, self.limit)
+                self._durations[(owner, repo)] = durations
+            return durations
+
+    # Function to record the durations of the successful runs among `check_runs` for a commit
+    def record(self, owner, repo, base_branch, sha, check_runs):
+        durations = []
+        for check in check_runs:
+            if check is None or not is_terminal(check) or check.get("conclusion") != "success":
+                continue
+            duration = run_duration(check)
+            if duration is not None:
+                durations.append((check["name"], duration, check.get("completed_at")))
+        if durations:
+            self.store.record_check_durations(owner, repo, base_branch or "", sha, durations)
+            with self._lock:
+                self._durations.pop((owner, repo), None)
+
+    # Function to read the recorded durations of one check (the base branch's own, or repository-wide)
+    def durations(self, owner, repo, base_branch, name):
+        durations = self._repo_durations(owner, repo)
+        own = durations.get((base_branch or "", name), [])
+        if len(own) >= self.min_samples:
+            return own
+        return [seconds for (_, check_name), values in durations.items() if check_name == name
+                for seconds in values]
+
+    # Function to compute {"samples", "p50", "p90", "p<ETA_PERCENTILE>"} for one check (None without history)
+    def stats(self, owner, repo, base_branch, name):
+        durations = self.durations(owner, repo, base_branch, name)
+        if not durations:
+            return None
+        stats = {"samples": len(durations)}
+        for p in sorted({50, 90, self.percentile}):
+            stats[f"p{p:g}"] = round(percentile(durations, p), 1)
+        return stats
+
+    # Function to map every check with history that `policy` gates on (all of
+    # them without a policy) to its expected duration in seconds
+    def expected_durations(self, owner, repo, base_branch, policy=None):
+        names = {name for _, name in self._repo_durations(owner, repo)}
+        return {name: percentile(self.durations(owner, repo, base_branch, name), self.percentile)
+                for name in sorted(names) if policy is None or policy.applies_to(name)}
+
+    # Function to estimate the seconds until every gated check with history has
+    # finished, given the runs seen so far (None without any history).
+    # Checks that never ran before do not count towards the estimate.
+    def eta(self, owner, repo, base_branch, policy=None, check_runs=(), now=None):
+        expected = self.expected_durations(owner, repo, base_branch, policy)
+        if not expected:
+            return None
+        now = now or datetime.now(timezone.utc)
+        runs = {check["name"]: check for check in check_runs or () if check is not None}
+        remaining = 0.0
+        for name, duration in expected.items():
+            check = runs.get(name)
+            if is_terminal(check):
+                continue
+            started = parse_github_time(check.get("started_at")) if check else None
+            if started is not None:
+                duration -= (now - started).total_seconds()
+            remaining = max(remaining, duration)
+        return remaining
@@ -0,0 +1,487 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from test2 import REQUIRED_CHECKS
+
+DEFAULT_PER_PAGE = 30
+MAX_PER_PAGE = 100
+
+
+# Behaviour of the fake API (all times in seconds)
+class FakeGitHubConfig:
+    def __init__(self, latency=0.05, latency_jitter=0.0, check_duration=(2.0, 5.0), queue_delay=0.5,
+                 check_names=REQUIRED_CHECKS, extra_checks=0, failure_rate=0.0, error_rate=0.0,
+                 rate_limit=None, rate_window=3600, legacy_statuses=()):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.check_duration = check_duration      # (min, max) time a check runs
+        self.queue_delay = queue_delay            # time a check sits in "queued"
+        self.check_names = list(check_names) + [f"extra-check-{i}" for i in range(extra_checks)]
+        self.failure_rate = failure_rate          # chance a check concludes "failure"
+        self.error_rate = error_rate              # chance any request fails with a 502
+        self.rate_limit = rate_limit              # requests per window (None = unlimited)
+        self.rate_window = rate_window
+        self.legacy_statuses = list(legacy_statuses)  # contexts reported via the status API
+
+
+# In-memory repository state shared by all request handlers
+class FakeGitHubState:
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.next_pr = 1
+        self.next_check_id = 1
+        self.next_suite_id = 1
+        self.prs = {}          # number -> PR dict
+        self.commits = {}      # sha -> {"created": t, "checks": [...], "statuses": [...], "contains": {shas}}
+        self.branches = {}     # branch name -> head sha
+        self.polled = set()    # shas whose check runs were read (a rough count of CI runs waited on)
+        self.calls = {}        # "METHOD endpoint" -> count
+        self.rate_used = {}    # Authorization header -> requests used in this window (GitHub limits per token)
+        self.rate_reset = {}   # Authorization header -> window reset time
+        self.branch_sha("main")
+
+    def count(self, key):
+        with self.lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+    # Function to add a commit and start its checks. A merge commit (`parents`)
+    # fails a check exactly when one of its parents failed it, so batches of
+    # PRs fail deterministically and can be bisected.
+    def new_commit(self, sha, parents=()):
+        config = self.config
+        now = time.time()
+        failed = set()
+        contains = {sha}
+        for parent in parents:
+            commit = self.commits.get(parent, {"checks": [], "contains": {parent}})
+            failed.update(check["name"] for check in commit["checks"] if check["conclusion"] != "success")
+            contains.update(commit["contains"])
+        suite_id = self.next_suite_id
+        self.next_suite_id += 1
+        checks = []
+        for name in config.check_names:
+            start = now + config.queue_delay
+            checks.append({
+                "id": self.next_check_id,
+                "name": name,
+                "suite_id": suite_id,
+                "start": start,
+                "end": start + random.uniform(*config.check_duration),
+                "conclusion": self._conclusion(name, failed, parents),
+            })
+            self.next_check_id += 1
+        statuses = [{"context": context, "end": now + random.uniform(*config.check_duration)}
+                    for context in config.legacy_statuses]
+        self.commits[sha] = {"created": now, "checks": checks, "statuses": statuses, "contains": contains}
+
+    def _conclusion(self, name, failed, parents):
+        if parents:
+            return "failure" if name in failed else "success"
+        return "failure" if random.random() < self.config.failure_rate else "success"
+
+    # Function to return a branch's head, creating an initial commit for unknown branches
+    def branch_sha(self, branch):
+        sha = self.branches.get(branch)
+        if sha is None:
+            sha = hashlib.sha1(f"branch-{branch}".encode()).hexdigest()
+            self.commits.setdefault(sha, {"created": time.time(), "checks": [], "statuses": [], "contains": {sha}})
+            self.branches[branch] = sha
+        return sha
+
+    # Function to push a new commit to `branch` (creating the branch); returns its sha
+    def push(self, branch):
+        with self.lock:
+            sha = hashlib.sha1(f"push-{branch}-{time.time()}-{random.random()}".encode()).hexdigest()
+            self.new_commit(sha)
+            self.branches[branch] = sha
+        return sha
+
+    # Function to merge `head` (a branch or sha) into `branch`; returns the new sha,
+    # or None when `head` is already contained in the branch
+    def merge_into(self, branch, head):
+        base_sha = self.branch_sha(branch)
+        head_sha = self.branches.get(head, head)
+        if head_sha in self.commits[base_sha]["contains"]:
+            return None
+        sha = hashlib.sha1(f"merge-{base_sha}-{head_sha}".encode()).hexdigest()
+        if sha not in self.commits:
+            self.new_commit(sha, parents=(base_sha, head_sha))
+        self.branches[branch] = sha
+        return sha
+
+    # Function to render one check run as GitHub would at time `now`
+    @staticmethod
+    def render_check(check, sha, now):
+        if now < check["start"]:
+            status, conclusion, started, completed = "queued", None, None, None
+        elif now < check["end"]:
+            status, conclusion, started, completed = "in_progress", None, check["start"], None
+        else:
+            status, conclusion, started, completed = "completed", check["conclusion"], check["start"], check["end"]
+        iso = lambda t: time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t)) if t else None
+        return {
+            "id": check["id"],
+            "head_sha": sha,
+            "name": check["name"],
+            "status": status,
+            "conclusion": conclusion,
+            "started_at": iso(started),
+            "completed_at": iso(completed),
+            "check_suite": {"id": check["suite_id"]},
+            "output": {"title": None, "summary": None, "text": None, "annotations_count": 0},
+        }
+
+    def stats(self):
+        with self.lock:
+            calls = dict(self.calls)
+            ci_runs = len(self.polled)
+        return {"calls": calls, "total_calls": sum(calls.values()), "ci_runs": ci_runs}
+
+
+# Request handler implementing the REST endpoints the scripts use
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    ROUTES = [
+        ("POST", r"/repos/[^/]+/[^/]+/pulls$", "create_pull"),
+        ("GET", r"/repos/[^/]+/[^/]+/pulls$", "list_pulls"),
+        ("GET", r"/repos/[^/]+/[^/]+/pulls/(\d+)$", "get_pull"),
+        ("GET", r"/repos/[^/]+/[^/]+/pulls/(\d+)/commits$", "pull_commits"),
+        ("PUT", r"/repos/[^/]+/[^/]+/pulls/(\d+)/merge$", "merge_pull"),
+        ("GET", r"/repos/[^/]+/[^/]+/commits/([^/]+)/check-runs$", "check_runs"),
+        ("GET", r"/repos/[^/]+/[^/]+/commits/([^/]+)/check-suites$", "check_suites"),
+        ("GET", r"/repos/[^/]+/[^/]+/commits/([^/]+)/status$", "combined_status"),
+        ("GET", r"/repos/[^/]+/[^/]+/branches$", "list_branches"),
+        ("GET", r"/repos/[^/]+/[^/]+/git/ref/heads/(.+)$", "get_ref"),
+        ("POST", r"/repos/[^/]+/[^/]+/git/refs$", "create_ref"),
+        ("DELETE", r"/repos/[^/]+/[^/]+/git/refs/heads/(.+)$", "delete_ref"),
+        ("POST", r"/repos/[^/]+/[^/]+/merges$", "merge_branch"),
+        ("GET", r"/repos/[^/]+/[^/]+/compare/(.+)$", "compare"),
+    ]
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, obj=None, headers=None):
+        body = json.dumps(obj).encode() if obj is not None else b""
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        return json.loads(self._body or b"{}")
+
+    # Function to apply the simulated rate limit; returns the headers to send
+    def _rate_limit(self, conditional_hit):
+        state, config = self.state, self.state.config
+        if config.rate_limit is None:
+            return {}, False
+        with state.lock:
+            token = self.headers.get("Authorization", "")
+            now = time.time()
+            if now >= state.rate_reset.get(token, 0):
+                state.rate_used[token] = 0
+                state.rate_reset[token] = now + config.rate_window
+            exhausted = state.rate_used[token] >= config.rate_limit
+            if not exhausted and not conditional_hit:
+                state.rate_used[token] += 1
+            headers = {
+                "X-RateLimit-Limit": str(config.rate_limit),
+                "X-RateLimit-Remaining": str(max(config.rate_limit - state.rate_used[token], 0)),
+                "X-RateLimit-Reset": str(int(state.rate_reset[token])),
+                "X-RateLimit-Resource": "core",
+            }
+        return headers, exhausted
+
+    def _dispatch(self, method):
+        config = self.state.config
+        # Always drain the body so the keep-alive connection stays usable
+        self._body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        parsed = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+
+        for route_method, pattern, handler_name in self.ROUTES:
+            match = re.match(pattern, parsed.path)
+            if route_method == method and match:
+                break
+        else:
+            self.state.count(f"{method} unknown")
+            return self._send(404, {"message": "Not Found"})
+
+        self.state.count(f"{method} {handler_name}")
+        time.sleep(max(config.latency + random.uniform(-config.latency_jitter, config.latency_jitter), 0))
+
+        if random.random() < config.error_rate:
+            return self._send(502, {"message": "Server Error"})
+
+        code, obj, headers = getattr(self, handler_name)(*match.groups(), query=query)
+
+        # Conditional GETs: a matching ETag is answered with 304 and costs no rate limit
+        etag = None
+        if method == "GET" and code == 200:
+            etag = '"%s"' % hashlib.sha1(json.dumps(obj, sort_keys=True).encode()).hexdigest()
+        hit = etag is not None and self.headers.get("If-None-Match") == etag
+
+        rate_headers, exhausted = self._rate_limit(hit)
+        if exhausted:
+            return self._send(403, {"message": "API rate limit exceeded"}, rate_headers)
+
+        headers = dict(headers or {}, **rate_headers)
+        if etag:
+            headers["ETag"] = etag
+        if hit:
+            return self._send(304, None, headers)
+        self._send(code, obj, headers)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    # --- endpoints -------------------------------------------------------
+
+    def create_pull(self, query):
+        payload = self._read_json()
+        state = self.state
+        with state.lock:
+            for pr in state.prs.values():
+                if pr["state"] == "open" and pr["head"]["label"] == payload["head"] and pr["base"]["ref"] == payload["base"]:
+                    return 422, {"message": "Validation Failed",
+                                 "errors": [{"message": f"A pull request already exists for {payload['head']}."}]}, None
+            number = state.next_pr
+            state.next_pr += 1
+            head_ref = payload["head"].split(":")[-1]
+            sha = state.branches.get(head_ref)
+            if sha is None:
+                sha = hashlib.sha1(f"{payload['head']}-{number}-{time.time()}".encode()).hexdigest()
+                state.new_commit(sha)
+                state.branches[head_ref] = sha
+            pr = {
+                "number": number,
+                "state": "open",
+                "merged": False,
+                "title": payload.get("title"),
+                "html_url": f"https://github.example/pull/{number}",
+                "head": {"label": payload["head"], "ref": payload["head"].split(":")[-1], "sha": sha},
+                "base": {"ref": payload["base"]},
+            }
+            state.prs[number] = pr
+        return 201, pr, None
+
+    # An open PR's head follows pushes to its branch
+    def _refresh_head(self, pr):
+        if pr["state"] == "open":
+            pr["head"]["sha"] = self.state.branches.get(pr["head"]["ref"], pr["head"]["sha"])
+        return pr
+
+    def list_pulls(self, query):
+        with self.state.lock:
+            prs = [self._refresh_head(pr) for pr in self.state.prs.values()
+                   if query.get("state", "open") in ("all", pr["state"])
+                   and query.get("head") in (None, pr["head"]["label"])
+                   and query.get("base") in (None, pr["base"]["ref"])]
+        return 200, prs, None
+
+    def get_pull(self, number, query):
+        with self.state.lock:
+            pr = self.state.prs.get(int(number))
+            if pr:
+                self._refresh_head(pr)
+        return (200, pr, None) if pr else (404, {"message": "Not Found"}, None)
+
+    def pull_commits(self, number, query):
+        pr = self.state.prs.get(int(number))
+        if not pr:
+            return 404, {"message": "Not Found"}, None
+        return 200, [{"sha": pr["head"]["sha"]}], None
+
+    def merge_pull(self, number, query):
+        payload = self._read_json()
+        with self.state.lock:
+            pr = self.state.prs.get(int(number))
+            if not pr:
+                return 404, {"message": "Not Found"}, None
+            if pr["state"] != "open":
+                return 405, {"message": "Pull Request is not mergeable"}, None
+            self._refresh_head(pr)
+            if payload.get("sha") not in (None, pr["head"]["sha"]):
+                return 409, {"message": "Head branch was modified. Review and try the merge again."}, None
+            pr["state"] = "closed"
+            pr["merged"] = True
+            self.state.merge_into(pr["base"]["ref"], pr["head"]["sha"])
+        return 200, {"merged": True, "message": "Pull Request successfully merged"}, None
+
+    def check_runs(self, sha, query):
+        commit = self.state.commits.get(sha)
+        if not commit:
+            return 404, {"message": "No commit found for SHA"}, None
+        now = time.time()
+        runs = [self.state.render_check(check, sha, now) for check in commit["checks"]]
+        with self.state.lock:
+            self.state.polled.add(sha)
+
+        per_page = min(int(query.get("per_page", DEFAULT_PER_PAGE)), MAX_PER_PAGE)
+        page = int(query.get("page", 1))
+        headers = {}
+        if page * per_page < len(runs):
+            host = self.headers.get("Host")
+            headers["Link"] = (f'<http://{host}{urlparse(self.path).path}?per_page={per_page}&page={page + 1}>; '
+                               f'rel="next"')
+        return 200, {"total_count": len(runs), "check_runs": runs[(page - 1) * per_page:page * per_page]}, headers
+
+    def check_suites(self, sha, query):
+        commit = self.state.commits.get(sha)
+        if not commit:
+            return 404, {"message": "No commit found for SHA"}, None
+        now = time.time()
+        suites = {}
+        for check in commit["checks"]:
+            run = self.state.render_check(check, sha, now)
+            suite = suites.setdefault(check["suite_id"], {"id": check["suite_id"], "head_sha": sha,
+                                                          "app": {"slug": "github-actions", "name": "GitHub Actions"},
+                                                          "status": "completed", "conclusion": "success",
+                                                          "latest_check_runs_count": 0})
+            suite["latest_check_runs_count"] += 1
+            if run["status"] != "completed":
+                suite["status"], suite["conclusion"] = run["status"], None
+            elif run["conclusion"] != "success" and suite["conclusion"]:
+                suite["conclusion"] = run["conclusion"]
+        return 200, {"total_count": len(suites), "check_suites": list(suites.values())}, None
+
+    def combined_status(self, sha, query):
+        commit = self.state.commits.get(sha)
+        if not commit:
+            return 404, {"message": "No commit found for SHA"}, None
+        now = time.time()
+        statuses = [{"context": status["context"], "state": "success" if now >= status["end"] else "pending",
+                     "description": None} for status in commit["statuses"]]
+        overall = "success" if all(s["state"] == "success" for s in statuses) else "pending"
+        return 200, {"sha": sha, "state": overall, "total_count": len(statuses), "statuses": statuses}, None
+
+
+    def list_branches(self, query):
+        with self.state.lock:
+            branches = [{"name": name, "commit": {"sha": sha}, "protected": False}
+                        for name, sha in sorted(self.state.branches.items())]
+        per_page = min(int(query.get("per_page", DEFAULT_PER_PAGE)), MAX_PER_PAGE)
+        page = int(query.get("page", 1))
+        headers = {}
+        if page * per_page < len(branches):
+            host = self.headers.get("Host")
+            headers["Link"] = (f'<http://{host}{urlparse(self.path).path}?per_page={per_page}&page={page + 1}>; '
+                               f'rel="next"')
+        return 200, branches[(page - 1) * per_page:page * per_page], headers
+
+    def get_ref(self, branch, query):
+        with self.state.lock:
+            sha = self.state.branches.get(branch)
+        if sha is None:
+            sha = self.state.push(branch)  # any branch asked for exists, as if just pushed
+        return 200, {"ref": f"refs/heads/{branch}", "object": {"type": "commit", "sha": sha}}, None
+
+    def compare(self, basehead, query):
+        base, _, head = basehead.partition("...")
+        with self.state.lock:
+            base_commit = self.state.commits.get(self.state.branches.get(base, base))
+            head_commit = self.state.commits.get(self.state.branches.get(head, head))
+            if base_commit is None or head_commit is None:
+                return 404, {"message": "Not Found"}, None
+            ahead_by = len(head_commit["contains"] - base_commit["contains"])
+            behind_by = len(base_commit["contains"] - head_commit["contains"])
+        if ahead_by and behind_by:
+            status = "diverged"
+        elif ahead_by or behind_by:
+            status = "ahead" if ahead_by else "behind"
+        else:
+            status = "identical"
+        return 200, {"status": status, "ahead_by": ahead_by, "behind_by": behind_by,
+                     "total_commits": ahead_by, "commits": [], "files": []}, None
+
+    def create_ref(self, query):
+        payload = self._read_json()
+        branch = payload["ref"].split("refs/heads/", 1)[-1]
+        with self.state.lock:
+            if branch in self.state.branches:
+                return 422, {"message": "Reference already exists"}, None
+            if payload["sha"] not in self.state.commits:
+                return 422, {"message": "Object does not exist"}, None
+            self.state.branches[branch] = payload["sha"]
+        return 201, {"ref": payload["ref"], "object": {"type": "commit", "sha": payload["sha"]}}, None
+
+    def delete_ref(self, branch, query):
+        with self.state.lock:
+            if self.state.branches.pop(branch, None) is None:
+                return 422, {"message": "Reference does not exist"}, None
+        return 204, None, None
+
+    def merge_branch(self, query):
+        payload = self._read_json()
+        with self.state.lock:
+            if payload["base"] not in self.state.branches:
+                return 404, {"message": "Base does not exist"}, None
+            if payload["head"] not in self.state.branches and payload["head"] not in self.state.commits:
+                return 404, {"message": "Head does not exist"}, None
+            sha = self.state.merge_into(payload["base"], payload["head"])
+        if sha is None:
+            return 204, None, None
+        return 201, {"sha": sha, "commit": {"message": payload.get("commit_message")}}, None
+
+
+# Function to start a fake GitHub API server in a background thread
+def start_fake_github(config=None, host="127.0.0.1", port=0):
+    state = FakeGitHubState(config or FakeGitHubConfig())
+    handler = type("BoundFakeGitHubHandler", (FakeGitHubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    server.base_url = f"http://{host}:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local fake of the GitHub REST endpoints used by the scripts.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--check-duration", type=float, nargs=2, default=(2.0, 5.0), metavar=("MIN", "MAX"))
+    parser.add_argument("--extra-checks", type=int, default=0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int)
+    args = parser.parse_args(argv)
+
+    config = FakeGitHubConfig(latency=args.latency, check_duration=tuple(args.check_duration),
+                              extra_checks=args.extra_checks, failure_rate=args.failure_rate,
+                              error_rate=args.error_rate, rate_limit=args.rate_limit)
+    server = start_fake_github(config, port=args.port)
+    print(f"Fake GitHub API listening on {server.base_url} (set GITHUB_API_URL to use it)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
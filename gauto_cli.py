@@ -0,0 +1,254 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+# The heavy modules (requests, the pipeline, sqlite) are imported inside the
+# command handlers, so `gauto --help` and the argument parsing start fast.
+
+# Exit codes: checks passed / merged, checks failed / not merged, checks still pending
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_PENDING = 3
+
+# Commands that hand their arguments to another module's own CLI
+DELEGATED_COMMANDS = {
+    "async": ("async_runner", "create, wait for checks and merge many branch pairs concurrently"),
+    "multi": ("multi_repo", "run branch pairs across many repositories"),
+    "queue": ("merge_queue", "land PRs through the batched merge queue"),
+    "daemon": ("daemon", "watch branches and merge continuously"),
+    "webhook": ("webhook_server", "merge PRs from check_run / check_suite webhooks"),
+    "bench": ("benchmark", "benchmark the pipeline against a fake GitHub API"),
+    "fake-github": ("fake_github", "serve a simulated GitHub API for local testing"),
+    "cassette": ("cassette", "summarise a recorded HTTP cassette"),
+}
+
+
+# Function to split "owner/repo" into (owner, repo)
+def _repo(value):
+    owner, sep, repo = value.partition("/")
+    if not sep or not owner or not repo or "/" in repo:
+        raise argparse.ArgumentTypeError(f"Expected 'owner/repo', got: {value!r}")
+    return owner, repo
+
+
+# Function to resolve --repo, falling back to GAUTO_REPO and then to the defaults in test2
+def _owner_repo(args):
+    if args.repo:
+        return args.repo
+    if os.getenv("GAUTO_REPO"):
+        return _repo(os.getenv("GAUTO_REPO"))
+    import test2
+    return test2.REPO_OWNER, test2.REPO_NAME
+
+
+# In JSON mode the library's progress messages go to stderr, so stdout holds only the JSON document
+def _quiet(args):
+    return contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext()
+
+
+def _emit(args, result, text):
+    if args.json:
+        print(json.dumps(result, default=str))
+    else:
+        print(text)
+
+
+def _decision_result(sha, decision):
+    return {"sha": sha, "state": decision.state, "reason": decision.reason, "checks": decision.statuses}
+
+
+def _decision_exit(decision):
+    from policy import FAIL, MERGE
+    if decision.state == MERGE:
+        return EXIT_OK
+    return EXIT_FAILED if decision.state == FAIL else EXIT_PENDING
+
+
+def _open_store(args):
+    from state_store import StateStore
+    return StateStore(args.state_db) if args.state_db else StateStore()
+
+
+def cmd_create(args):
+    import test2
+    owner, repo = _owner_repo(args)
+    with _quiet(args):
+        store = None if args.no_state else _open_store(args)
+        pr_number, commit_sha = test2.resume_or_create_pull_request(args.branch, args.base, store, owner, repo)
+    result = {"repo": f"{owner}/{repo}", "branch": args.branch, "base": args.base, "pr_number": pr_number,
+              "head_sha": commit_sha}
+    _emit(args, result, f"PR #{pr_number} (commit {commit_sha})" if pr_number else "No PR created")
+    return EXIT_OK if pr_number else EXIT_FAILED
+
+
+def cmd_wait(args):
+    import test2
+    from polling import PollScheduler
+    owner, repo = _owner_repo(args)
+    with _quiet(args):
+        if args.once:
+            # A single status query: one CI snapshot evaluated against the policy
+            snapshot = test2.get_ci_snapshot(args.sha, None, owner, repo)
+            decision = test2.POLICY.evaluate(snapshot.checks, args.base, snapshot.unstarted_suites())
+        else:
+            scheduler = PollScheduler(deadline=args.timeout if args.timeout is not None else test2.CHECKS_DEADLINE)
+            decision = test2.wait_for_check_decision(args.sha, args.base, scheduler, owner=owner, repo=repo)
+    _emit(args, _decision_result(args.sha, decision), f"{decision.state}: {decision.reason}")
+    return _decision_exit(decision)
+
+
+def cmd_merge(args):
+    import test2
+    owner, repo = _owner_repo(args)
+    result = {"repo": f"{owner}/{repo}", "pr_number": args.pr_number}
+    with _quiet(args):
+        if args.sha:
+            snapshot = test2.get_ci_snapshot(args.sha, None, owner, repo)
+            decision = test2.POLICY.evaluate(snapshot.checks, args.base, snapshot.unstarted_suites())
+            result.update(_decision_result(args.sha, decision))
+            merged = test2.merge_if_checks_passed(args.pr_number, decision, owner=owner, repo=repo)
+        else:
+            merged = test2.merge_pull_request(args.pr_number, owner, repo)
+    result["merged"] = bool(merged)
+    _emit(args, result, f"PR #{args.pr_number} {'merged' if merged else 'not merged'}")
+    return EXIT_OK if merged else EXIT_FAILED
+
+
+# Function to show the recorded duration percentiles of the checks gating BASE and the resulting ETA
+def cmd_eta(args):
+    import test2
+    from eta import DurationHistory
+    owner, repo = _owner_repo(args)
+    with _quiet(args):
+        store = _open_store(args)
+        history = DurationHistory(store)
+        policy = test2.POLICY.for_branch(args.base)
+        runs = store.get_check_runs(owner, repo, args.sha) if args.sha else ()
+        eta = history.eta(owner, repo, args.base, policy, runs)
+        checks = {name: history.stats(owner, repo, args.base, name)
+                  for name in history.expected_durations(owner, repo, args.base, policy)}
+    result = {"repo": f"{owner}/{repo}", "base": args.base, "sha": args.sha,
+              "eta": round(eta, 1) if eta is not None else None, "checks": checks}
+    if eta is None:
+        text = f"No recorded check durations for {owner}/{repo} '{args.base}'"
+    else:
+        lines = [f"{name}: p50 {stats['p50']}s, p90 {stats['p90']}s ({stats['samples']} runs)"
+                 for name, stats in checks.items()]
+        text = "\n".join(lines + [f"ETA: {eta:.0f}s"])
+    _emit(args, result, text)
+    return EXIT_OK if eta is not None else EXIT_FAILED
+
+
+def cmd_run(args):
+    import metrics
+    import test2
+    from eta import ETA_SCHEDULING, DurationHistory
+    from polling import PollScheduler
+    from preflight import NOTHING_TO_MERGE
+    owner, repo = _owner_repo(args)
+    head_branch = args.branch or os.getenv("branch")
+    base_branch = args.base or os.getenv("originalBranch")
+    if not head_branch or not base_branch:
+        print("Error: give BRANCH and BASE or set the 'branch' / 'originalBranch' environment variables.",
+              file=sys.stderr)
+        return EXIT_FAILED
+
+    started = time.monotonic()
+    result = {"repo": f"{owner}/{repo}", "branch": head_branch, "base": base_branch}
+    with _quiet(args):
+        metrics.setup_from_env()
+        store = None if args.no_state else _open_store(args)
+        if store and ETA_SCHEDULING:
+            eta = DurationHistory(store).eta(owner, repo, base_branch, test2.POLICY.for_branch(base_branch))
+            result["eta"] = round(eta, 1) if eta is not None else None
+        if not args.no_preflight:
+            kept, preflight = test2.preflight_targets([(owner, repo, head_branch, base_branch)], store)
+            result["preflight"] = preflight[0]["status"]
+    if not args.no_preflight and not kept:
+        # Already merged (nothing to do) or a branch is missing: no PR is created
+        result.update(merged=False, elapsed=round(time.monotonic() - started, 2))
+        _emit(args, result, f"Skipped: {result['preflight'].replace('_', ' ')}")
+        return EXIT_OK if result["preflight"] == NOTHING_TO_MERGE else EXIT_FAILED
+
+    with _quiet(args):
+        pr_number, commit_sha = test2.resume_or_create_pull_request(head_branch, base_branch, store, owner, repo)
+        result.update(pr_number=pr_number, head_sha=commit_sha)
+        merged = bool(pr_number) and commit_sha is None  # already merged on an earlier run
+        if pr_number and commit_sha:
+            scheduler = PollScheduler(deadline=args.timeout if args.timeout is not None else test2.CHECKS_DEADLINE)
+            decision = test2.wait_for_check_decision(commit_sha, base_branch, scheduler, store, owner, repo)
+            result.update(state=decision.state, reason=decision.reason, checks=decision.statuses)
+            merged = test2.merge_if_checks_passed(pr_number, decision, store, owner, repo)
+            if merged:
+                metrics.observe("gauto_time_to_merge_seconds", time.monotonic() - started)
+    result.update(merged=bool(merged), elapsed=round(time.monotonic() - started, 2))
+    _emit(args, result, f"PR #{pr_number} {'merged' if merged else 'not merged'} ({result['elapsed']}s)")
+    return EXIT_OK if merged else EXIT_FAILED
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="gauto", description="Create, check and merge GitHub pull requests.")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--repo", type=_repo, help="owner/repo (default: GAUTO_REPO or krkredde/gauto)")
+    common.add_argument("--json", action="store_true", help="print one JSON document on stdout")
+    state = argparse.ArgumentParser(add_help=False)
+    state.add_argument("--state-db", help="SQLite file used to resume PRs across runs (default: GAUTO_STATE_DB)")
+    state.add_argument("--no-state", action="store_true", help="do not read or write the state database")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+
+    create = commands.add_parser("create", parents=[common, state], help="create (or resume) a PR")
+    create.add_argument("branch")
+    create.add_argument("base")
+    create.set_defaults(handler=cmd_create)
+
+    wait = commands.add_parser("wait", parents=[common], help="wait for the required checks of a commit",
+                               epilog=f"exit status: {EXIT_OK} passed, {EXIT_FAILED} failed, {EXIT_PENDING} pending")
+    wait.add_argument("sha")
+    wait.add_argument("--base", help="base branch (selects per-branch policy overrides)")
+    wait.add_argument("--once", action="store_true", help="check once and report instead of polling")
+    wait.add_argument("--timeout", type=float, help="seconds to wait (default: checksTimeout or 1800)")
+    wait.set_defaults(handler=cmd_wait)
+
+    merge = commands.add_parser("merge", parents=[common], help="merge a PR")
+    merge.add_argument("pr_number", type=int)
+    merge.add_argument("--sha", help="only merge if the checks on this commit pass the policy")
+    merge.add_argument("--base", help="base branch (selects per-branch policy overrides)")
+    merge.set_defaults(handler=cmd_merge)
+
+    run = commands.add_parser("run", parents=[common, state], help="create a PR, wait for its checks and merge it")
+    run.add_argument("branch", nargs="?", help="head branch (default: the 'branch' env var)")
+    run.add_argument("base", nargs="?", help="base branch (default: the 'originalBranch' env var)")
+    run.add_argument("--timeout", type=float, help="seconds to wait for checks (default: checksTimeout or 1800)")
+    run.add_argument("--no-preflight", action="store_true", help="skip the compare-API check for no-op branches")
+    run.set_defaults(handler=cmd_run)
+
+    eta = commands.add_parser("eta", parents=[common], help="show recorded check durations and the ETA for a base branch")
+    eta.add_argument("base")
+    eta.add_argument("--sha", help="estimate the time left for this commit from its recorded check runs")
+    eta.add_argument("--state-db", help="SQLite file with the recorded durations (default: GAUTO_STATE_DB)")
+    eta.set_defaults(handler=cmd_eta)
+
+    for name, (_, description) in DELEGATED_COMMANDS.items():
+        commands.add_parser(name, add_help=False, help=f"{description} (see gauto {name} --help)")
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in DELEGATED_COMMANDS:
+        module = __import__(DELEGATED_COMMANDS[argv[0]][0])
+        return module.main(argv[1:])
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not getattr(args, "handler", None):
+        parser.print_help()
+        return EXIT_FAILED
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
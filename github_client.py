@@ -0,0 +1,274 @@
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from cassette import adapter_from_env
+from rate_limit import RateLimitGovernor, resource_for_url
+from token_pool import TokenPool
+
+# Connection pool defaults (override with environment variables)
+DEFAULT_POOL_SIZE = int(os.getenv("GITHUB_POOL_SIZE", "10"))
+DEFAULT_TIMEOUT = float(os.getenv("GITHUB_TIMEOUT", "30"))
+DEFAULT_CONNECT_TIMEOUT = float(os.getenv("GITHUB_CONNECT_TIMEOUT", "5"))
+
+# Conditional-request cache: number of URLs whose ETag/Last-Modified we remember
+# (set GITHUB_HTTP_CACHE_SIZE=0 to turn the cache off)
+DEFAULT_CACHE_SIZE = int(os.getenv("GITHUB_HTTP_CACHE_SIZE", "1024"))
+
+
+# Shared HTTP client: one keep-alive session with a connection pool, so
+# repeated calls to api.github.com reuse the same TCP/TLS connections
+class GitHubClient:
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, headers=None, cache_size=DEFAULT_CACHE_SIZE,
+                 governor=None, token_pool=None):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, timeout)
+        self.session = requests.Session()
+        self.session.headers["Connection"] = "keep-alive"
+        if headers:
+            self.session.headers.update(headers)
+
+        # GAUTO_CASSETTE_RECORD / GAUTO_CASSETTE_REPLAY swap in a recording or replaying transport
+        pool_kwargs = {"pool_connections": pool_size, "pool_maxsize": pool_size, "pool_block": True}
+        self.adapter = None
+        self.mount(adapter_from_env(**pool_kwargs) or HTTPAdapter(**pool_kwargs))
+
+        # Every request waits on the rate-limit governor and feeds its headers back
+        self.governor = governor or RateLimitGovernor()
+
+        # With a token pool, each request is sent with the token that has the most
+        # budget left (overriding the caller's Authorization header), and that
+        # token's own governor is used instead
+        self.token_pool = token_pool
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._status_counts = {}
+
+        # (url, params, Accept, Authorization, parse) -> last 200 response carrying an ETag or Last-Modified header
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+    # Send a request through the pooled session; a per-request timeout can be passed in.
+    # GET requests are sent as conditional requests when we hold a cached copy.
+    # With `parse`, a 200 body is streamed into parse(response) and only the result
+    # is kept (as response.parsed, also in the cache) instead of the raw body.
+    def request(self, method, url, timeout=None, conditional=True, parse=None, **kwargs):
+        if parse:
+            kwargs["stream"] = True
+        use_cache = conditional and method == "GET" and self.cache_size > 0
+        # Parsed and raw copies are cached apart: a parsed entry has no body and a raw one no parsed result
+        key = self._cache_key(url, kwargs) + (parse,) if use_cache else None
+        cached = self._cache_lookup(key) if use_cache else None
+
+        if cached is not None:
+            headers = dict(kwargs.pop("headers", None) or {})
+            if cached.headers.get("ETag"):
+                headers["If-None-Match"] = cached.headers["ETag"]
+            if cached.headers.get("Last-Modified"):
+                headers["If-Modified-Since"] = cached.headers["Last-Modified"]
+            kwargs["headers"] = headers
+
+        response = self._send(method, url, timeout or self.timeout, **kwargs)
+        if parse:
+            self._parse_body(response, parse)
+
+        if not use_cache:
+            return response
+
+        # 304 Not Modified: serve the cached body (GitHub does not charge rate limit for these)
+        if response.status_code == 304 and cached is not None:
+            with self._lock:
+                self._cache_hits += 1
+            hit = copy.copy(cached)
+            hit.headers = copy.copy(cached.headers)
+            hit.headers.update(response.headers)
+            hit.from_cache = True
+            if parse:
+                hit.parsed = cached.parsed
+            return hit
+
+        with self._lock:
+            self._cache_misses += 1
+        if response.status_code == 200 and ("ETag" in response.headers or "Last-Modified" in response.headers):
+            if not parse:
+                response.content  # read the body now so the cached copy can be served later
+            self._cache_store(key, response)
+        return response
+
+    def _parse_body(self, response, parse):
+        response.parsed = None
+        if response.status_code != 200:
+            response.content  # errors are small; keep them readable as response.text
+            return
+        try:
+            response.parsed = parse(response)
+        finally:
+            response.close()  # returns the connection to the pool (drops it if parsing failed)
+
+    # Send through the governor, retrying 403/429 rate-limit responses after the advertised
+    # wait (with a token pool, first on the other tokens, without waiting)
+    def _send(self, method, url, timeout, **kwargs):
+        resource = resource_for_url(url)
+        attempt = 0
+        limited = []
+        while True:
+            credential = self.token_pool.choose(resource, exclude=limited) if self.token_pool else None
+            governor = credential.governor if credential else self.governor
+            if credential:
+                kwargs["headers"] = dict(kwargs.get("headers") or {}, Authorization=credential.authorization())
+
+            governor.acquire(resource)
+            started = time.monotonic()
+            response = self.session.request(method, url, timeout=timeout, **kwargs)
+            metrics.observe("gauto_http_request_seconds", time.monotonic() - started,
+                            {"method": method, "resource": resource})
+            governor.update(response, resource)
+            with self._lock:
+                self._requests += 1
+                self._status_counts[response.status_code] = self._status_counts.get(response.status_code, 0) + 1
+
+            delay = governor.retry_delay(response, attempt)
+            if delay is None:
+                return response
+            response.close()
+            if credential and len(limited) + 1 < len(self.token_pool):
+                limited.append(credential)
+                print(f"Rate limited ({response.status_code}) on token {credential.name}; trying another token")
+                continue
+            print(f"Rate limited ({response.status_code}) on {method} {url}; retrying in {delay:.0f} seconds...")
+            governor.wait_before_retry(delay)
+            limited = []
+            attempt += 1
+
+    # Cache key: the URL plus anything that changes the representation we get back
+    def _cache_key(self, url, kwargs):
+        params = kwargs.get("params") or {}
+        if isinstance(params, dict):
+            params = sorted(params.items())
+        headers = kwargs.get("headers") or {}
+        return (url, tuple(params), headers.get("Accept"), headers.get("Authorization"))
+
+    def _cache_lookup(self, key):
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+            return cached
+
+    def _cache_store(self, key, response):
+        with self._lock:
+            self._cache[key] = response
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    # Function to switch the transport adapter (e.g. a cassette); returns the previous one
+    def mount(self, adapter):
+        previous = self.adapter
+        self.adapter = adapter
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        return previous
+
+    # Number of TCP connections opened so far, summed over every host pool
+    def _connections_opened(self):
+        pools = self.adapter.poolmanager.pools
+        opened = 0
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+        return opened
+
+    # Snapshot of request and connection reuse counters
+    def stats(self):
+        with self._lock:
+            requests_sent = self._requests
+            status_counts = dict(self._status_counts)
+            cache_hits = self._cache_hits
+            cache_misses = self._cache_misses
+        opened = self._connections_opened()
+        lookups = cache_hits + cache_misses
+        return {
+            "requests": requests_sent,
+            "connections_opened": opened,
+            "connections_reused": max(requests_sent - opened, 0),
+            "status_counts": status_counts,
+            "cache_hits": cache_hits,
+            "cache_misses": cache_misses,
+            "cache_hit_ratio": round(cache_hits / lookups, 3) if lookups else 0.0,
+            "rate_limit": self.token_pool.stats() if self.token_pool else self.governor.stats(),
+        }
+
+    # The counters above as metric samples (see metrics.add_collector)
+    def metric_samples(self):
+        stats = self.stats()
+        rate_limit = stats["rate_limit"]
+        samples = [
+            ("gauto_http_requests_total", "counter", {}, stats["requests"]),
+            ("gauto_http_connections_opened", "gauge", {}, stats["connections_opened"]),
+            ("gauto_http_cache_hits_total", "counter", {}, stats["cache_hits"]),
+            ("gauto_http_cache_misses_total", "counter", {}, stats["cache_misses"]),
+            ("gauto_rate_limit_retries_total", "counter", {}, rate_limit["retries"]),
+            ("gauto_rate_limit_waited_seconds_total", "counter", {}, rate_limit["waited"]),
+        ]
+        for status, count in sorted(stats["status_counts"].items()):
+            samples.append(("gauto_http_responses_total", "counter", {"status": str(status)}, count))
+        for resource, budget in sorted(rate_limit["budget"].items()):
+            if budget["remaining"] is not None:
+                samples.append(("gauto_rate_limit_remaining", "gauge", {"resource": resource}, budget["remaining"]))
+            if budget["limit"] is not None:
+                samples.append(("gauto_rate_limit_limit", "gauge", {"resource": resource}, budget["limit"]))
+        for token in rate_limit.get("tokens", []):
+            samples.append(("gauto_token_requests_total", "counter", {"token": token["name"]}, token["requests"]))
+            for resource, budget in sorted(token["budget"].items()):
+                if budget["remaining"] is not None:
+                    samples.append(("gauto_token_rate_limit_remaining", "gauge",
+                                    {"token": token["name"], "resource": resource}, budget["remaining"]))
+        return samples
+
+    # Remaining rate-limit budget per resource (core, graphql, search)
+    def rate_limit_budget(self):
+        return self.token_pool.budget() if self.token_pool else self.governor.budget()
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+# Function to get the process-wide shared client
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GitHubClient(token_pool=TokenPool.from_env())
+            metrics.add_collector(_client.metric_samples)
+        return _client
@@ -0,0 +1,209 @@
+import os
+
+from check_records import CheckRun, PullRequestStatus
+from github_client import get_client
+
+# GitHub GraphQL endpoint
+GITHUB_GRAPHQL_URL = os.getenv("GITHUB_GRAPHQL_URL", "https://api.github.com/graphql")
+
+# Pull requests per GraphQL request (each one is an aliased field in the query)
+DEFAULT_BATCH_SIZE = 25
+
+# Check contexts fetched per pull request
+CONTEXTS_PER_PR = 100
+
+# Fields of one check run / legacy status context
+CONTEXT_FIELDS = """
+                  __typename
+                  ... on CheckRun {
+                    databaseId
+                    name
+                    status
+                    conclusion
+                    startedAt
+                    completedAt
+                    checkSuite { databaseId }
+                  }
+                  ... on StatusContext {
+                    context
+                    state
+                  }
+"""
+
+# Fields fetched for every pull request: head SHA, mergeable state and the
+# first page of check runs / legacy status contexts on the head commit
+PR_FIELDS = """
+      number
+      state
+      mergeable
+      headRefOid
+      commits(last: 1) {
+        nodes {
+          commit {
+            oid
+            statusCheckRollup {
+              state
+              contexts(first: %d) {
+                totalCount
+                pageInfo { hasNextPage endCursor }
+                nodes {""" + CONTEXT_FIELDS.replace("%", "%%") + """                }
+              }
+            }
+          }
+        }
+      }
+"""
+
+# Next page of contexts for one pull request whose first page was not enough
+CONTEXTS_PAGE_QUERY = """query($owner: String!, $name: String!, $number: Int!, $after: String!) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      commits(last: 1) {
+        nodes {
+          commit {
+            statusCheckRollup {
+              contexts(first: %d, after: $after) {
+                pageInfo { hasNextPage endCursor }
+                nodes {""" + CONTEXT_FIELDS.replace("%", "%%") + """                }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+# Legacy commit status state -> (check run status, conclusion)
+STATUS_CONTEXT_STATES = {
+    "SUCCESS": ("completed", "success"),
+    "FAILURE": ("completed", "failure"),
+    "ERROR": ("completed", "failure"),
+    "PENDING": ("pending", None),
+    "EXPECTED": ("pending", None),
+}
+
+
+# Function to build one query that fetches many pull requests using aliases (pr0, pr1, ...)
+def build_status_query(pr_numbers, contexts_per_pr=CONTEXTS_PER_PR):
+    fields = PR_FIELDS % contexts_per_pr
+    aliases = "".join(
+        f"\n    pr{i}: pullRequest(number: {int(number)}) {{{fields}    }}"
+        for i, number in enumerate(pr_numbers)
+    )
+    return (
+        "query($owner: String!, $name: String!) {\n"
+        "  repository(owner: $owner, name: $name) {"
+        f"{aliases}\n"
+        "  }\n"
+        "}\n"
+    )
+
+
+# Function to turn a statusCheckRollup context into a CheckRun record, so the
+# existing gate code (name / status / conclusion) works unchanged
+def normalize_context(node):
+    if node.get("__typename") == "StatusContext":
+        status, conclusion = STATUS_CONTEXT_STATES.get(node.get("state"), ("pending", None))
+        return CheckRun(node.get("context"), status, conclusion, source="status")
+
+    suite = node.get("checkSuite") or {}
+    return CheckRun(node.get("name"), (node.get("status") or "").lower(),
+                    (node.get("conclusion") or "").lower() or None, node.get("databaseId"),
+                    node.get("startedAt"), node.get("completedAt"), suite.get("databaseId"))
+
+
+def _head_commit(node):
+    commits = ((node.get("commits") or {}).get("nodes") or [])
+    return commits[0]["commit"] if commits else {}
+
+
+# Function to read the end cursor of a pullRequest result's contexts page (None on the last page)
+def _next_cursor(node):
+    contexts = (_head_commit(node).get("statusCheckRollup") or {}).get("contexts") or {}
+    page_info = contexts.get("pageInfo") or {}
+    return page_info.get("endCursor") if page_info.get("hasNextPage") else None
+
+
+# Function to flatten one aliased pullRequest result
+def parse_pull_request(node):
+    commit = _head_commit(node)
+    rollup = commit.get("statusCheckRollup") or {}
+    contexts = rollup.get("contexts") or {}
+    check_runs = [normalize_context(ctx) for ctx in contexts.get("nodes") or []]
+
+    return PullRequestStatus(
+        node.get("number"),
+        node.get("state"),
+        node.get("mergeable"),
+        node.get("headRefOid") or commit.get("oid"),
+        rollup.get("state"),
+        check_runs,
+        contexts.get("totalCount", 0) > len(check_runs),
+    )
+
+
+# Function to read the contexts after `cursor` for one pull request, page by page, into
+# `status.check_runs`; contexts_truncated stays set if a page cannot be read
+def fetch_remaining_contexts(owner, repo, status, cursor, headers, client, graphql_url,
+                             contexts_per_pr=CONTEXTS_PER_PR):
+    if not cursor:
+        return status
+    while cursor:
+        payload = {
+            "query": CONTEXTS_PAGE_QUERY % contexts_per_pr,
+            "variables": {"owner": owner, "name": repo, "number": status.number, "after": cursor},
+        }
+        response = client.post(graphql_url, headers=headers, json=payload)
+        if response.status_code != 200:
+            print(f"Error fetching check contexts of PR #{status.number}: {response.status_code}, {response.text}")
+            return status
+        data = response.json()
+        for error in data.get("errors") or []:
+            print(f"GraphQL error: {error.get('message')}")
+        node = ((data.get("data") or {}).get("repository") or {}).get("pullRequest")
+        if not node:
+            return status
+        contexts = (_head_commit(node).get("statusCheckRollup") or {}).get("contexts") or {}
+        status.check_runs.extend(normalize_context(ctx) for ctx in contexts.get("nodes") or [])
+        cursor = _next_cursor(node)
+    status.contexts_truncated = False
+    return status
+
+
+# Function to fetch the status of many pull requests with one GraphQL request per batch.
+# PRs with more contexts than one page holds get follow-up requests for the rest.
+# Returns {pr_number: status dict}; pull requests that could not be read are left out.
+def fetch_pr_statuses(owner, repo, pr_numbers, headers, batch_size=DEFAULT_BATCH_SIZE,
+                      client=None, graphql_url=None):
+    client = client or get_client()
+    graphql_url = graphql_url or GITHUB_GRAPHQL_URL
+    pr_numbers = list(pr_numbers)
+    statuses = {}
+
+    for start in range(0, len(pr_numbers), batch_size):
+        batch = pr_numbers[start:start + batch_size]
+        payload = {
+            "query": build_status_query(batch),
+            "variables": {"owner": owner, "name": repo},
+        }
+        response = client.post(graphql_url, headers=headers, json=payload)
+
+        if response.status_code != 200:
+            print(f"Error fetching PR statuses: {response.status_code}, {response.text}")
+            continue
+
+        data = response.json()
+        for error in data.get("errors") or []:
+            print(f"GraphQL error: {error.get('message')}")
+
+        repository = (data.get("data") or {}).get("repository") or {}
+        for i, number in enumerate(batch):
+            node = repository.get(f"pr{i}")
+            if node:
+                status = statuses[number] = parse_pull_request(node)
+                if status.contexts_truncated:
+                    fetch_remaining_contexts(owner, repo, status, _next_cursor(node), headers, client, graphql_url)
+
+    return statuses
@@ -0,0 +1,111 @@
+import codecs
+import json
+import re
+
+# Incremental parsing of large JSON objects such as a `/check-runs` page.
+#
+# The body is read chunk by chunk and the items of one top-level array are
+# decoded one at a time with the stdlib decoder (JSONDecoder.raw_decode) and
+# handed to a converter, so only the current item and the unread part of the
+# buffer are in memory instead of the whole body plus its decoded tree.
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+_decoder = json.JSONDecoder()
+
+
+# Buffer over an iterable of byte chunks, refilled on demand
+class _ChunkReader:
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    # Function to append the next chunk (dropping what was already parsed); False at the end
+    def fill(self):
+        if self.pos:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        for chunk in self._chunks:
+            text = self._utf8.decode(chunk)
+            if text:
+                self.buffer += text
+                return True
+        self.buffer += self._utf8.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    # Function to skip whitespace; returns the next character (None at the end of input)
+    def peek(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof or not self.fill():
+                return None
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.buffer, self.pos)
+        self.pos += 1
+
+    # Function to decode the next complete value, reading more input until it is whole
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof or not self.fill():
+                    raise
+                continue
+            # A number cut at the end of the buffer ("12" of "12.5e3") decodes too: read on
+            if (isinstance(value, (int, float)) and not self.eof
+                    and (end == len(self.buffer) or self.buffer[end] in _NUMBER_CHARS) and self.fill()):
+                continue
+            self.pos = end
+            return value
+
+
+# Function to parse a JSON object from byte chunks, passing every item of the
+# top-level `array_key` array through `convert` as soon as it is decoded.
+# Returns the object with the converted list in place of the array.
+def parse_object(chunks, array_key, convert=None):
+    reader = _ChunkReader(chunks)
+    result = {}
+    reader.expect("{")
+    if reader.peek() == "}":
+        return result
+
+    while True:
+        name = reader.value()
+        reader.expect(":")
+        if name == array_key and reader.peek() == "[":
+            reader.pos += 1
+            items = []
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    item = reader.value()
+                    items.append(convert(item) if convert else item)
+                    char = reader.peek()
+                    reader.pos += 1
+                    if char == "]":
+                        break
+                    if char != ",":
+                        raise json.JSONDecodeError("Expecting ',' or ']'", reader.buffer, reader.pos - 1)
+            result[name] = items
+        else:
+            result[name] = reader.value()
+
+        char = reader.peek()
+        reader.pos += 1
+        if char == "}":
+            if reader.peek() is not None:
+                raise json.JSONDecodeError("Extra data", reader.buffer, reader.pos)
+            return result
+        if char != ",":
+            raise json.JSONDecodeError("Expecting ',' or '}'", reader.buffer, reader.pos - 1)
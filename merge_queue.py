@@ -0,0 +1,282 @@
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import test2
+from async_runner import parse_branch_pair, read_branch_pairs
+from multi_repo import parse_repo
+from policy import MERGE, WAIT
+from polling import PollScheduler
+from preflight import MISSING
+from state_store import DEFAULT_STATE_DB, StateStore
+from test2 import (
+    CHECKS_DEADLINE,
+    HEADERS,
+    REPO_NAME,
+    REPO_OWNER,
+    client,
+    merge_if_checks_passed,
+    preflight_targets,
+    resume_or_create_pull_request,
+    wait_for_check_decision,
+)
+
+# How many queued PRs are tested together in one speculative batch
+DEFAULT_QUEUE_BATCH_SIZE = int(os.getenv("GAUTO_QUEUE_BATCH_SIZE", "4"))
+
+# Temporary batch branches are created under this prefix (CI must run on push
+# to these branches, e.g. `on: push: branches: ["gauto-queue/**"]`)
+QUEUE_BRANCH_PREFIX = os.getenv("GAUTO_QUEUE_PREFIX", "gauto-queue")
+
+
+# Function to build a repository API URL (read at call time so GITHUB_API_URL can be swapped)
+def _repo_url(path, owner=REPO_OWNER, repo=REPO_NAME):
+    return f"{test2.GITHUB_API_URL}/repos/{owner}/{repo}/{path}"
+
+
+# Function to get the commit SHA a branch points at
+def get_branch_sha(branch, owner=REPO_OWNER, repo=REPO_NAME):
+    response = client.get(_repo_url(f"git/ref/heads/{branch}", owner, repo), headers=HEADERS)
+    if response.status_code == 200:
+        return response.json()["object"]["sha"]
+    print(f"Error reading branch '{branch}': {response.status_code}, {response.text}")
+    return None
+
+
+# Function to create a branch pointing at `sha`
+def create_branch(branch, sha, owner=REPO_OWNER, repo=REPO_NAME):
+    response = client.post(_repo_url("git/refs", owner, repo), headers=HEADERS,
+                           json={"ref": f"refs/heads/{branch}", "sha": sha})
+    if response.status_code == 201:
+        return True
+    print(f"Error creating branch '{branch}': {response.status_code}, {response.text}")
+    return False
+
+
+def delete_branch(branch, owner=REPO_OWNER, repo=REPO_NAME):
+    response = client.delete(_repo_url(f"git/refs/heads/{branch}", owner, repo), headers=HEADERS)
+    if response.status_code not in (204, 422):
+        print(f"Error deleting branch '{branch}': {response.status_code}, {response.text}")
+
+
+# Function to merge `head` (branch or SHA) into `branch` with the merges API.
+# Returns (new sha, conflict): new sha is None when there was nothing to merge.
+def merge_into_branch(branch, head, owner=REPO_OWNER, repo=REPO_NAME):
+    payload = {"base": branch, "head": head, "commit_message": f"Merge queue: test {head} on {branch}"}
+    response = client.post(_repo_url("merges", owner, repo), headers=HEADERS, json=payload)
+    if response.status_code == 201:
+        return response.json()["sha"], False
+    if response.status_code == 204:
+        return None, False
+    if response.status_code != 409:
+        print(f"Error merging '{head}' into '{branch}': {response.status_code}, {response.text}")
+    return None, True
+
+
+# Merge queue for one repository (owner/repo): PRs are queued per base branch in arrival order and tested in
+# batches on a temporary branch (base + every head in the batch). A green
+# batch is merged as a whole; a red batch is split in half until the failing
+# PR is found, so N green PRs cost about N / batch_size CI runs instead of N.
+class MergeQueue:
+    def __init__(self, batch_size=DEFAULT_QUEUE_BATCH_SIZE, deadline=CHECKS_DEADLINE, store=None,
+                 min_interval=None, max_interval=None, owner=REPO_OWNER, repo=REPO_NAME):
+        self.owner = owner
+        self.repo = repo
+        self.batch_size = max(batch_size, 1)
+        self.deadline = deadline
+        self.store = store
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.queues = {}   # base branch -> list of queued entries, oldest first
+        self.results = []  # one result dict per PR (same shape as AsyncPipeline results)
+        self.stats = {"batches": 0, "bisections": 0, "conflicts": 0}
+        self._lock = threading.Lock()
+        self._batch_ids = 0
+        self.run_id = int(time.time())  # temporary branch names are unique per run and batch
+
+    # Function to add a PR to the queue of its base branch
+    def enqueue(self, pr_number, head_branch, base_branch, head_sha=None):
+        entry = {"number": pr_number, "branch": head_branch, "base": base_branch, "sha": head_sha,
+                 "queued_at": time.monotonic(), "requeued": False}
+        with self._lock:
+            self.queues.setdefault(base_branch, []).append(entry)
+
+    # Drain every base branch's queue; different base branches are processed in parallel
+    def run(self):
+        with self._lock:
+            bases = list(self.queues)
+        if bases:
+            with ThreadPoolExecutor(max_workers=len(bases)) as pool:
+                list(pool.map(self.process_base, bases))
+        return self.results
+
+    def process_base(self, base_branch):
+        queue = self.queues[base_branch]
+        while True:
+            with self._lock:
+                batch = queue[:self.batch_size]
+                del queue[:self.batch_size]
+            if not batch:
+                return
+            self._land(base_branch, batch)
+
+    def _land(self, base_branch, batch):
+        decision, batch, base_sha = self._test_batch(base_branch, batch)
+        if not batch:
+            return
+
+        if decision.state == MERGE:
+            current = get_branch_sha(base_branch, self.owner, self.repo)
+            if current != base_sha:
+                # The base moved while the batch was tested: what passed is not what would land
+                print(f"'{base_branch}' moved from {base_sha} to {current} during the batch run; re-queued")
+                with self._lock:
+                    self.queues[base_branch][:0] = batch
+                return
+            for entry in batch:
+                # The merge is refused if the PR head moved past the tested commit
+                self._finish(entry, merge_if_checks_passed(entry["number"], decision, self.store,
+                                                           self.owner, self.repo, entry["sha"]))
+        elif decision.state == WAIT or len(batch) == 1:
+            # Timed out (not attributable to one PR) or a single PR that failed
+            for entry in batch:
+                print(f"PR #{entry['number']} removed from the merge queue: {decision.reason}")
+                self._finish(entry, False)
+        else:
+            with self._lock:
+                self.stats["bisections"] += 1
+            middle = len(batch) // 2
+            print(f"Batch of {len(batch)} PR(s) for '{base_branch}' failed ({decision.reason}); bisecting")
+            self._land(base_branch, batch[:middle])
+            self._land(base_branch, batch[middle:])
+
+    # Function to build base + batch heads on a temporary branch and wait for its
+    # checks; PRs that do not merge cleanly are dropped from the returned batch.
+    # Returns (decision, tested PRs, base commit they were tested on).
+    def _test_batch(self, base_branch, batch):
+        base_sha = get_branch_sha(base_branch, self.owner, self.repo)
+        if base_sha is None:
+            for entry in batch:
+                self._finish(entry, False)
+            return None, [], None
+
+        with self._lock:
+            self._batch_ids += 1
+            self.stats["batches"] += 1
+            temp_branch = f"{QUEUE_BRANCH_PREFIX}/{base_branch}/{self.run_id}-{self._batch_ids}"
+        if not create_branch(temp_branch, base_sha, self.owner, self.repo):
+            for entry in batch:
+                self._finish(entry, False)
+            return None, [], None
+
+        try:
+            included = []
+            sha = base_sha
+            for entry in batch:
+                merged_sha, conflict = merge_into_branch(temp_branch, entry["sha"] or entry["branch"],
+                                                         self.owner, self.repo)
+                if conflict:
+                    self._on_conflict(base_branch, entry, bool(included))
+                    continue
+                sha = merged_sha or sha
+                included.append(entry)
+            if not included:
+                return None, [], None
+
+            numbers = ", ".join(f"#{entry['number']}" for entry in included)
+            print(f"Testing PR(s) {numbers} on '{temp_branch}' (commit {sha})")
+            with metrics.span("merge_queue_batch", base=base_branch, prs=numbers, size=len(included)):
+                return wait_for_check_decision(sha, base_branch, self._new_scheduler(), self.store,
+                                               self.owner, self.repo), included, base_sha
+        finally:
+            delete_branch(temp_branch, self.owner, self.repo)
+
+    # A PR that conflicts with earlier PRs in its batch gets one more try at the
+    # back of the queue; one that conflicts with the base branch itself is dropped
+    def _on_conflict(self, base_branch, entry, after_others):
+        with self._lock:
+            self.stats["conflicts"] += 1
+            if after_others and not entry["requeued"]:
+                entry["requeued"] = True
+                self.queues[base_branch].append(entry)
+                print(f"PR #{entry['number']} conflicts with its batch; re-queued")
+                return
+        print(f"PR #{entry['number']} does not merge cleanly into '{base_branch}'; removed from the merge queue")
+        self._finish(entry, False)
+
+    def _new_scheduler(self):
+        kwargs = {"deadline": self.deadline}
+        if self.min_interval is not None:
+            kwargs["min_interval"] = self.min_interval
+        if self.max_interval is not None:
+            kwargs["max_interval"] = self.max_interval
+        return PollScheduler(**kwargs)
+
+    def _finish(self, entry, merged):
+        if merged:
+            metrics.observe("gauto_time_to_merge_seconds", time.monotonic() - entry["queued_at"])
+        result = {"repo": f"{self.owner}/{self.repo}", "branch": entry["branch"], "originalBranch": entry["base"], "pr_number": entry["number"],
+                  "merged": bool(merged), "elapsed": round(time.monotonic() - entry["queued_at"], 2)}
+        with self._lock:
+            self.results.append(result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create PRs and land them through a batched merge queue.")
+    parser.add_argument("pairs", nargs="*", type=parse_branch_pair, help="branch:originalBranch pairs")
+    parser.add_argument("--file", help="file with one 'branch originalBranch' pair per line")
+    parser.add_argument("--repo", type=parse_repo, default=(REPO_OWNER, REPO_NAME),
+                        help=f"owner/repo whose PRs are queued (default: {REPO_OWNER}/{REPO_NAME})")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_QUEUE_BATCH_SIZE, help="PRs tested per batch")
+    parser.add_argument("--wait-timeout", type=float, default=CHECKS_DEADLINE)
+    parser.add_argument("--state-db", default=DEFAULT_STATE_DB, help="SQLite file used to resume PRs across runs")
+    parser.add_argument("--no-preflight", action="store_true", help="skip the compare-API check for no-op branches")
+    args = parser.parse_args(argv)
+    metrics.setup_from_env()
+
+    pairs = list(args.pairs)
+    if args.file:
+        pairs.extend(read_branch_pairs(args.file))
+    if not pairs and os.getenv('branch') and os.getenv('originalBranch'):
+        pairs.append((os.getenv('branch'), os.getenv('originalBranch')))
+    if not pairs:
+        parser.error("no branch pairs given (use arguments, --file, or the 'branch'/'originalBranch' env vars)")
+
+    store = StateStore(args.state_db)
+    owner, repo = args.repo
+    queue = MergeQueue(args.batch_size, args.wait_timeout, store, owner=owner, repo=repo)
+    started = time.monotonic()
+    preflight = []
+    if not args.no_preflight:
+        targets, preflight = preflight_targets([(owner, repo, head, base) for head, base in pairs], store)
+        pairs = [(target[2], target[3]) for target in targets]
+    missing = sum(result["status"] == MISSING for result in preflight)
+    already_merged = []
+    for head_branch, base_branch in pairs:
+        pr_number, commit_sha = resume_or_create_pull_request(head_branch, base_branch, store, owner, repo)
+        if pr_number and commit_sha:
+            queue.enqueue(pr_number, head_branch, base_branch, commit_sha)
+        elif pr_number:
+            already_merged.append({"repo": f"{owner}/{repo}", "branch": head_branch, "originalBranch": base_branch,
+                                   "pr_number": pr_number, "merged": True, "elapsed": 0.0})
+    results = already_merged + queue.run()
+
+    print("\nSummary:")
+    for result in results:
+        state = "merged" if result["merged"] else "not merged"
+        print(f"- {result['branch']} -> {result['originalBranch']}: PR #{result['pr_number']} {state} ({result['elapsed']}s)")
+    print(f"Merge queue: {queue.stats['batches']} batch run(s), {queue.stats['bisections']} bisection(s), "
+          f"{queue.stats['conflicts']} conflict(s)")
+    if preflight:
+        print(f"Pre-flight skipped {len(preflight) - len(pairs)} of {len(preflight)} branch pair(s)")
+    print(f"Processed {len(pairs)} branch pair(s) in {time.monotonic() - started:.1f}s")
+    print(f"HTTP client stats: {client.stats()}")
+
+    return 0 if not missing and all(r["merged"] for r in results) and len(results) == len(pairs) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
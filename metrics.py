@@ -0,0 +1,342 @@
+import atexit
+import contextlib
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Serve Prometheus text on http://127.0.0.1:$GAUTO_METRICS_PORT/metrics (off when unset)
+METRICS_PORT = os.getenv("GAUTO_METRICS_PORT")
+
+# Append finished spans and a final metrics snapshot to this JSONL file (off when unset)
+METRICS_JSONL = os.getenv("GAUTO_METRICS_JSONL")
+
+# Histogram buckets (seconds): from one fast API call up to a long CI run
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+HELP = {
+    "gauto_http_request_seconds": "Latency of GitHub API requests",
+    "gauto_stage_seconds": "Time spent in each stage of the PR lifecycle",
+    "gauto_calls_total": "Calls of each stage by outcome",
+    "gauto_time_to_merge_seconds": "Time from starting on a PR until it was merged",
+}
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    # Cumulative (bound, count) pairs as Prometheus expects, ending with +Inf
+    def cumulative(self):
+        return list(zip(self.buckets, itertools.accumulate(self.counts))) + [("+Inf", self.count)]
+
+
+def _label_key(labels):
+    return tuple(sorted((labels or {}).items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+# Counters and histograms keyed by (name, labels), plus collectors that report
+# gauges/counters kept elsewhere (e.g. the HTTP client's own stats) at export time
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None, buckets=DEFAULT_BUCKETS):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    # `collector()` returns (name, "counter" | "gauge", labels, value) samples
+    def add_collector(self, collector):
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def _collected(self):
+        with self._lock:
+            collectors = list(self._collectors)
+        samples = []
+        for collector in collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+        return samples
+
+    def snapshot(self):
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in self._counters.items()]
+            histograms = [{"name": name, "labels": dict(labels), "count": h.count, "sum": round(h.sum, 4),
+                           "buckets": {str(bound): count for bound, count in h.cumulative()}}
+                          for (name, labels), h in self._histograms.items()]
+        gauges = [{"name": name, "type": kind, "labels": labels or {}, "value": value}
+                  for name, kind, labels, value in self._collected()]
+        return {"counters": counters, "histograms": histograms, "collected": gauges}
+
+    def prometheus_text(self):
+        families = {}  # name -> (type, [lines])
+
+        def family(name, kind):
+            return families.setdefault(name, (kind, []))[1]
+
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                family(name, "counter").append(f"{name}{_format_labels(labels)} {value}")
+            for (name, labels), h in sorted(self._histograms.items()):
+                lines = family(name, "histogram")
+                for bound, count in h.cumulative():
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {h.sum:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {h.count}")
+        for name, kind, labels, value in self._collected():
+            family(name, kind).append(f"{name}{_format_labels(_label_key(labels))} {value}")
+
+        out = []
+        for name, (kind, lines) in families.items():
+            if name in HELP:
+                out.append(f"# HELP {name} {HELP[name]}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def inc(name, labels=None, value=1):
+    REGISTRY.inc(name, labels, value)
+
+
+def observe(name, value, labels=None, buckets=DEFAULT_BUCKETS):
+    REGISTRY.observe(name, value, labels, buckets)
+
+
+def add_collector(collector):
+    REGISTRY.add_collector(collector)
+
+
+# --- spans ----------------------------------------------------------------
+
+# One timed stage (create PR, poll, wait for checks, merge, ...). Hooks added
+# with add_span_hook(hook) are called as hook("start", span) and hook("end", span).
+class Span:
+    __slots__ = ("id", "name", "attrs", "parent_id", "started", "ended", "error")
+
+    def __init__(self, span_id, name, attrs, parent_id):
+        self.id = span_id
+        self.name = name
+        self.attrs = attrs
+        self.parent_id = parent_id
+        self.started = time.time()
+        self.ended = None
+        self.error = None
+
+    @property
+    def duration(self):
+        return (self.ended or time.time()) - self.started
+
+    def to_dict(self):
+        return {"id": self.id, "name": self.name, "parent_id": self.parent_id, "attrs": self.attrs,
+                "started": round(self.started, 3), "duration": round(self.duration, 4), "error": self.error}
+
+
+_span_ids = itertools.count(1)
+_current_span = contextvars.ContextVar("gauto_current_span", default=None)
+_span_hooks = []
+_active_spans = {}
+_spans_lock = threading.Lock()
+
+
+def add_span_hook(hook):
+    _span_hooks.append(hook)
+
+
+def remove_span_hook(hook):
+    if hook in _span_hooks:
+        _span_hooks.remove(hook)
+
+
+def _call_hooks(event, span):
+    for hook in list(_span_hooks):
+        try:
+            hook(event, span)
+        except Exception as e:
+            print(f"Error in span hook: {e}")
+
+
+# Context manager timing one stage; nested spans (also across asyncio tasks and
+# asyncio.to_thread) record their parent, and the duration goes to gauto_stage_seconds
+@contextlib.contextmanager
+def span(name, **attrs):
+    parent = _current_span.get()
+    current = Span(next(_span_ids), name, attrs, parent.id if parent else None)
+    token = _current_span.set(current)
+    with _spans_lock:
+        _active_spans[current.id] = current
+    _call_hooks("start", current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = repr(e)
+        raise
+    finally:
+        current.ended = time.time()
+        _current_span.reset(token)
+        with _spans_lock:
+            _active_spans.pop(current.id, None)
+        observe("gauto_stage_seconds", current.duration, {"stage": name})
+        _call_hooks("end", current)
+
+
+# Spans that have started but not finished, oldest first (where slow PRs are stuck)
+def active_spans():
+    with _spans_lock:
+        spans = sorted(_active_spans.values(), key=lambda s: s.started)
+    return [s.to_dict() for s in spans]
+
+
+def _active_span_samples():
+    counts = {}
+    for s in active_spans():
+        counts[s["name"]] = counts.get(s["name"], 0) + 1
+    return [("gauto_active_spans", "gauge", {"stage": name}, count) for name, count in counts.items()]
+
+
+REGISTRY.add_collector(_active_span_samples)
+
+
+# Decorator: run the function inside span(stage) and count its calls by outcome.
+# `success(result)` decides whether a returned result counts as "ok" or "failed".
+def traced(stage, success=None):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            outcome = "error"
+            try:
+                with span(stage) as current:
+                    result = func(*args, **kwargs)
+                    outcome = "ok" if success is None or success(result) else "failed"
+                    current.attrs["outcome"] = outcome
+                return result
+            finally:
+                inc("gauto_calls_total", {"stage": stage, "outcome": outcome})
+        return wrapper
+    return decorator
+
+
+# --- exporters ------------------------------------------------------------
+
+# Span hook that appends every finished span to a JSONL file; close() adds a
+# final {"type": "metrics", ...} line with the registry snapshot
+class JsonlExporter:
+    def __init__(self, path, registry=REGISTRY):
+        self.path = path
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1)
+
+    def _write(self, record):
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(json.dumps(record, default=str) + "\n")
+
+    def __call__(self, event, span):
+        if event == "end":
+            self._write(dict(span.to_dict(), type="span"))
+
+    def write_snapshot(self):
+        self._write(dict(self.registry.snapshot(), type="metrics", time=round(time.time(), 3)))
+
+    def close(self):
+        self.write_snapshot()
+        with self._lock:
+            self._file.close()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/metrics"):
+            body = self.registry.prometheus_text().encode()
+            content_type = "text/plain; version=0.0.4"
+        elif self.path.startswith("/spans"):
+            body = json.dumps(active_spans(), indent=2).encode()
+            content_type = "application/json"
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# Function to serve /metrics (Prometheus text) and /spans (active spans as JSON) in a background thread
+def start_metrics_server(port, host="127.0.0.1", registry=REGISTRY):
+    handler = type("BoundMetricsHandler", (MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, int(port)), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+_configured = False
+
+
+# Function to turn on the exporters selected by GAUTO_METRICS_PORT / GAUTO_METRICS_JSONL
+def setup_from_env():
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    if METRICS_PORT:
+        server = start_metrics_server(METRICS_PORT)
+        print(f"Metrics on http://127.0.0.1:{server.server_port}/metrics")
+    if METRICS_JSONL:
+        exporter = JsonlExporter(METRICS_JSONL)
+        add_span_hook(exporter)
+        atexit.register(exporter.close)
@@ -0,0 +1,194 @@
+import argparse
+import asyncio
+import os
+import time
+from collections import deque
+
+import metrics
+import test2
+from async_runner import DEFAULT_MAX_IN_FLIGHT, DEFAULT_WAIT_TIMEOUT, AsyncPipeline
+from graphql_status import DEFAULT_BATCH_SIZE
+from preflight import MISSING
+from state_store import DEFAULT_STATE_DB, StateStore
+from test2 import preflight_targets
+
+# How many PRs may be between "create" and "merged" at once, over all repositories
+DEFAULT_WORKERS = int(os.getenv("GAUTO_WORKERS", "32"))
+
+# How many of those may belong to the same repository (override per repo with --repo-limit)
+DEFAULT_PER_REPO = int(os.getenv("GAUTO_PER_REPO", "4"))
+
+
+# Function to split "owner/repo" into (owner, repo)
+def parse_repo(value):
+    owner, sep, repo = value.partition("/")
+    if not sep or not owner or not repo or "/" in repo:
+        raise argparse.ArgumentTypeError(f"Expected 'owner/repo', got: {value!r}")
+    return owner, repo
+
+
+# Function to parse an `owner/repo:branch:originalBranch` command line argument
+def parse_target(value):
+    parts = value.split(":")
+    if len(parts) != 3 or not all(parts):
+        raise argparse.ArgumentTypeError(f"Expected 'owner/repo:branch:originalBranch', got: {value!r}")
+    owner, repo = parse_repo(parts[0])
+    return owner, repo, parts[1], parts[2]
+
+
+# Function to parse an `owner/repo=N` per-repository concurrency cap
+def parse_repo_limit(value):
+    name, sep, limit = value.partition("=")
+    if not sep or not limit.isdigit() or int(limit) < 1:
+        raise argparse.ArgumentTypeError(f"Expected 'owner/repo=N', got: {value!r}")
+    parse_repo(name)
+    return name, int(limit)
+
+
+# Function to read a manifest: one `owner/repo branch originalBranch` target per
+# line (whitespace or comma separated; blank lines and # comments are ignored)
+def read_manifest(path):
+    targets = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            parts = line.replace(",", " ").split()
+            if len(parts) != 3:
+                raise ValueError(f"Expected 'owner/repo branch originalBranch' in {path}, got: {line!r}")
+            owner, repo = parse_repo(parts[0])
+            targets.append((owner, repo, parts[1], parts[2]))
+    return targets
+
+
+# Hands out targets round-robin over repositories, skipping any repository that
+# is at its concurrency cap, so one large repository cannot starve the others
+class FairScheduler:
+    def __init__(self, targets, per_repo=DEFAULT_PER_REPO, repo_limits=None):
+        self.per_repo = per_repo
+        self.repo_limits = dict(repo_limits or {})
+        self._pending = {}  # "owner/repo" -> deque of targets, in manifest order
+        for target in targets:
+            self._pending.setdefault(f"{target[0]}/{target[1]}", deque()).append(target)
+        self._order = list(self._pending)
+        self._active = dict.fromkeys(self._order, 0)
+        self._next = 0
+        self._changed = asyncio.Condition()
+
+    def limit(self, name):
+        return self.repo_limits.get(name, self.per_repo)
+
+    def _pick(self):
+        for i in range(len(self._order)):
+            index = (self._next + i) % len(self._order)
+            name = self._order[index]
+            if self._pending[name] and self._active[name] < self.limit(name):
+                self._next = index + 1
+                self._active[name] += 1
+                return self._pending[name].popleft()
+        return None
+
+    # Wait for the next target this worker may run; None once nothing is left
+    async def acquire(self):
+        async with self._changed:
+            while True:
+                target = self._pick()
+                if target is not None or not any(self._pending.values()):
+                    return target
+                await self._changed.wait()
+
+    async def release(self, target):
+        async with self._changed:
+            self._active[f"{target[0]}/{target[1]}"] -= 1
+            self._changed.notify_all()
+
+
+# Runs targets from many repositories through one AsyncPipeline: a bounded pool
+# of workers takes targets from the FairScheduler, while the pipeline's own
+# semaphore still caps the HTTP requests in flight
+class MultiRepoRunner:
+    def __init__(self, pipeline, workers=DEFAULT_WORKERS, per_repo=DEFAULT_PER_REPO, repo_limits=None):
+        self.pipeline = pipeline
+        self.workers = workers
+        self.per_repo = per_repo
+        self.repo_limits = repo_limits
+
+    async def _worker(self, scheduler, results):
+        while True:
+            target = await scheduler.acquire()
+            if target is None:
+                return
+            owner, repo, head_branch, base_branch = target
+            try:
+                results.append(await self.pipeline.process(head_branch, base_branch, owner, repo))
+            except Exception as e:
+                print(f"Error processing {owner}/{repo} '{head_branch}' -> '{base_branch}': {e}")
+            finally:
+                await scheduler.release(target)
+
+    async def run(self, targets):
+        self.pipeline.start()
+        # Within each repository, targets with the shortest ETA go first
+        ordered = await self.pipeline._store(self.pipeline.order_by_eta, targets)
+        scheduler = FairScheduler(ordered, self.per_repo, self.repo_limits)
+        results = []
+        workers = min(self.workers, len(targets)) or 1
+        await asyncio.gather(*(self._worker(scheduler, results) for _ in range(workers)))
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create, wait for checks and merge PRs across many repositories.")
+    parser.add_argument("targets", nargs="*", type=parse_target, help="owner/repo:branch:originalBranch targets")
+    parser.add_argument("--manifest", help="file with one 'owner/repo branch originalBranch' target per line")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="PRs in progress at once, overall")
+    parser.add_argument("--per-repo", type=int, default=DEFAULT_PER_REPO, help="PRs in progress at once, per repository")
+    parser.add_argument("--repo-limit", type=parse_repo_limit, action="append", default=[],
+                        metavar="OWNER/REPO=N", help="per-repository cap for one repository")
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT, help="HTTP requests in flight")
+    parser.add_argument("--wait-timeout", type=float, default=DEFAULT_WAIT_TIMEOUT)
+    parser.add_argument("--expected-duration", type=float, help="typical check duration in seconds")
+    parser.add_argument("--graphql", action="store_true", help="poll check status for many PRs per GraphQL request")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="PRs per GraphQL request")
+    parser.add_argument("--state-db", default=DEFAULT_STATE_DB, help="SQLite file used to resume PRs across runs")
+    parser.add_argument("--no-preflight", action="store_true", help="skip the compare-API check for no-op branches")
+    args = parser.parse_args(argv)
+    metrics.setup_from_env()
+
+    targets = list(args.targets)
+    if args.manifest:
+        targets.extend(read_manifest(args.manifest))
+    if not targets:
+        parser.error("no targets given (use arguments or --manifest)")
+
+    store = StateStore(args.state_db)
+    started = time.monotonic()
+    preflight = []
+    if not args.no_preflight:
+        targets, preflight = preflight_targets(targets, store)
+    missing = sum(result["status"] == MISSING for result in preflight)
+
+    pipeline = AsyncPipeline(args.max_in_flight, args.wait_timeout, expected_duration=args.expected_duration,
+                             graphql_batch_size=args.batch_size if args.graphql else None, store=store)
+    runner = MultiRepoRunner(pipeline, args.workers, args.per_repo, dict(args.repo_limit))
+    results = asyncio.run(runner.run(targets)) if targets else []
+
+    print("\nSummary:")
+    for result in sorted(results, key=lambda r: r["repo"]):
+        state = "merged" if result["merged"] else "not merged"
+        eta = f", ETA {result['eta']:.0f}s" if result.get("eta") is not None else ""
+        print(f"- {result['repo']} {result['branch']} -> {result['originalBranch']}: "
+              f"PR #{result['pr_number']} {state} ({result['elapsed']}s{eta})")
+    if preflight:
+        print(f"Pre-flight skipped {len(preflight) - len(targets)} of {len(preflight)} target(s)")
+    repos = {f"{t[0]}/{t[1]}" for t in targets}
+    print(f"Processed {len(targets)} target(s) in {len(repos)} repositor{'y' if len(repos) == 1 else 'ies'} "
+          f"in {time.monotonic() - started:.1f}s")
+    print(f"HTTP client stats: {test2.client.stats()}")
+
+    return 0 if not missing and all(r["merged"] for r in results) and len(results) == len(targets) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,176 @@
+import fnmatch
+import json
+import os
+import re
+
+from polling import is_terminal
+
+# Gate decisions
+MERGE = "merge"
+WAIT = "wait"
+FAIL = "fail"
+
+DEFAULT_ALLOWED_CONCLUSIONS = ["success"]
+
+# A policy file is JSON, for example:
+#
+# {
+#   "required": ["Tenant-config-action", "MD-validator-Action"],
+#   "patterns": [{"glob": "MD-*"}, {"regex": "^build( \\(.*\\))?$", "min_matches": 1}],
+#   "allowed_conclusions": ["success", "neutral", "skipped"],
+#   "branches": {
+#     "release/*": {"required": ["build"], "allowed_conclusions": ["success"]}
+#   }
+# }
+#
+# - every name in "required" must have a run whose conclusion is allowed
+# - every run whose name matches a pattern must conclude with an allowed
+#   conclusion, and at least "min_matches" runs must match (default 0)
+# - "branches" overrides any of the keys above for base branches matching
+#   the key (exact names win over globs)
+
+
+# Result of evaluating the policy against a set of check runs
+class Decision:
+    __slots__ = ("state", "reason", "runs")
+
+    def __init__(self, state, reason, runs):
+        self.state = state
+        self.reason = reason
+        self.runs = runs  # name -> check run (None if not seen yet)
+
+    @property
+    def statuses(self):
+        return {name: (check.get("conclusion") if check else None) for name, check in self.runs.items()}
+
+    def __repr__(self):
+        return f"Decision({self.state!r}, {self.reason!r})"
+
+
+# A policy for one base branch, compiled into lookup tables so evaluation is a
+# single pass over the check runs
+class CompiledPolicy:
+    def __init__(self, required, patterns, allowed_conclusions):
+        self.required = list(dict.fromkeys(required))
+        self.allowed = frozenset(allowed_conclusions)
+        self.required_index = {name: i for i, name in enumerate(self.required)}
+        self.patterns = []
+        for pattern in patterns:
+            if "glob" in pattern:
+                regex = re.compile(fnmatch.translate(pattern["glob"]))
+                label = pattern["glob"]
+            else:
+                regex = re.compile(pattern["regex"])
+                label = pattern["regex"]
+            self.patterns.append((label, regex, int(pattern.get("min_matches", 0))))
+        # name -> tuple of pattern indexes it matches (each name is matched only once)
+        self._pattern_memo = {}
+
+    # Names that must be seen before the gate can decide; None when patterns
+    # mean every check run has to be read
+    @property
+    def fetch_names(self):
+        return None if self.patterns else self.required
+
+    # Function to tell whether the gate looks at checks with this name
+    def applies_to(self, name):
+        return name in self.required_index or bool(self.patterns and self._patterns_for(name))
+
+    def _patterns_for(self, name):
+        matched = self._pattern_memo.get(name)
+        if matched is None:
+            matched = tuple(i for i, (_, regex, _) in enumerate(self.patterns) if regex.match(name))
+            self._pattern_memo[name] = matched
+        return matched
+
+    # Decide merge / wait / fail in one pass; stops at the first hard failure.
+    # `pending_suites` names check suites that have not created their runs yet.
+    def evaluate(self, check_runs, pending_suites=()):
+        slots = [None] * len(self.required)
+        pattern_counts = [0] * len(self.patterns)
+        runs = {}
+        waiting = False
+
+        for check in check_runs:
+            name = check["name"]
+            index = self.required_index.get(name)
+            matched = self._patterns_for(name) if self.patterns else ()
+            if index is None and not matched:
+                continue
+
+            runs[name] = check
+            if index is not None:
+                slots[index] = check
+            for i in matched:
+                pattern_counts[i] += 1
+
+            if not is_terminal(check):
+                waiting = True
+            elif check["conclusion"] not in self.allowed:
+                return Decision(FAIL, f"'{name}' concluded '{check['conclusion']}'", self._with_missing(runs, slots))
+
+        runs = self._with_missing(runs, slots)
+        missing = [name for name, check in zip(self.required, slots) if check is None]
+        if missing:
+            return Decision(WAIT, f"waiting for {', '.join(missing)}", runs)
+        for (label, _, min_matches), count in zip(self.patterns, pattern_counts):
+            if count < min_matches:
+                return Decision(WAIT, f"waiting for {min_matches} check(s) matching '{label}'", runs)
+        if pending_suites:
+            return Decision(WAIT, f"waiting for check suite(s) {', '.join(pending_suites)} to start", runs)
+        if waiting:
+            return Decision(WAIT, "required checks still running", runs)
+        return Decision(MERGE, "all required checks passed", runs)
+
+    def _with_missing(self, runs, slots):
+        for name, check in zip(self.required, slots):
+            if check is None:
+                runs[name] = None
+        return runs
+
+
+# A policy with per-branch overrides; compiled lazily once per base branch
+class Policy:
+    def __init__(self, config):
+        self.config = config
+        self._compiled = {}
+
+    # Replace the configuration in place (e.g. on reload); recompiles lazily
+    def update(self, config):
+        self.config = config
+        self._compiled = {}
+
+    def _settings_for(self, branch):
+        settings = {key: value for key, value in self.config.items() if key != "branches"}
+        overrides = self.config.get("branches", {})
+        if branch in overrides:
+            settings.update(overrides[branch])
+        elif branch:
+            for pattern, override in overrides.items():
+                if fnmatch.fnmatchcase(branch, pattern):
+                    settings.update(override)
+                    break
+        return settings
+
+    def for_branch(self, branch=None):
+        compiled = self._compiled.get(branch)
+        if compiled is None:
+            settings = self._settings_for(branch)
+            compiled = CompiledPolicy(
+                settings.get("required", []),
+                settings.get("patterns", []),
+                settings.get("allowed_conclusions", DEFAULT_ALLOWED_CONCLUSIONS),
+            )
+            self._compiled[branch] = compiled
+        return compiled
+
+    def evaluate(self, check_runs, branch=None, pending_suites=()):
+        return self.for_branch(branch).evaluate(check_runs, pending_suites)
+
+
+# Function to load a policy file, falling back to `default_required` when it does not exist
+def load_policy(path, default_required=()):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return Policy(json.load(f))
+    return Policy({"required": list(default_required), "allowed_conclusions": DEFAULT_ALLOWED_CONCLUSIONS})
@@ -0,0 +1,162 @@
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+# Check run conclusions that mean the check will not change any more
+TERMINAL_CONCLUSIONS = {
+    "success", "failure", "neutral", "cancelled", "skipped",
+    "timed_out", "action_required", "stale", "startup_failure",
+}
+
+# Default polling settings (seconds)
+DEFAULT_MIN_INTERVAL = 2
+DEFAULT_MAX_INTERVAL = 60
+DEFAULT_BACKOFF = 2.0
+DEFAULT_JITTER = 0.2
+DEFAULT_DEADLINE = 1800
+
+# How close to the expected completion time we switch to fast polling
+NEAR_COMPLETION_WINDOW = 15
+
+# Poll sleeps are divided by this (0 = no sleeping). While a cassette is replayed
+# (GAUTO_CASSETTE_REPLAY) it is GAUTO_REPLAY_SPEED, so a replay is not held up by
+# the poll intervals of the recorded run; the replayed responses come in recorded
+# order however quickly they are polled.
+POLL_SPEED = float(os.getenv("GAUTO_REPLAY_SPEED", "1")) if os.getenv("GAUTO_CASSETTE_REPLAY") else 1.0
+
+
+# Function to parse a GitHub timestamp such as "2024-12-10T08:15:00Z"
+def parse_github_time(value):
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+# Function to tell whether a check run has reached a terminal conclusion
+def is_terminal(check):
+    return check is not None and check.get("status") == "completed" and check.get("conclusion") in TERMINAL_CONCLUSIONS
+
+
+# Decides how long to wait before the next poll of the check runs:
+#  - with an ETA, the first poll waits until shortly before it
+#  - while required checks are missing or queued, back off exponentially (with jitter)
+#  - while they run, sleep until shortly before the expected completion time,
+#    then poll quickly around it
+#  - never sleep past the overall deadline
+# `expected_duration` is one duration for every check or a {check name: seconds}
+# mapping (see eta.py); `eta` is the seconds until the checks should be done.
+# Every delay is divided by `speed` (POLL_SPEED by default; 0 = no delay).
+class PollScheduler:
+    def __init__(self, expected_duration=None, min_interval=DEFAULT_MIN_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL, backoff=DEFAULT_BACKOFF,
+                 jitter=DEFAULT_JITTER, deadline=DEFAULT_DEADLINE, eta=None, speed=None):
+        self.speed = POLL_SPEED if speed is None else speed
+        self.expected_duration = expected_duration
+        self.eta = eta
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.deadline_at = time.monotonic() + deadline
+        self.polls = 0
+        self._phase = None
+        self._streak = 0
+
+    def time_left(self):
+        return max(self.deadline_at - time.monotonic(), 0.0)
+
+    def expired(self):
+        return self.time_left() <= 0
+
+    def _jittered(self, delay):
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _scaled(self, delay):
+        return delay / self.speed if self.speed > 0 else 0.0
+
+    def _expected_for(self, name):
+        if isinstance(self.expected_duration, dict):
+            return self.expected_duration.get(name)
+        return self.expected_duration
+
+    # Seconds until the slowest running required check is expected to finish
+    # (checks without an expected duration are left out)
+    def _until_expected_completion(self, runs, now):
+        if not self.expected_duration:
+            return None
+        remaining = []
+        for name, check in runs.items():
+            if check is None or is_terminal(check):
+                continue
+            expected = self._expected_for(name)
+            if expected is None:
+                continue
+            started = parse_github_time(check.get("started_at"))
+            if started is None:
+                return None
+            remaining.append(expected - (now - started).total_seconds())
+        return max(remaining) if remaining else None
+
+    # Delay before the first poll: until shortly before the ETA, so long-running
+    # checks are not polled early (0 without an ETA or when it is close)
+    def first_delay(self):
+        if not self.eta or self.eta <= NEAR_COMPLETION_WINDOW:
+            return 0.0
+        return min(self._scaled(self.eta - NEAR_COMPLETION_WINDOW / 2), self.time_left())
+
+    # Delay before the next poll, or None once the deadline has passed
+    def next_delay(self, runs, now=None):
+        self.polls += 1
+        if self.expired():
+            return None
+        now = now or datetime.now(timezone.utc)
+
+        waiting = [check for check in runs.values() if not is_terminal(check)]
+        queued = any(check is None or check.get("status") in ("queued", "pending", "waiting", "requested")
+                     for check in waiting)
+
+        # Restart the backoff whenever checks move from queued to running
+        phase = "queued" if queued else "running"
+        if phase != self._phase:
+            self._phase = phase
+            self._streak = 0
+        backoff_delay = self.min_interval * (self.backoff ** self._streak)
+        self._streak += 1
+
+        if queued:
+            delay = backoff_delay
+        else:
+            until_done = self._until_expected_completion(runs, now)
+            if until_done is None:
+                delay = backoff_delay
+            elif until_done > NEAR_COMPLETION_WINDOW:
+                # Wake up a little before the expected finish
+                delay = until_done - NEAR_COMPLETION_WINDOW / 2
+            else:
+                delay = self.min_interval
+
+        delay = min(self._jittered(min(delay, self.max_interval)), self.max_interval)
+        return max(min(self._scaled(delay), self.time_left()), 0.0)
+
+
+# Function to poll `fetch()` (which returns a list of check runs) until
+# `evaluate(check_runs)` returns a decision other than "wait", or the deadline
+# passes. The decision's runs drive the scheduler.
+def wait_for_decision(fetch, evaluate, scheduler=None, sleep=time.sleep):
+    scheduler = scheduler or PollScheduler()
+    delay = scheduler.first_delay()
+    if delay:
+        print(f"Checks are expected to finish in {scheduler.eta:.0f} seconds; first check in {delay:.1f} seconds...")
+        sleep(delay)
+    while True:
+        decision = evaluate(fetch())
+        if decision.state != "wait":
+            return decision
+
+        delay = scheduler.next_delay(decision.runs)
+        if delay is None:
+            print(f"Gave up waiting for checks after {scheduler.polls} polls (deadline reached).")
+            return decision
+        print(f"Waiting {delay:.1f} seconds before checking again...")
+        sleep(delay)
@@ -0,0 +1,159 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from check_runs import MAX_PER_PAGE
+from github_client import get_client
+
+# Threads used for the branch lookups and comparisons of one pre-flight run
+PREFLIGHT_WORKERS = int(os.getenv("GAUTO_PREFLIGHT_WORKERS", "16"))
+
+# With more targets than this in one repository, list its branches (100 per
+# request) instead of reading each branch ref on its own
+LIST_BRANCHES_THRESHOLD = 4
+
+# Comparisons remembered in memory (a base/head SHA pair always compares the same)
+COMPARE_CACHE_SIZE = 10000
+
+# Pre-flight outcomes
+READY = "ready"                        # head has commits the base does not have
+BEHIND = "behind"                      # ... but the base also moved on (CI runs on a stale merge base)
+NOTHING_TO_MERGE = "nothing_to_merge"  # every head commit is already in the base
+MISSING = "missing"                    # head or base branch does not exist
+UNKNOWN = "unknown"                    # the comparison failed; let the pipeline try
+
+_comparisons = OrderedDict()
+_comparisons_lock = threading.Lock()
+
+
+# Function to read the SHA a branch points at (None if it does not exist)
+def get_branch_head(repo_url, branch, headers, client=None):
+    client = client or get_client()
+    response = client.get(f"{repo_url}/git/ref/heads/{branch}", headers=headers)
+    if response.status_code == 200:
+        return response.json()["object"]["sha"]
+    if response.status_code != 404:
+        print(f"Error reading branch '{branch}': {response.status_code}, {response.text}")
+    return None
+
+
+# Function to list the branches of a repository as {name: head sha} (None on error)
+def list_branch_heads(repo_url, headers, client=None):
+    client = client or get_client()
+    url = f"{repo_url}/branches"
+    params = {"per_page": MAX_PER_PAGE}
+    branches = {}
+    while url:
+        response = client.get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            print(f"Error listing branches: {response.status_code}, {response.text}")
+            return None
+        for branch in response.json():
+            branches[branch["name"]] = branch["commit"]["sha"]
+        url = response.links.get("next", {}).get("url")
+        params = None
+    return branches
+
+
+# Function to compare two commits; returns {"status", "ahead_by", "behind_by"} or None
+def compare_commits(repo_url, base, head, headers, client=None):
+    client = client or get_client()
+    # per_page=1: only the counts are needed, not the commit list
+    response = client.get(f"{repo_url}/compare/{base}...{head}", headers=headers, params={"per_page": 1})
+    if response.status_code != 200:
+        print(f"Error comparing '{base}...{head}': {response.status_code}, {response.text}")
+        return None
+    data = response.json()
+    return {"status": data.get("status"), "ahead_by": data.get("ahead_by", 0), "behind_by": data.get("behind_by", 0)}
+
+
+# Function to tell whether the pipeline should go on with a pre-flight result
+def runnable(result):
+    return result["status"] in (READY, BEHIND, UNKNOWN)
+
+
+# Bulk pre-flight for (owner, repo, head branch, base branch) targets: resolves
+# every branch head, then compares base...head for all targets concurrently,
+# before any PR is created. Comparisons are cached by SHA pair in memory and,
+# with a state store, across runs.
+class Preflight:
+    def __init__(self, api_url, headers, store=None, client=None, workers=PREFLIGHT_WORKERS):
+        self.api_url = api_url
+        self.headers = headers
+        self.store = store
+        self.client = client or get_client()
+        self.workers = workers
+        self.stats = {"compared": 0, "cached": 0}
+
+    def _repo_url(self, owner, repo):
+        return f"{self.api_url}/repos/{owner}/{repo}"
+
+    # Function to resolve the head SHA of `branches` in one repository ({name: sha}, None for missing)
+    def _heads(self, pool, owner, repo, branches):
+        repo_url = self._repo_url(owner, repo)
+        if len(branches) > LIST_BRANCHES_THRESHOLD:
+            listed = list_branch_heads(repo_url, self.headers, self.client)
+            if listed is not None:
+                return {branch: listed.get(branch) for branch in branches}
+        shas = pool.map(lambda branch: get_branch_head(repo_url, branch, self.headers, self.client), branches)
+        return dict(zip(branches, shas))
+
+    # Function to compare a base/head SHA pair, using the in-memory and stored results first
+    def compare(self, owner, repo, base_sha, head_sha):
+        key = (owner, repo, base_sha, head_sha)
+        with _comparisons_lock:
+            comparison = _comparisons.get(key)
+        if comparison is None and self.store:
+            comparison = self.store.get_comparison(owner, repo, base_sha, head_sha)
+        cached = comparison is not None
+        if not cached:
+            comparison = compare_commits(self._repo_url(owner, repo), base_sha, head_sha, self.headers, self.client)
+            if comparison is None:
+                return None
+            if self.store:
+                self.store.record_comparison(owner, repo, base_sha, head_sha, comparison)
+        with _comparisons_lock:
+            self.stats["cached" if cached else "compared"] += 1
+            _comparisons[key] = comparison
+            _comparisons.move_to_end(key)
+            while len(_comparisons) > COMPARE_CACHE_SIZE:
+                _comparisons.popitem(last=False)
+        return comparison
+
+    def _result(self, target, heads):
+        owner, repo, head_branch, base_branch = target
+        result = {"owner": owner, "repo": repo, "branch": head_branch, "base": base_branch,
+                  "head_sha": heads.get(head_branch), "base_sha": heads.get(base_branch),
+                  "ahead_by": None, "behind_by": None}
+        if not result["head_sha"] or not result["base_sha"]:
+            result["status"] = MISSING
+            return result
+        comparison = self.compare(owner, repo, result["base_sha"], result["head_sha"])
+        if comparison is None:
+            result["status"] = UNKNOWN
+            return result
+        result["ahead_by"] = comparison["ahead_by"]
+        result["behind_by"] = comparison["behind_by"]
+        if not comparison["ahead_by"]:
+            result["status"] = NOTHING_TO_MERGE
+        elif comparison["behind_by"]:
+            result["status"] = BEHIND
+        else:
+            result["status"] = READY
+        return result
+
+    # Function to check every target; returns one result dict per target, in order
+    def check(self, targets):
+        targets = list(targets)
+        by_repo = {}  # (owner, repo) -> every branch to resolve there, in order
+        for owner, repo, head_branch, base_branch in targets:
+            branches = by_repo.setdefault((owner, repo), {})
+            branches[head_branch] = branches[base_branch] = None
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="preflight") as pool:
+            with ThreadPoolExecutor(max_workers=max(len(by_repo), 1)) as repo_pool:
+                resolved = repo_pool.map(lambda item: self._heads(pool, item[0][0], item[0][1], list(item[1])),
+                                         by_repo.items())
+                heads = dict(zip(by_repo, resolved))
+            return list(pool.map(lambda target: self._result(target, heads[(target[0], target[1])]), targets))
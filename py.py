@@ -1,6 +1,7 @@
-import requests
 import json
 
+from github_client import get_client
+
 # GitHub API base URL
 GITHUB_API_URL = "https://api.github.com"
 
@@ -15,6 +16,9 @@ HEADERS = {
     "Accept": "application/vnd.github.v3+json",
 }
 
+# Shared pooled HTTP client (keep-alive connections reused across calls)
+client = get_client()
+
 # Function to create a pull request
 def create_pull_request(title, body, head_branch, base_branch):
     url = f"{GITHUB_API_URL}/repos/{REPO_OWNER}/{REPO_NAME}/pulls"
@@ -30,7 +34,7 @@ def create_pull_request(title, body, head_branch, base_branch):
         "base": base_branch
     }
 
-    response = requests.post(url, headers=HEADERS, json=payload)
+    response = client.post(url, headers=HEADERS, json=payload)
 
     if response.status_code == 201:
         pr_data = response.json()
@@ -43,7 +47,7 @@ def create_pull_request(title, body, head_branch, base_branch):
 # Function to get check suites for the commit associated with the PR
 def get_check_suites_for_commit(commit_sha):
     url = f"{GITHUB_API_URL}/repos/{REPO_OWNER}/{REPO_NAME}/commits/{commit_sha}/check-suites"
-    response = requests.get(url, headers=HEADERS)
+    response = client.get(url, headers=HEADERS)
 
     if response.status_code == 200:
         check_suites = response.json().get("check_suites", [])
@@ -1,6 +1,8 @@
-import requests
 import json
 
+from check_runs import iter_check_runs
+from github_client import get_client
+
 # GitHub API base URL
 GITHUB_API_URL = "https://api.github.com"
 
@@ -15,6 +17,9 @@ HEADERS = {
     "Accept": "application/vnd.github.v3+json",
 }
 
+# Shared pooled HTTP client (keep-alive connections reused across calls)
+client = get_client()
+
 # Function to create a pull request
 def create_pull_request(title, body, head_branch, base_branch):
     url = f"{GITHUB_API_URL}/repos/{REPO_OWNER}/{REPO_NAME}/pulls"
@@ -30,7 +35,7 @@ def create_pull_request(title, body, head_branch, base_branch):
         "base": base_branch
     }
 
-    response = requests.post(url, headers=HEADERS, json=payload)
+    response = client.post(url, headers=HEADERS, json=payload)
 
     if response.status_code == 201:
         pr_data = response.json()
@@ -41,21 +46,17 @@ def create_pull_request(title, body, head_branch, base_branch):
         return None, None
 
 # Function to get check runs for the commit associated with the PR
-def get_check_runs_for_commit(commit_sha):
+def get_check_runs_for_commit(commit_sha, required_names=None):
     url = f"{GITHUB_API_URL}/repos/{REPO_OWNER}/{REPO_NAME}/commits/{commit_sha}/check-runs"
-    response = requests.get(url, headers=HEADERS)
-
-    if response.status_code == 200:
-        check_runs = response.json().get("check_runs", [])
-        if not check_runs:
-            print("No check runs found for this commit.")
-        else:
-            print("\nCheck Runs for Commit:")
-            for check in check_runs:
-                # Display the check name, status, and conclusion
-                print(f"- {check['name']} ({check['status']}) - Conclusion: {check['conclusion']}")
+    # Read every page (per_page=100), stopping early once the required checks are found
+    check_runs = list(iter_check_runs(url, HEADERS, required_names, client=client))
+    if not check_runs:
+        print("No check runs found for this commit.")
     else:
-        print(f"Error fetching check runs: {response.status_code}, {response.text}")
+        print("\nCheck Runs for Commit:")
+        for check in check_runs:
+            # Display the check name, status, and conclusion
+            print(f"- {check['name']} ({check['status']}) - Conclusion: {check['conclusion']}")
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+
+# Start pacing requests once a bucket drops below this fraction of its limit
+DEFAULT_SLOWDOWN_RATIO = float(os.getenv("GITHUB_RATE_LIMIT_SLOWDOWN", "0.1"))
+
+# How many times a rate-limited request is retried
+DEFAULT_MAX_RETRIES = int(os.getenv("GITHUB_RATE_LIMIT_RETRIES", "3"))
+
+# GitHub asks clients to wait at least a minute after a secondary rate limit
+SECONDARY_LIMIT_WAIT = 60
+
+# Never wait longer than this for a single retry
+MAX_RETRY_WAIT = 900
+
+# Budget assumed for a bucket we have not seen headers for yet (GitHub's default per token)
+DEFAULT_BUDGET = 5000
+
+
+# Function to pick the rate-limit bucket a request counts against
+def resource_for_url(url):
+    if "/graphql" in url:
+        return "graphql"
+    if "/search/" in url:
+        return "search"
+    return "core"
+
+
+# One token bucket per GitHub rate-limit resource (core, graphql, search).
+# The bucket is refilled from the X-RateLimit-* headers of every response.
+class _Bucket:
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+
+
+# Central governor every API call passes through: it slows down before the
+# budget runs out and tells the client how long to wait before retrying a
+# 403/429 rate-limit response
+class RateLimitGovernor:
+    def __init__(self, slowdown_ratio=DEFAULT_SLOWDOWN_RATIO, max_retries=DEFAULT_MAX_RETRIES,
+                 clock=time.time, sleep=time.sleep):
+        self.slowdown_ratio = slowdown_ratio
+        self.max_retries = max_retries
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self.waited = 0.0
+        self.retries = 0
+
+    def _bucket(self, resource):
+        bucket = self._buckets.get(resource)
+        if bucket is None:
+            bucket = self._buckets[resource] = _Bucket()
+        return bucket
+
+    # Wait (if needed) before sending a request against `resource`
+    def acquire(self, resource="core"):
+        with self._lock:
+            bucket = self._bucket(resource)
+            delay = self._pacing_delay(bucket)
+            if bucket.remaining is not None and bucket.remaining > 0:
+                bucket.remaining -= 1  # corrected by the next response's headers
+        if delay > 0:
+            with self._lock:
+                self.waited += delay
+            self._sleep(delay)
+
+    # Requests left for `resource` (an estimate until a response has reported the budget)
+    def headroom(self, resource="core"):
+        with self._lock:
+            bucket = self._buckets.get(resource)
+            if bucket is None or bucket.remaining is None:
+                return DEFAULT_BUDGET
+            if bucket.reset_at is not None and bucket.reset_at <= self._clock():
+                return bucket.limit or DEFAULT_BUDGET
+            return bucket.remaining
+
+    # Spread what is left of the budget evenly until the window resets
+    def _pacing_delay(self, bucket):
+        if bucket.remaining is None or bucket.reset_at is None:
+            return 0.0
+        until_reset = max(bucket.reset_at - self._clock(), 0.0)
+        if bucket.remaining <= 0:
+            return min(until_reset, MAX_RETRY_WAIT)
+        if bucket.limit and bucket.remaining < bucket.limit * self.slowdown_ratio:
+            return min(until_reset / bucket.remaining, MAX_RETRY_WAIT)
+        return 0.0
+
+    # Refill the bucket from the response's rate-limit headers
+    def update(self, response, resource=None):
+        headers = response.headers
+        if "X-RateLimit-Remaining" not in headers:
+            return
+        resource = headers.get("X-RateLimit-Resource") or resource or "core"
+        with self._lock:
+            bucket = self._bucket(resource)
+            try:
+                bucket.remaining = int(headers["X-RateLimit-Remaining"])
+                if "X-RateLimit-Limit" in headers:
+                    bucket.limit = int(headers["X-RateLimit-Limit"])
+                if "X-RateLimit-Reset" in headers:
+                    bucket.reset_at = float(headers["X-RateLimit-Reset"])
+            except ValueError:
+                pass
+
+    # Seconds to wait before retrying `response`, or None if it was not rate limited
+    def retry_delay(self, response, attempt):
+        if response.status_code not in (403, 429) or attempt >= self.max_retries:
+            return None
+
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), MAX_RETRY_WAIT)
+            except ValueError:
+                pass
+
+        if response.headers.get("X-RateLimit-Remaining") == "0" and "X-RateLimit-Reset" in response.headers:
+            try:
+                until_reset = float(response.headers["X-RateLimit-Reset"]) - self._clock()
+            except ValueError:
+                until_reset = SECONDARY_LIMIT_WAIT
+            return min(max(until_reset, 1.0), MAX_RETRY_WAIT)
+
+        text = response.text.lower()
+        if response.status_code == 429 or "secondary rate limit" in text or "abuse" in text:
+            return min(SECONDARY_LIMIT_WAIT * (2 ** attempt), MAX_RETRY_WAIT)
+
+        # Any other 403 (permissions, branch protection, ...) is not retried
+        return None
+
+    # Sleep before retrying a rate-limited request
+    def wait_before_retry(self, delay):
+        with self._lock:
+            self.retries += 1
+            self.waited += delay
+        self._sleep(delay)
+
+    # Remaining budget per resource, e.g. {"core": {"limit": 5000, "remaining": 4870, "reset_in": 1234}}
+    def budget(self):
+        now = self._clock()
+        with self._lock:
+            return {
+                resource: {
+                    "limit": bucket.limit,
+                    "remaining": bucket.remaining,
+                    "reset_in": round(max(bucket.reset_at - now, 0.0)) if bucket.reset_at else None,
+                }
+                for resource, bucket in self._buckets.items()
+            }
+
+    def stats(self):
+        with self._lock:
+            retries, waited = self.retries, self.waited
+        return {"retries": retries, "waited": round(waited, 1), "budget": self.budget()}
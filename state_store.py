@@ -0,0 +1,233 @@
+import os
+import sqlite3
+import threading
+import time
+
+from check_records import CheckRun
+
+# Where the state database lives (override with GAUTO_STATE_DB)
+DEFAULT_STATE_DB = os.getenv("GAUTO_STATE_DB", "gauto_state.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pull_requests (
+    owner       TEXT NOT NULL,
+    repo        TEXT NOT NULL,
+    number      INTEGER NOT NULL,
+    head_branch TEXT NOT NULL,
+    base_branch TEXT NOT NULL,
+    head_sha    TEXT,
+    state       TEXT NOT NULL DEFAULT 'open',
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL,
+    PRIMARY KEY (owner, repo, number)
+);
+CREATE INDEX IF NOT EXISTS pull_requests_by_branch
+    ON pull_requests (owner, repo, head_branch, base_branch);
+
+CREATE TABLE IF NOT EXISTS check_runs (
+    owner        TEXT NOT NULL,
+    repo         TEXT NOT NULL,
+    sha          TEXT NOT NULL,
+    name         TEXT NOT NULL,
+    check_run_id INTEGER,
+    status       TEXT,
+    conclusion   TEXT,
+    started_at   TEXT,
+    completed_at TEXT,
+    updated_at   REAL NOT NULL,
+    PRIMARY KEY (owner, repo, sha, name)
+);
+
+CREATE TABLE IF NOT EXISTS merges (
+    owner     TEXT NOT NULL,
+    repo      TEXT NOT NULL,
+    number    INTEGER NOT NULL,
+    merged    INTEGER NOT NULL,
+    message   TEXT,
+    merged_at REAL NOT NULL,
+    PRIMARY KEY (owner, repo, number)
+);
+
+CREATE TABLE IF NOT EXISTS comparisons (
+    owner       TEXT NOT NULL,
+    repo        TEXT NOT NULL,
+    base_sha    TEXT NOT NULL,
+    head_sha    TEXT NOT NULL,
+    status      TEXT,
+    ahead_by    INTEGER NOT NULL,
+    behind_by   INTEGER NOT NULL,
+    compared_at REAL NOT NULL,
+    PRIMARY KEY (owner, repo, base_sha, head_sha)
+);
+
+CREATE TABLE IF NOT EXISTS check_durations (
+    owner        TEXT NOT NULL,
+    repo         TEXT NOT NULL,
+    base_branch  TEXT NOT NULL,
+    name         TEXT NOT NULL,
+    sha          TEXT NOT NULL,
+    duration     REAL NOT NULL,
+    completed_at TEXT,
+    recorded_at  REAL NOT NULL,
+    PRIMARY KEY (owner, repo, base_branch, name, sha)
+);
+"""
+
+
+# Local SQLite (WAL) record of the PRs we created, the latest check-run result
+# per check name and SHA, merge outcomes and compare results, so a restarted job can resume,
+# plus how long each check took on each base branch (for ETAs, see eta.py)
+class StateStore:
+    def __init__(self, path=DEFAULT_STATE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # Function to remember a PR we created (or adopted)
+    def record_pull_request(self, owner, repo, number, head_branch, base_branch, head_sha, state="open"):
+        now = time.time()
+        self._execute(
+            """INSERT INTO pull_requests (owner, repo, number, head_branch, base_branch, head_sha, state, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (owner, repo, number) DO UPDATE SET
+                   head_sha = excluded.head_sha, state = excluded.state, updated_at = excluded.updated_at""",
+            (owner, repo, number, head_branch, base_branch, head_sha, state, now, now),
+        )
+
+    def update_pull_request(self, owner, repo, number, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(
+            f"UPDATE pull_requests SET {columns}, updated_at = ? WHERE owner = ? AND repo = ? AND number = ?",
+            (*fields.values(), time.time(), owner, repo, number),
+        )
+
+    # Function to find the most recent PR we recorded for a head/base pair
+    def find_pull_request(self, owner, repo, head_branch, base_branch):
+        rows = self._execute(
+            """SELECT * FROM pull_requests
+               WHERE owner = ? AND repo = ? AND head_branch = ? AND base_branch = ?
+               ORDER BY created_at DESC LIMIT 1""",
+            (owner, repo, head_branch, base_branch),
+        )
+        return dict(rows[0]) if rows else None
+
+    # Function to store check runs for a SHA, keeping only the newest run per name
+    def record_check_runs(self, owner, repo, sha, check_runs):
+        now = time.time()
+        rows = [
+            (owner, repo, sha, check["name"], check.get("id"), check.get("status"), check.get("conclusion"),
+             check.get("started_at"), check.get("completed_at"), now)
+            for check in check_runs
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    """INSERT INTO check_runs (owner, repo, sha, name, check_run_id, status, conclusion,
+                                               started_at, completed_at, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT (owner, repo, sha, name) DO UPDATE SET
+                           check_run_id = excluded.check_run_id, status = excluded.status,
+                           conclusion = excluded.conclusion, started_at = excluded.started_at,
+                           completed_at = excluded.completed_at, updated_at = excluded.updated_at
+                       WHERE excluded.check_run_id IS NULL OR check_runs.check_run_id IS NULL
+                          OR excluded.check_run_id >= check_runs.check_run_id""",
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # Function to read back the recorded check runs for a SHA (as CheckRun records)
+    def get_check_runs(self, owner, repo, sha):
+        rows = self._execute(
+            "SELECT * FROM check_runs WHERE owner = ? AND repo = ? AND sha = ?",
+            (owner, repo, sha),
+        )
+        return [
+            CheckRun(row["name"], row["status"], row["conclusion"], row["check_run_id"], row["started_at"],
+                     row["completed_at"])
+            for row in rows
+        ]
+
+    # Function to record the outcome of a merge attempt
+    def record_merge(self, owner, repo, number, merged, message=None):
+        self._execute(
+            """INSERT INTO merges (owner, repo, number, merged, message, merged_at) VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (owner, repo, number) DO UPDATE SET
+                   merged = excluded.merged, message = excluded.message, merged_at = excluded.merged_at""",
+            (owner, repo, number, int(bool(merged)), message, time.time()),
+        )
+        if merged:
+            self.update_pull_request(owner, repo, number, state="merged")
+
+    # Function to remember a compare-API result (a SHA pair always compares the same)
+    def record_comparison(self, owner, repo, base_sha, head_sha, comparison):
+        self._execute(
+            """INSERT OR REPLACE INTO comparisons (owner, repo, base_sha, head_sha, status, ahead_by, behind_by, compared_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (owner, repo, base_sha, head_sha, comparison["status"], comparison["ahead_by"], comparison["behind_by"],
+             time.time()),
+        )
+
+    def get_comparison(self, owner, repo, base_sha, head_sha):
+        rows = self._execute(
+            "SELECT status, ahead_by, behind_by FROM comparisons WHERE owner = ? AND repo = ? AND base_sha = ? AND head_sha = ?",
+            (owner, repo, base_sha, head_sha),
+        )
+        return dict(rows[0]) if rows else None
+
+    # Function to record how long checks ran on a commit: `durations` is [(name, seconds, completed_at), ...]
+    def record_check_durations(self, owner, repo, base_branch, sha, durations):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    """INSERT OR REPLACE INTO check_durations (owner, repo, base_branch, name, sha, duration,
+                                                               completed_at, recorded_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    [(owner, repo, base_branch, name, sha, duration, completed_at, now)
+                     for name, duration, completed_at in durations],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # Function to read the `limit` newest durations per base branch and check name of a repository
+    # (returns {(base_branch, name): [seconds, ...]}, oldest first)
+    def get_check_durations(self, owner, repo, limit):
+        rows = self._execute(
+            """SELECT base_branch, name, duration FROM (
+                   SELECT base_branch, name, duration, recorded_at, ROW_NUMBER() OVER (
+                       PARTITION BY base_branch, name ORDER BY recorded_at DESC) AS newest
+                   FROM check_durations WHERE owner = ? AND repo = ?)
+               WHERE newest <= ? ORDER BY recorded_at""",
+            (owner, repo, limit),
+        )
+        durations = {}
+        for row in rows:
+            durations.setdefault((row["base_branch"], row["name"]), []).append(row["duration"])
+        return durations
+
+    def get_merge(self, owner, repo, number):
+        rows = self._execute(
+            "SELECT * FROM merges WHERE owner = ? AND repo = ? AND number = ?",
+            (owner, repo, number),
+        )
+        return dict(rows[0]) if rows else None
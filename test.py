@@ -1,5 +1,10 @@
-import requests
 import json
+import os
+
+from check_index import LatestCheckIndex
+from check_runs import iter_check_runs
+from github_client import get_client
+from policy import MERGE, load_policy
 
 # GitHub API base URL
 GITHUB_API_URL = "https://api.github.com"
@@ -15,6 +20,12 @@ HEADERS = {
     "Accept": "application/vnd.github.v3+json",
 }
 
+# Merge policy (GAUTO_POLICY can name a JSON policy file, see policy.py)
+POLICY = load_policy(os.getenv("GAUTO_POLICY"), ["Run npm on Ubuntu", "build"])
+
+# Shared pooled HTTP client (keep-alive connections reused across calls)
+client = get_client()
+
 # Function to create a pull request
 def create_pull_request(title, body, head_branch, base_branch):
     url = f"{GITHUB_API_URL}/repos/{REPO_OWNER}/{REPO_NAME}/pulls"
@@ -30,7 +41,7 @@ def create_pull_request(title, body, head_branch, base_branch):
         "base": base_branch
     }
 
-    response = requests.post(url, headers=HEADERS, json=payload)
+    response = client.post(url, headers=HEADERS, json=payload)
 
     if response.status_code == 201:
         pr_data = response.json()
@@ -41,25 +52,20 @@ def create_pull_request(title, body, head_branch, base_branch):
         return None, None
 
 # Function to get check runs for the commit associated with the PR
-def get_check_runs_for_commit(commit_sha):
+def get_check_runs_for_commit(commit_sha, required_names=None):
     url = f"{GITHUB_API_URL}/repos/{REPO_OWNER}/{REPO_NAME}/commits/{commit_sha}/check-runs"
-    response = requests.get(url, headers=HEADERS)
-
-    if response.status_code == 200:
-        check_runs = response.json().get("check_runs", [])
-        if not check_runs:
-            print("No check runs found for this commit.")
-            return []
+    # Read every page (per_page=100), stopping early once the required checks are found
+    check_runs = list(iter_check_runs(url, HEADERS, required_names, client=client))
+    if not check_runs:
+        print("No check runs found for this commit.")
+        return []
 
-        print("\nAll Check Runs for Commit:")
-        # Display all check runs
-        for check in check_runs:
-            print(f"- {check['name']} ({check['status']}) - Conclusion: {check['conclusion']}")
+    print("\nAll Check Runs for Commit:")
+    # Display all check runs
+    for check in check_runs:
+        print(f"- {check['name']} ({check['status']}) - Conclusion: {check['conclusion']}")
 
-        return check_runs
-    else:
-        print(f"Error fetching check runs: {response.status_code}, {response.text}")
-        return []
+    return check_runs
 
 # Function to merge the pull request
 def merge_pull_request(pr_number):
@@ -69,7 +75,7 @@ def merge_pull_request(pr_number):
         "merge_method": "merge"  # Options: merge, squash, rebase
     }
 
-    response = requests.put(url, headers=HEADERS, json=payload)
+    response = client.put(url, headers=HEADERS, json=payload)
 
     if response.status_code == 200:
         print(f"PR #{pr_number} has been successfully merged!")
@@ -88,38 +94,25 @@ if __name__ == "__main__":
 
     # If PR was created successfully, get its check run status
     if pr_number and commit_sha:
-        check_runs = get_check_runs_for_commit(commit_sha)
+        policy = POLICY.for_branch("main")
+        check_runs = get_check_runs_for_commit(commit_sha, policy.fetch_names)
 
         if check_runs:
-            # Condition to check if both 'Run npm on Ubuntu' and 'build' are successful
-            npm_status = None
-            build_status = None
-
-            for check in check_runs:
-                check_name = check['name']
-                conclusion = check['conclusion']
-
-                # Check if the specific checks are successful
-                if check_name == "Run npm on Ubuntu":
-                    npm_status = conclusion
-                elif check_name == "build":
-                    build_status = conclusion
+            # Evaluate the merge policy (by default: 'Run npm on Ubuntu' and 'build' must succeed)
+            decision = policy.evaluate(LatestCheckIndex(check_runs).latest())
 
             # Print the current status of required checks
-            if npm_status:
-                print(f"\nStatus of 'Run npm on Ubuntu': {npm_status}")
-            if build_status:
-                print(f"Status of 'build': {build_status}")
+            print()
+            for name, conclusion in decision.statuses.items():
+                if conclusion:
+                    print(f"Status of '{name}': {conclusion}")
 
-            # Only merge if both checks are successful
-            if npm_status == "success" and build_status == "success":
+            # Only merge if the policy allows it
+            if decision.state == MERGE:
                 merge_pull_request(pr_number)
             else:
                 print("\nRequired checks have not passed. PR will not be merged.")
-                if npm_status != "success":
-                    print(" - 'Run npm on Ubuntu' check failed.")
-                if build_status != "success":
-                    print(" - 'build' check failed.")
+                print(f" - {decision.reason}")
 
 #output
 
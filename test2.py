@@ -1,12 +1,25 @@
 import os
-import requests
 import json
+import time
 
-# GitHub API base URL
-GITHUB_API_URL = "https://api.github.com"
+from check_index import LatestCheckIndex
+from check_runs import iter_check_runs
+from ci_snapshot import fetch_ci_snapshot
+from eta import ETA_SCHEDULING, DurationHistory
+import metrics
+from github_client import get_client
+from policy import MERGE, load_policy
+from polling import PollScheduler, wait_for_decision
+from preflight import BEHIND, MISSING, NOTHING_TO_MERGE, Preflight, get_branch_head
+from state_store import StateStore
+
+# GitHub API base URL (GITHUB_API_URL can point at GitHub Enterprise or fake_github.py)
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
 
 # Your GitHub credentials
 GITHUB_TOKEN = "your_personal_access_token"
+
+# Default repository; the functions below take owner=/repo= to work on any other
 REPO_OWNER = "krkredde"
 REPO_NAME = "gauto"
 
@@ -16,13 +29,17 @@ HEADERS = {
     "Accept": "application/vnd.github.v3+json",
 }
 
+# Shared pooled HTTP client (keep-alive connections reused across calls)
+client = get_client()
+
 # Function to create a pull request
-def create_pull_request(title, body, head_branch, base_branch):
-    url = f"{GITHUB_API_URL}/repos/{REPO_OWNER}/{REPO_NAME}/pulls"
+@metrics.traced("create_pull_request", success=lambda result: result[0] is not None)
+def create_pull_request(title, body, head_branch, base_branch, owner=REPO_OWNER, repo=REPO_NAME):
+    url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/pulls"
     
     # For a forked repository, ensure head is in the correct format
-    if REPO_OWNER != 'your-username':
-        head_branch = f"{REPO_OWNER}:{head_branch}"
+    if owner != 'your-username':
+        head_branch = f"{owner}:{head_branch}"
 
     payload = {
         "title": title,
@@ -31,51 +48,267 @@ def create_pull_request(title, body, head_branch, base_branch):
         "base": base_branch
     }
 
-    response = requests.post(url, headers=HEADERS, json=payload)
+    response = client.post(url, headers=HEADERS, json=payload)
 
     if response.status_code == 201:
         pr_data = response.json()
         print(f"PR Created: {pr_data['html_url']}")
         return pr_data['number'], pr_data['head']['sha']  # Return PR number and commit SHA
+    elif response.status_code == 422 and "already exists" in response.text:
+        # A retried job (or a concurrent one) opened it first: adopt that PR
+        pr_number, commit_sha = find_open_pull_request(payload["head"].split(":")[-1], base_branch, owner, repo)
+        if pr_number:
+            print(f"Adopting existing PR #{pr_number} (commit {commit_sha})")
+            return pr_number, commit_sha
+        print(f"Error creating PR: {response.status_code}, {response.text}")
+        return None, None
     else:
         print(f"Error creating PR: {response.status_code}, {response.text}")
         return None, None
 
+# Function to find the open PR for a head/base pair; returns (PR number, head SHA) or (None, None)
+def find_open_pull_request(head_branch, base_branch, owner=REPO_OWNER, repo=REPO_NAME):
+    url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/pulls"
+    params = {"state": "open", "head": f"{owner}:{head_branch}", "base": base_branch}
+    response = client.get(url, headers=HEADERS, params=params)
+    if response.status_code != 200:
+        print(f"Error looking up PRs: {response.status_code}, {response.text}")
+        return None, None
+    for pr in response.json():
+        return pr["number"], pr["head"]["sha"]
+    return None, None
+
+# Function to read one pull request (None if it cannot be read)
+def get_pull_request(pr_number, owner=REPO_OWNER, repo=REPO_NAME):
+    response = client.get(f"{GITHUB_API_URL}/repos/{owner}/{repo}/pulls/{pr_number}", headers=HEADERS)
+    if response.status_code != 200:
+        print(f"Error reading PR #{pr_number}: {response.status_code}, {response.text}")
+        return None
+    return response.json()
+
 # Function to get check runs for the commit associated with the PR
-def get_check_runs_for_commit(commit_sha):
-    url = f"{GITHUB_API_URL}/repos/{REPO_OWNER}/{REPO_NAME}/commits/{commit_sha}/check-runs"
-    response = requests.get(url, headers=HEADERS)
+@metrics.traced("poll_checks")
+def get_check_runs_for_commit(commit_sha, required_names=None, owner=REPO_OWNER, repo=REPO_NAME):
+    url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/commits/{commit_sha}/check-runs"
+    # Read every page (per_page=100), stopping early once the required checks are found
+    check_runs = list(iter_check_runs(url, HEADERS, required_names, client=client))
+    if not check_runs:
+        print("No check runs found for this commit.")
+        return []
 
-    if response.status_code == 200:
-        check_runs = response.json().get("check_runs", [])
-        if not check_runs:
-            print("No check runs found for this commit.")
-            return []
+    print("\nAll Check Runs for Commit:")
+    # Display all check runs
+    for check in check_runs:
+        print(f"- {check['name']} ({check['status']}) - Conclusion: {check['conclusion']}")
 
-        print("\nAll Check Runs for Commit:")
-        # Display all check runs
-        for check in check_runs:
-            print(f"- {check['name']} ({check['status']}) - Conclusion: {check['conclusion']}")
+    return check_runs
 
-        return check_runs
-    else:
-        print(f"Error fetching check runs: {response.status_code}, {response.text}")
-        return []
+# Function to get every CI signal for a commit: check runs, check suites and
+# legacy commit statuses, fetched in parallel (see ci_snapshot.py)
+@metrics.traced("poll_checks")
+def get_ci_snapshot(commit_sha, required_names=None, owner=REPO_OWNER, repo=REPO_NAME):
+    url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/commits/{commit_sha}"
+    snapshot = fetch_ci_snapshot(url, HEADERS, required_names, client)
+    if not snapshot.checks:
+        print("No check runs or statuses found for this commit.")
+        return snapshot
+
+    print("\nAll Checks for Commit:")
+    for check in snapshot.checks:
+        print(f"- {check['name']} ({check['status']}) - Conclusion: {check['conclusion']}")
+
+    return snapshot
 
 # Function to merge the pull request
-def merge_pull_request(pr_number):
-    url = f"{GITHUB_API_URL}/repos/{REPO_OWNER}/{REPO_NAME}/pulls/{pr_number}/merge"
+@metrics.traced("merge_pull_request", success=bool)
+def merge_pull_request(pr_number, owner=REPO_OWNER, repo=REPO_NAME, sha=None):
+    url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/pulls/{pr_number}/merge"
     payload = {
         "commit_title": "Merging PR automatically after successful checks",
         "merge_method": "merge"  # Options: merge, squash, rebase
     }
+    if sha:
+        # GitHub refuses the merge (409) if the PR head is no longer this commit
+        payload["sha"] = sha
 
-    response = requests.put(url, headers=HEADERS, json=payload)
+    response = client.put(url, headers=HEADERS, json=payload)
 
     if response.status_code == 200:
         print(f"PR #{pr_number} has been successfully merged!")
+        return True
+    elif response.status_code == 409 and sha:
+        print(f"PR #{pr_number} not merged: its head moved since commit {sha} was checked")
+        return False
     else:
         print(f"Error merging PR: {response.status_code}, {response.text}")
+        return False
+
+# Checks that must succeed before the PR is merged
+REQUIRED_CHECKS = [
+    "Tenant-config-action",
+    "MD-validator-Action",
+    "File-Access-Action",
+    "MD-Linter-Action",
+]
+
+# Merge policy: GAUTO_POLICY can name a JSON policy file (see policy.py);
+# without one, every check in REQUIRED_CHECKS must succeed
+POLICY = load_policy(os.getenv('GAUTO_POLICY'), REQUIRED_CHECKS)
+
+# How long (seconds) to wait for the required checks before giving up
+CHECKS_DEADLINE = int(os.getenv('checksTimeout', '1800'))
+
+# Function to check a PR remembered in the state store against GitHub. Returns
+# (number, current head SHA) if it is still open, (number, None) if it has been
+# merged, or None when it was closed (or cannot be read) and a new PR is needed.
+def _resume_recorded_pull_request(pr, store, owner, repo):
+    current = get_pull_request(pr["number"], owner, repo)
+    if current is None:
+        print(f"Resuming PR #{pr['number']} (commit {pr['head_sha']})")
+        return pr["number"], pr["head_sha"]
+    if current["state"] != "open" and not current.get("merged"):
+        store.update_pull_request(owner, repo, pr["number"], state="closed")
+        return None
+    if current.get("merged"):
+        print(f"PR #{pr['number']} has already been merged.")
+        store.update_pull_request(owner, repo, pr["number"], state="merged", head_sha=current["head"]["sha"])
+        return pr["number"], None
+    commit_sha = current["head"]["sha"]
+    if commit_sha != pr["head_sha"]:
+        store.update_pull_request(owner, repo, pr["number"], head_sha=commit_sha)
+    print(f"Resuming PR #{pr['number']} (commit {commit_sha})")
+    return pr["number"], commit_sha
+
+# Function to resume the PR for this head/base pair or create a new one (and
+# record it). Safe to retry: a PR remembered in the state store is re-read,
+# and an open PR on GitHub is adopted instead of failing with 422. For a PR
+# that was already merged the commit SHA is None, so there is nothing left to do,
+# unless new commits were pushed to the head branch since: then the merged PR is
+# marked "superseded" and a new one is opened (as the daemon does).
+def resume_or_create_pull_request(head_branch, base_branch, store=None, owner=REPO_OWNER, repo=REPO_NAME):
+    if store:
+        pr = store.find_pull_request(owner, repo, head_branch, base_branch)
+        if pr and pr["state"] == "merged":
+            branch_sha = get_branch_head(f"{GITHUB_API_URL}/repos/{owner}/{repo}", head_branch, HEADERS, client)
+            if branch_sha is None or branch_sha == pr["head_sha"]:
+                print(f"PR #{pr['number']} for '{head_branch}' -> '{base_branch}' has already been merged.")
+                return pr["number"], None
+            print(f"'{head_branch}' has new commits since PR #{pr['number']} was merged; opening a new PR")
+            store.update_pull_request(owner, repo, pr["number"], state="superseded")
+        if pr and pr["state"] == "open":
+            resumed = _resume_recorded_pull_request(pr, store, owner, repo)
+            if resumed:
+                return resumed
+
+    pr_number, commit_sha = find_open_pull_request(head_branch, base_branch, owner, repo)
+    if pr_number:
+        print(f"Adopting existing PR #{pr_number} (commit {commit_sha})")
+        if store:
+            store.record_pull_request(owner, repo, pr_number, head_branch, base_branch, commit_sha)
+        return pr_number, commit_sha
+
+    pr_number, commit_sha = create_pull_request(
+        title="Automated Merge PR",
+        body=f"This is an automated pull request to merge '{head_branch}' into '{base_branch}'.",
+        head_branch=head_branch,
+        base_branch=base_branch,
+        owner=owner,
+        repo=repo,
+    )
+    if store and pr_number:
+        store.record_pull_request(owner, repo, pr_number, head_branch, base_branch, commit_sha)
+    return pr_number, commit_sha
+
+# Function to run the compare-API pre-flight (see preflight.py) over
+# (owner, repo, head branch, base branch) targets before any PR is created.
+# Returns (targets worth a PR, one pre-flight result per input target).
+def preflight_targets(targets, store=None):
+    targets = list(targets)
+    results = Preflight(GITHUB_API_URL, HEADERS, store, client).check(targets)
+    kept = []
+    for target, result in zip(targets, results):
+        label = f"'{result['branch']}' -> '{result['base']}'"
+        if result["status"] == NOTHING_TO_MERGE:
+            print(f"Skipping {label}: nothing to merge (already in '{result['base']}')")
+        elif result["status"] == MISSING:
+            print(f"Skipping {label}: branch not found")
+        else:
+            if result["status"] == BEHIND:
+                print(f"Note: {label} is {result['behind_by']} commit(s) behind '{result['base']}'")
+            kept.append(target)
+    return kept, results
+
+# Function to return the gate decision from the check runs recorded for a commit
+# when they already allow the merge (so there is nothing left to download), else None
+def recorded_decision(commit_sha, base_branch, store, owner=REPO_OWNER, repo=REPO_NAME):
+    decision = POLICY.evaluate(store.get_check_runs(owner, repo, commit_sha), base_branch)
+    if decision.state == MERGE:
+        print(f"Using recorded check results for commit {commit_sha}")
+        return decision
+    return None
+
+# Function to give a scheduler the expected duration of each check and the ETA
+# of a commit from the recorded check durations (see eta.py)
+def apply_check_history(scheduler, history, commit_sha, base_branch, store, owner=REPO_OWNER, repo=REPO_NAME):
+    policy = POLICY.for_branch(base_branch)
+    if scheduler.expected_duration is None:
+        scheduler.expected_duration = history.expected_durations(owner, repo, base_branch, policy) or None
+    if scheduler.eta is None:
+        scheduler.eta = history.eta(owner, repo, base_branch, policy, store.get_check_runs(owner, repo, commit_sha))
+    return scheduler
+
+# Function to poll the check runs (adaptive backoff, see polling.py) until the
+# merge policy can decide (merge or fail) or the deadline passes
+def wait_for_check_decision(commit_sha, base_branch=None, scheduler=None, store=None, owner=REPO_OWNER, repo=REPO_NAME):
+    recorded = recorded_decision(commit_sha, base_branch, store, owner, repo) if store else None
+    if recorded:
+        return recorded
+
+    policy = POLICY.for_branch(base_branch)
+    scheduler = scheduler or PollScheduler(deadline=CHECKS_DEADLINE)
+    history = DurationHistory(store) if store and ETA_SCHEDULING else None
+    if history:
+        apply_check_history(scheduler, history, commit_sha, base_branch, store, owner, repo)
+    # Newest attempt of each check across polls, so a re-run replaces its stale attempt
+    index = LatestCheckIndex()
+    pending_suites = []  # check suites of the last poll that have not created their runs yet
+
+    def fetch():
+        # Check runs and legacy status contexts both count towards the policy
+        snapshot = get_ci_snapshot(commit_sha, policy.fetch_names, owner, repo)
+        index.update(snapshot.checks)
+        pending_suites[:] = snapshot.unstarted_suites()
+        if store:
+            store.record_check_runs(owner, repo, commit_sha, snapshot.checks)
+        return index.latest()
+
+    def evaluate(check_runs):
+        return policy.evaluate(check_runs, pending_suites)
+
+    with metrics.span("wait_for_checks", repo=f"{owner}/{repo}", sha=commit_sha):
+        decision = wait_for_decision(fetch, evaluate, scheduler)
+    if history:
+        history.record(owner, repo, base_branch, commit_sha, decision.runs.values())
+    return decision
+
+# Function to merge the PR only if the merge policy allows it (and, given
+# `head_sha`, only while the PR head is still the commit that was checked)
+def merge_if_checks_passed(pr_number, decision, store=None, owner=REPO_OWNER, repo=REPO_NAME, head_sha=None):
+    # Print the current status of the required checks
+    print()
+    for name, conclusion in decision.statuses.items():
+        if conclusion:
+            print(f"Status of '{name}': {conclusion}")
+
+    if decision.state == MERGE:
+        merged = merge_pull_request(pr_number, owner, repo, head_sha)
+        if store:
+            store.record_merge(owner, repo, pr_number, merged)
+        return merged
+
+    print("\nRequired checks have not passed. PR will not be merged.")
+    print(f" - {decision.reason}")
+    return False
 
 # Example usage
 if __name__ == "__main__":
@@ -92,63 +325,24 @@ if __name__ == "__main__":
     print(f"Using head branch: {head_branch}")
     print(f"Using base branch: {base_branch}")
 
+    # Local state lets a restarted job pick up the PR it created last time
+    store = StateStore()
+    metrics.setup_from_env()
+    started = time.monotonic()
+
+    # Nothing to do when the branch is already merged (exit 0) or a branch is gone (exit 1): no PR, no 422
+    kept, preflight = preflight_targets([(REPO_OWNER, REPO_NAME, head_branch, base_branch)], store)
+    if not kept:
+        exit(1 if preflight[0]["status"] == MISSING else 0)
+
     # Create a PR with the head and base branches from environment variables
-    pr_number, commit_sha = create_pull_request(
-        title="Automated Merge PR",
-        body=f"This is an automated pull request to merge '{head_branch}' into '{base_branch}'.",
-        head_branch=head_branch,  # Source branch (from env)
-        base_branch=base_branch   # Target branch (from env)
-    )
+    pr_number, commit_sha = resume_or_create_pull_request(head_branch, base_branch, store)
 
-    # If PR was created successfully, get its check run status
+    # If PR was created successfully, wait for the required checks to finish
     if pr_number and commit_sha:
-        check_runs = get_check_runs_for_commit(commit_sha)
-
-        if check_runs:
-            # Initialize variables to track the statuses of the required checks
-            tenant_config_status = None
-            md_validator_status = None
-            file_access_status = None
-            md_linter_status = None
-
-            # Iterate over the check runs to find the specific ones
-            for check in check_runs:
-                check_name = check['name']
-                conclusion = check.get('conclusion', 'Not completed yet')  # Default if conclusion is missing
-
-                # Print the name and conclusion of each check run (for debugging purposes)
-                print(f"Check Name: {check_name}, Conclusion: {conclusion}")
-
-                # Check if the specific checks are successful
-                if check_name == "Tenant-config-action":
-                    tenant_config_status = conclusion
-                elif check_name == "MD-validator-Action":
-                    md_validator_status = conclusion
-                elif check_name == "File-Access-Action":
-                    file_access_status = conclusion
-                elif check_name == "MD-Linter-Action":
-                    md_linter_status = conclusion
-
-            # Print the current status of the required checks
-            if tenant_config_status:
-                print(f"\nStatus of 'Tenant-config-action': {tenant_config_status}")
-            if md_validator_status:
-                print(f"Status of 'MD-validator-Action': {md_validator_status}")
-            if file_access_status:
-                print(f"Status of 'File-Access-Action': {file_access_status}")
-            if md_linter_status:
-                print(f"Status of 'MD-Linter-Action': {md_linter_status}")
-
-            # Only merge if all the required checks are successful
-            if tenant_config_status == "success" and md_validator_status == "success" and file_access_status == "success" and md_linter_status == "success":
-                merge_pull_request(pr_number)
-            else:
-                print("\nRequired checks have not passed. PR will not be merged.")
-                if tenant_config_status != "success":
-                    print(" - 'Tenant-config-action' check failed.")
-                if md_validator_status != "success":
-                    print(" - 'MD-validator-Action' check failed.")
-                if file_access_status != "success":
-                    print(" - 'File-Access-Action' check failed.")
-                if md_linter_status != "success":
-                    print(" - 'MD-Linter-Action' check failed.")
+        decision = wait_for_check_decision(commit_sha, base_branch, store=store)
+        if merge_if_checks_passed(pr_number, decision, store):
+            metrics.observe("gauto_time_to_merge_seconds", time.monotonic() - started)
+
+    # Show how many requests reused an existing keep-alive connection
+    print(f"\nHTTP client stats: {client.stats()}")
@@ -0,0 +1,155 @@
+import calendar
+import os
+import threading
+import time
+
+import requests
+
+from rate_limit import RateLimitGovernor
+
+# Comma-separated personal access tokens to spread requests over
+GITHUB_TOKENS = os.getenv("GITHUB_TOKENS", "")
+
+# GitHub App credentials for installation tokens (all three are needed)
+GITHUB_APP_ID = os.getenv("GITHUB_APP_ID")
+GITHUB_APP_INSTALLATION_IDS = os.getenv("GITHUB_APP_INSTALLATION_IDS", "")
+GITHUB_APP_PRIVATE_KEY = os.getenv("GITHUB_APP_PRIVATE_KEY")
+GITHUB_APP_PRIVATE_KEY_PATH = os.getenv("GITHUB_APP_PRIVATE_KEY_PATH")
+
+# Refresh an installation token this many seconds before it expires (they last an hour)
+REFRESH_MARGIN = 300
+
+
+# Function to shorten a token for logs and metrics
+def mask_token(token):
+    if not token:
+        return "?"
+    return f"{token[:4]}...{token[-4:]}" if len(token) > 12 else "****"
+
+
+# Function to parse GitHub's "2016-07-11T22:14:10Z" timestamps into epoch seconds
+def _parse_expiry(value):
+    return calendar.timegm(time.strptime(value, "%Y-%m-%dT%H:%M:%SZ"))
+
+
+# Source of GitHub App installation tokens: signs a JWT for the app and
+# exchanges it for an installation token. Needs PyJWT with crypto support.
+class InstallationTokenSource:
+    def __init__(self, app_id, installation_id, private_key, api_url="https://api.github.com"):
+        self.app_id = app_id
+        self.installation_id = installation_id
+        self.private_key = private_key
+        self.api_url = api_url
+
+    def _app_jwt(self):
+        try:
+            import jwt
+        except ImportError:
+            raise RuntimeError("GitHub App tokens need PyJWT: pip install 'pyjwt[crypto]'")
+        now = int(time.time())
+        # Backdate iat for clock drift; GitHub allows at most 10 minutes
+        return jwt.encode({"iat": now - 60, "exp": now + 540, "iss": str(self.app_id)}, self.private_key,
+                          algorithm="RS256")
+
+    # Function to get a fresh installation token; returns (token, expires_at)
+    def __call__(self):
+        url = f"{self.api_url}/app/installations/{self.installation_id}/access_tokens"
+        headers = {"Authorization": f"Bearer {self._app_jwt()}", "Accept": "application/vnd.github+json"}
+        response = requests.post(url, headers=headers, timeout=30)
+        if response.status_code != 201:
+            raise RuntimeError(f"Error creating installation token: {response.status_code}, {response.text}")
+        data = response.json()
+        return data["token"], _parse_expiry(data["expires_at"])
+
+
+# One credential of the pool, with its own rate-limit governor (GitHub counts
+# the budget per token). Tokens with a `refresh` source are renewed before expiry.
+class Credential:
+    def __init__(self, token=None, refresh=None, name=None):
+        self.token = token
+        self.expires_at = None
+        self.refresh = refresh
+        self.name = name or mask_token(token)
+        self.governor = RateLimitGovernor()
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _needs_refresh(self):
+        if self.refresh is None:
+            return False
+        return self.token is None or (self.expires_at is not None and self.expires_at - time.time() < REFRESH_MARGIN)
+
+    # Value for the Authorization header, refreshing the token first if it is about to expire
+    def authorization(self):
+        if self._needs_refresh():
+            with self._lock:
+                if self._needs_refresh():
+                    self.token, self.expires_at = self.refresh()
+                    print(f"Refreshed installation token {self.name} (expires in {self.expires_at - time.time():.0f}s)")
+        return f"Bearer {self.token}"
+
+    def stats(self):
+        expires_in = round(self.expires_at - time.time()) if self.expires_at else None
+        return {"name": self.name, "requests": self.requests, "expires_in": expires_in,
+                "budget": self.governor.budget()}
+
+
+# Pool of tokens: each request goes to the credential with the most budget left
+# for its resource (core, graphql, search), so throughput grows with the pool
+class TokenPool:
+    def __init__(self, credentials):
+        self.credentials = list(credentials)
+        if not self.credentials:
+            raise ValueError("A token pool needs at least one credential")
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.credentials)
+
+    # Function to pick the credential with the most headroom (fewest requests sent breaks ties)
+    def choose(self, resource="core", exclude=()):
+        candidates = [c for c in self.credentials if c not in exclude] or self.credentials
+        with self._lock:
+            credential = max(candidates, key=lambda c: (c.governor.headroom(resource), -c.requests))
+            credential.requests += 1
+        return credential
+
+    # Budget per resource summed over every credential
+    def budget(self):
+        total = {}
+        for credential in self.credentials:
+            for resource, bucket in credential.governor.budget().items():
+                entry = total.setdefault(resource, {"limit": 0, "remaining": 0, "reset_in": None})
+                entry["limit"] += bucket["limit"] or 0
+                entry["remaining"] += bucket["remaining"] or 0
+                if bucket["reset_in"] is not None:
+                    entry["reset_in"] = min(entry["reset_in"] or bucket["reset_in"], bucket["reset_in"])
+        return total
+
+    # Same shape as RateLimitGovernor.stats(), plus one entry per credential
+    def stats(self):
+        governors = [c.governor.stats() for c in self.credentials]
+        return {
+            "retries": sum(g["retries"] for g in governors),
+            "waited": round(sum(g["waited"] for g in governors), 1),
+            "budget": self.budget(),
+            "tokens": [c.stats() for c in self.credentials],
+        }
+
+    # Function to build a pool from GITHUB_TOKENS and the GITHUB_APP_* variables; None if neither is set
+    @classmethod
+    def from_env(cls, api_url=None):
+        credentials = [Credential(token.strip()) for token in GITHUB_TOKENS.split(",") if token.strip()]
+
+        installation_ids = [i.strip() for i in GITHUB_APP_INSTALLATION_IDS.split(",") if i.strip()]
+        private_key = GITHUB_APP_PRIVATE_KEY
+        if not private_key and GITHUB_APP_PRIVATE_KEY_PATH:
+            with open(GITHUB_APP_PRIVATE_KEY_PATH) as f:
+                private_key = f.read()
+        if GITHUB_APP_ID and private_key:
+            api_url = api_url or os.getenv("GITHUB_API_URL", "https://api.github.com")
+            for installation_id in installation_ids:
+                source = InstallationTokenSource(GITHUB_APP_ID, installation_id, private_key, api_url)
+                credentials.append(Credential(refresh=source, name=f"installation-{installation_id}"))
+
+        return cls(credentials) if credentials else None
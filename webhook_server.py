@@ -0,0 +1,270 @@
+import argparse
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from check_index import LatestCheckIndex
+from check_records import CheckRun
+from ci_snapshot import normalize_status
+from policy import MERGE
+from test2 import POLICY, get_check_runs_for_commit, merge_pull_request
+
+# Secret configured on the GitHub webhook (used to verify X-Hub-Signature-256)
+WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+
+
+# Function to compute the X-Hub-Signature-256 value for a request body
+def sign_payload(secret, body):
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+# Function to check the X-Hub-Signature-256 header against our secret
+# (without a secret nothing can be verified, so every payload is rejected)
+def verify_signature(secret, body, signature):
+    if not secret or not signature:
+        return False
+    return hmac.compare_digest(sign_payload(secret, body), signature)
+
+
+# Function to check that a host name or address only accepts local connections
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+# In-memory view of the open PRs and the check runs on their head commits, per
+# repository ("owner/repo" from the payload), so one hook can serve many repositories.
+# Webhook events update it; a PR is merged as soon as its required checks pass.
+class PullRequestTracker:
+    def __init__(self, policy=POLICY, merge=merge_pull_request, fetch_check_runs=None):
+        self.policy = policy
+        self.merge = merge  # merge(number, owner, repo)
+        self.fetch_check_runs = fetch_check_runs or (
+            lambda sha, owner, repo: get_check_runs_for_commit(sha, owner=owner, repo=repo))
+        self._lock = threading.Lock()
+        self.prs = {}     # (repository, pr number) -> {"head_sha", "base", "state"}
+        self.checks = {}  # (repository, head sha) -> LatestCheckIndex of its check runs
+
+    def _track_pr(self, repository, number, head_sha, base):
+        pr = self.prs.setdefault((repository, number), {"head_sha": head_sha, "base": base, "state": "open"})
+        if pr["head_sha"] != head_sha:
+            # New commits pushed: the old head's results no longer apply
+            self.checks.pop((repository, pr["head_sha"]), None)
+            pr["head_sha"] = head_sha
+        pr["base"] = base or pr["base"]
+
+    def _record_check(self, repository, check):
+        key = (repository, check["head_sha"])
+        index = self.checks.get(key)
+        if index is None:
+            index = self.checks[key] = LatestCheckIndex()
+        # Only the newest attempt of each check is kept (re-runs get a higher id)
+        index.update([CheckRun.from_api(check)])
+
+    # Dispatch one webhook event; returns a short description of what happened
+    def handle_event(self, event, payload):
+        if event == "ping":
+            return "pong"
+        if event == "pull_request":
+            return self._on_pull_request(payload)
+        if event == "check_run":
+            return self._on_check_run(payload)
+        if event == "check_suite":
+            return self._on_check_suite(payload)
+        if event == "status":
+            return self._on_status(payload)
+        return f"ignored event '{event}'"
+
+    def _on_pull_request(self, payload):
+        repository = payload["repository"]["full_name"]
+        pr = payload["pull_request"]
+        number = pr["number"]
+        with self._lock:
+            if payload.get("action") == "closed":
+                closed = self.prs.pop((repository, number), None)
+                if closed:
+                    self.checks.pop((repository, closed["head_sha"]), None)
+                return f"{repository} PR #{number} closed"
+            self._track_pr(repository, number, pr["head"]["sha"], pr["base"]["ref"])
+            head_sha = pr["head"]["sha"]
+        return self._evaluate_sha(repository, head_sha)
+
+    def _on_check_run(self, payload):
+        repository = payload["repository"]["full_name"]
+        check = payload["check_run"]
+        with self._lock:
+            for pr in check.get("pull_requests", []):
+                self._track_pr(repository, pr["number"], pr["head"]["sha"], pr["base"]["ref"])
+            self._record_check(repository, check)
+        return self._evaluate_sha(repository, check["head_sha"])
+
+    def _on_check_suite(self, payload):
+        repository = payload["repository"]["full_name"]
+        suite = payload["check_suite"]
+        head_sha = suite["head_sha"]
+        with self._lock:
+            for pr in suite.get("pull_requests", []):
+                self._track_pr(repository, pr["number"], pr["head"]["sha"], pr["base"]["ref"])
+            known = any(key[0] == repository and pr["head_sha"] == head_sha for key, pr in self.prs.items())
+
+        # A finished suite does not list its runs, so refresh them once over REST
+        if known and payload.get("action") == "completed":
+            owner, repo = repository.split("/", 1)
+            check_runs = self.fetch_check_runs(head_sha, owner, repo)
+            with self._lock:
+                for check in check_runs:
+                    self._record_check(repository, dict(check, head_sha=head_sha))
+        return self._evaluate_sha(repository, head_sha)
+
+    # Legacy commit status (status API): counts as a check named after its context
+    def _on_status(self, payload):
+        repository = payload["repository"]["full_name"]
+        with self._lock:
+            self._record_check(repository, dict(normalize_status(payload), head_sha=payload["sha"]))
+        return self._evaluate_sha(repository, payload["sha"])
+
+    # Merge every open PR of `repository` on `head_sha` that the merge policy (for its base branch) allows
+    def _evaluate_sha(self, repository, head_sha):
+        to_merge = []
+        reasons = []
+        with self._lock:
+            index = self.checks.get((repository, head_sha))
+            check_runs = index.latest() if index else []
+            for (pr_repository, number), pr in self.prs.items():
+                if pr_repository != repository or pr["head_sha"] != head_sha or pr["state"] != "open":
+                    continue
+                decision = self.policy.evaluate(check_runs, pr["base"])
+                if decision.state == MERGE:
+                    pr["state"] = "merging"
+                    to_merge.append(number)
+                else:
+                    # A failed PR stays open: a re-run of the failed check can still turn it green
+                    reasons.append(f"{repository} PR #{number}: {decision.reason}")
+
+        if not to_merge:
+            return "; ".join(reasons) or "no open PR for this commit"
+
+        owner, repo = repository.split("/", 1)
+        results = []
+        for number in to_merge:
+            merged = self.merge(number, owner, repo)
+            with self._lock:
+                if (repository, number) in self.prs:
+                    self.prs[(repository, number)]["state"] = "merged" if merged else "open"
+            results.append(f"{repository} PR #{number} {'merged' if merged else 'merge failed'}")
+        return ", ".join(results + reasons)
+
+
+# HTTP handler: one POST per webhook delivery
+class WebhookHandler(BaseHTTPRequestHandler):
+    tracker = None
+    secret = WEBHOOK_SECRET
+    insecure = False  # accept unsigned payloads (loopback only, see make_server)
+
+    def _reply(self, code, message):
+        body = json.dumps({"message": message}).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.insecure and not verify_signature(self.secret, body, self.headers.get("X-Hub-Signature-256")):
+            return self._reply(401, "invalid signature")
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return self._reply(400, "invalid JSON payload")
+
+        event = self.headers.get("X-GitHub-Event", "")
+        try:
+            result = self.tracker.handle_event(event, payload)
+        except (KeyError, TypeError) as e:
+            return self._reply(400, f"unexpected '{event}' payload: missing {e}")
+
+        print(f"{event}: {result}")
+        self._reply(200, result)
+
+    def do_GET(self):
+        self._reply(200, "ok")
+
+
+# Function to build a webhook server bound to host:port. A secret is required;
+# `insecure` accepts unsigned payloads instead, and only on a loopback address.
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, tracker=None, secret=WEBHOOK_SECRET, insecure=False):
+    if insecure and not is_loopback(host):
+        raise ValueError(f"--insecure is only allowed on a loopback address, not {host!r}")
+    if not secret and not insecure:
+        raise ValueError("GITHUB_WEBHOOK_SECRET is not set; refusing to accept unsigned webhooks "
+                         "(use --insecure on a loopback address for local testing)")
+    handler = type("BoundWebhookHandler", (WebhookHandler,), {
+        "tracker": tracker or PullRequestTracker(),
+        "secret": secret,
+        "insecure": insecure and not secret,
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+# Function to post a recorded payload to a running server (signed with the same secret)
+def send_payload(url, event, body, secret=WEBHOOK_SECRET):
+    headers = {"Content-Type": "application/json", "X-GitHub-Event": event}
+    if secret:
+        headers["X-Hub-Signature-256"] = sign_payload(secret, body)
+    request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        # e.g. 401 for a bad signature: report the server's answer rather than a traceback
+        return e.code, e.read().decode()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge PRs as soon as check_run/check_suite webhooks report green.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--send", metavar="PAYLOAD_FILE", help="post a recorded payload to a running server and exit")
+    parser.add_argument("--event", default="check_run", help="X-GitHub-Event header to use with --send")
+    parser.add_argument("--insecure", action="store_true",
+                        help="accept unsigned payloads without GITHUB_WEBHOOK_SECRET (loopback addresses only)")
+    args = parser.parse_args(argv)
+
+    if args.send:
+        with open(args.send, "rb") as f:
+            status, text = send_payload(f"http://{args.host}:{args.port}/", args.event, f.read())
+        print(f"{status} {text}")
+        return 0 if status < 300 else 1
+
+    try:
+        server = make_server(args.host, args.port, insecure=args.insecure)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"Listening for GitHub webhooks on http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())